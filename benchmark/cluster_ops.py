@@ -0,0 +1,100 @@
+# Time `create`, `join_cluster`, `del_node` and `rescue_cluster` against
+#   clusters of fake nodes, like
+#
+#     python -m benchmark.cluster_ops --nodes 50,100,500 --output ops.json
+#
+# Fake nodes share the process (and the GIL) with redistrib, so the timings
+#   include the cost of serving the commands; use --latency to simulate the
+#   network and the servers.
+
+import argparse
+import json
+import logging
+import platform
+import resource
+import sys
+import time
+
+from redistrib import command
+
+from .fakecluster import FakeServer
+
+
+def _raise_open_files_limit(node_count):
+    # each fake node takes a listening socket, and a connection to it takes
+    #   two file descriptors in this process
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = node_count * 8 + 256
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        if hard != resource.RLIM_INFINITY:
+            wanted = min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+def _timed(timings, name, func, *args, **kwargs):
+    start = time.time()
+    func(*args, **kwargs)
+    timings[name] = time.time() - start
+    logging.info('%s: %.3fs', name, timings[name])
+
+
+def run_once(node_count, keys, window, latency):
+    _raise_open_files_limit(node_count)
+    timings = {'nodes': node_count}
+    with FakeServer(default_latency=latency) as server:
+        addrs = server.add_nodes(node_count + 2)
+        host, port = addrs[0]
+        newin = addrs[node_count]
+        subst = addrs[node_count + 1]
+
+        _timed(timings, 'create', command.create, addrs[:node_count])
+        server.populate(keys)
+        _timed(timings, 'join_cluster', command.join_cluster, host, port,
+               newin[0], newin[1], window=window)
+        _timed(timings, 'del_node', command.del_node, newin[0], newin[1],
+               window=window)
+        server.fail_node(*addrs[1])
+        _timed(timings, 'rescue_cluster', command.rescue_cluster, host, port,
+               subst[0], subst[1])
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark cluster operations on fake nodes')
+    parser.add_argument('--nodes', default='50,100,200,500',
+                        help='comma separated numbers of nodes to create')
+    parser.add_argument('--keys', type=int, default=10000,
+                        help='keys to set before joining a node')
+    parser.add_argument('--window', type=int, default=1,
+                        help='slots migrating at the same time')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds each fake node waits before replying')
+    parser.add_argument('--output', help='save results as JSON to this file')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARN,
+                        format='%(asctime)s %(message)s')
+
+    results = []
+    for n in [int(n) for n in args.nodes.split(',')]:
+        timings = run_once(n, args.keys, args.window, args.latency)
+        results.append(timings)
+        print('%(nodes)4d nodes: create %(create).3fs'
+              ' join_cluster %(join_cluster).3fs del_node %(del_node).3fs'
+              ' rescue_cluster %(rescue_cluster).3fs' % timings)
+        sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'keys': args.keys,
+                'window': args.window,
+                'latency': args.latency,
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
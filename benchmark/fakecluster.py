@@ -0,0 +1,670 @@
+# An in-process fake of Redis Cluster nodes speaking enough RESP for what
+#   redistrib sends, for benchmarks and tests of large clusters without
+#   redis-server processes. All nodes are served by one asyncio event loop in
+#   a background thread (Python 3 only).
+#
+# Gossip is not simulated: nodes MEETing each other share one `FakeCluster`
+#   whose slot map is seen by all of them at once, while each node keeps its
+#   own set of known nodes (changed by MEET, FORGET and RESET) and its own
+#   migrating / importing marks.
+
+import asyncio
+import binascii
+import fnmatch
+import os
+import threading
+
+import hiredis
+
+from redistrib.keyslot import SLOT_COUNT, key_slot
+
+
+class Status(str):
+    pass
+
+
+class Error(str):
+    pass
+
+
+OK = Status('OK')
+
+# CLUSTER sub commands rejected by nodes of a `FakeServer` given an older
+#   `version`, as the Redis versions before these do
+CLUSTER_SUBCOMMANDS_SINCE = {
+    'addslotsrange': (7, 0),
+}
+
+
+def encode_reply(r):
+    if isinstance(r, Status):
+        return b'+' + r.encode() + b'\r\n'
+    if isinstance(r, Error):
+        return b'-' + r.encode() + b'\r\n'
+    if r is None:
+        return b'$-1\r\n'
+    if isinstance(r, int):
+        return b':%d\r\n' % r
+    if isinstance(r, str):
+        r = r.encode()
+    if isinstance(r, bytes):
+        return b'$%d\r\n%s\r\n' % (len(r), r)
+    return b'*%d\r\n' % len(r) + b''.join(encode_reply(i) for i in r)
+
+
+class FakeCluster(object):
+    def __init__(self, node):
+        self.nodes = {node.node_id: node}
+        self.slots = [None] * SLOT_COUNT
+        self.current_epoch = 0
+        # bumped on each change of `slots`, to cache what is derived from it
+        self.version = 0
+        self._cache_version = -1
+        self._ranges = {}
+
+    def assign(self, slot, node_id):
+        self.slots[slot] = node_id
+        self.version += 1
+
+    def ranges(self):
+        if self._cache_version != self.version:
+            ranges = {}
+            for slot, owner in enumerate(self.slots):
+                if owner is None:
+                    continue
+                r = ranges.setdefault(owner, [])
+                if r and r[-1][1] == slot - 1:
+                    r[-1][1] = slot
+                else:
+                    r.append([slot, slot])
+            self._ranges = ranges
+            self._cache_version = self.version
+        return self._ranges
+
+    def state(self):
+        assigned = SLOT_COUNT
+        ok = True
+        for owner in self.slots:
+            if owner is None:
+                assigned -= 1
+                ok = False
+            elif self.nodes[owner].failed:
+                ok = False
+        return ('ok' if ok else 'fail'), assigned
+
+
+class FakeNode(object):
+    def __init__(self, registry, host, latency, default_latency,
+                 version=None):
+        self.registry = registry
+        self.host = host
+        self.port = None
+        self.latency = latency
+        self.default_latency = default_latency
+        self.version = version
+        self.node_id = self._new_id()
+        self.cluster = FakeCluster(self)
+        self.known = {self.node_id}
+        self.master_id = None
+        self.config_epoch = 0
+        self.migrating = {}
+        self.importing = {}
+        # slot -> {key: value}
+        self.data = {}
+        self.failed = False
+        self.server = None
+        self.writers = set()
+        self.commands_processed = 0
+        self.net_input_bytes = 0
+        self.net_output_bytes = 0
+
+    @staticmethod
+    def _new_id():
+        return binascii.hexlify(os.urandom(20)).decode()
+
+    def addr(self):
+        return '%s:%d' % (self.host, self.port)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, self.host, 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.failed = True
+        self.server.close()
+        for w in list(self.writers):
+            w.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self.writers.add(writer)
+        parser = hiredis.Reader()
+        session = {'asking': False}
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                self.net_input_bytes += len(data)
+                parser.feed(data)
+                replies = []
+                delay = 0
+                while True:
+                    req = parser.gets()
+                    if req is False:
+                        break
+                    name = req[0].decode().lower()
+                    if name in ('cluster', 'info') and len(req) > 1:
+                        name += ' ' + req[1].decode().lower()
+                    delay += self.latency.get(name, self.default_latency)
+                    replies.append(encode_reply(self.execute(req, session)))
+                if delay:
+                    await asyncio.sleep(delay)
+                out = b''.join(replies)
+                self.net_output_bytes += len(out)
+                writer.write(out)
+                await writer.drain()
+        except (ConnectionError, hiredis.ProtocolError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    def execute(self, req, session):
+        self.commands_processed += 1
+        name = req[0].decode().lower()
+        args = req[1:]
+        asking = session['asking']
+        session['asking'] = False
+        if name == 'cluster':
+            if not args:
+                return Error('ERR wrong number of arguments')
+            sub = args[0].decode().lower().replace('-', '_')
+            f = getattr(self, 'cluster_' + sub, None)
+            if f is not None and sub in CLUSTER_SUBCOMMANDS_SINCE:
+                if self.version is not None and (
+                        self.version < CLUSTER_SUBCOMMANDS_SINCE[sub]):
+                    f = None
+            if f is None:
+                if self.version is not None and self.version < (5, 0):
+                    return Error('ERR Wrong CLUSTER subcommand or number of'
+                                 ' arguments')
+                return Error('ERR unknown subcommand \'%s\'' %
+                             args[0].decode())
+            return self._call(f, args[1:])
+        if name == 'asking':
+            session['asking'] = True
+            return OK
+        f = getattr(self, 'cmd_' + name, None)
+        if f is None:
+            return Error('ERR unknown command \'%s\'' % req[0].decode())
+        if name in ('get', 'set', 'del', 'unlink', 'exists', 'mget', 'pttl',
+                    'dump', 'restore') and args:
+            if name in ('del', 'unlink', 'exists', 'mget') and len(
+                    set(key_slot(k) for k in args)) > 1:
+                return Error('CROSSSLOT Keys in request don\'t hash to the'
+                             ' same slot')
+            redirect = self._redirect(args[0], asking)
+            if redirect is not None:
+                return redirect
+        return self._call(f, args)
+
+    @staticmethod
+    def _call(f, args):
+        try:
+            return f(*args)
+        except (TypeError, ValueError, IndexError):
+            return Error('ERR syntax error or wrong number of arguments')
+
+    def _node(self, node_id):
+        node_id = node_id.decode() if isinstance(node_id, bytes) else node_id
+        if node_id in self.known:
+            return self.cluster.nodes.get(node_id)
+        return None
+
+    def _keys_count(self):
+        return sum(len(keys) for keys in self.data.values())
+
+    def _redirect(self, key, asking):
+        slot = key_slot(key)
+        owner = self.cluster.slots[slot]
+        if owner == self.node_id:
+            if slot in self.migrating and key not in self.data.get(slot, {}):
+                target = self.cluster.nodes[self.migrating[slot]]
+                return Error('ASK %d %s' % (slot, target.addr()))
+            return None
+        if slot in self.importing and asking:
+            return None
+        if owner is None:
+            return Error('CLUSTERDOWN Hash slot not served')
+        return Error('MOVED %d %s' % (slot, self.cluster.nodes[owner].addr()))
+
+    # generic commands
+
+    def cmd_ping(self, *args):
+        return Status('PONG')
+
+    def cmd_info(self, section=b'all'):
+        section = section.decode().lower()
+        sections = []
+        if section in ('all', 'default', 'stats'):
+            sections.append('# Stats\r\ntotal_commands_processed:%d\r\n'
+                            'instantaneous_ops_per_sec:0\r\n'
+                            'total_net_input_bytes:%d\r\n'
+                            'total_net_output_bytes:%d\r\n' %
+                            (self.commands_processed, self.net_input_bytes,
+                             self.net_output_bytes))
+        if section in ('all', 'default', 'memory'):
+            used = 1024 * 1024 + sum(
+                len(k) + len(v) for keys in self.data.values()
+                for k, v in keys.items())
+            sections.append('# Memory\r\nused_memory:%d\r\n' % used)
+        if section in ('all', 'default', 'cluster'):
+            sections.append('# Cluster\r\ncluster_enabled:1\r\n')
+        if section in ('all', 'default', 'keyspace'):
+            count = self._keys_count()
+            keyspace = '# Keyspace\r\n'
+            if count:
+                keyspace += 'db0:keys=%d,expires=0,avg_ttl=0\r\n' % count
+            sections.append(keyspace)
+        return '\r\n'.join(sections)
+
+    def cmd_dbsize(self):
+        return self._keys_count()
+
+    def cmd_get(self, key):
+        return self.data.get(key_slot(key), {}).get(key)
+
+    def cmd_scan(self, cursor, *options):
+        # the cursor is the next slot to scan
+        slot = int(cursor)
+        count = 10
+        match = None
+        type_ = None
+        for i in range(0, len(options), 2):
+            name = options[i].lower()
+            if name == b'count':
+                count = int(options[i + 1])
+            elif name == b'match':
+                match = options[i + 1]
+            elif name == b'type':
+                type_ = options[i + 1].lower()
+        keys = []
+        scanned = 0
+        while slot < SLOT_COUNT and scanned < count:
+            for k in self.data.get(slot, {}):
+                scanned += 1
+                if match is not None and not fnmatch.fnmatchcase(k, match):
+                    continue
+                if type_ is not None and type_ != b'string':
+                    continue
+                keys.append(k)
+            slot += 1
+        return ['0' if slot >= SLOT_COUNT else str(slot), keys]
+
+    def cmd_mget(self, *keys):
+        return [self.cmd_get(k) for k in keys]
+
+    def cmd_set(self, key, value):
+        self.data.setdefault(key_slot(key), {})[key] = value
+        return OK
+
+    def cmd_del(self, *keys):
+        count = 0
+        for key in keys:
+            if self.data.get(key_slot(key), {}).pop(key, None) is not None:
+                count += 1
+        return count
+
+    cmd_unlink = cmd_del
+
+    def cmd_exists(self, *keys):
+        return sum(1 for k in keys if k in self.data.get(key_slot(k), {}))
+
+    # values are serialized by DUMP with a prefix, and never expire
+
+    def cmd_dump(self, key):
+        value = self.cmd_get(key)
+        return None if value is None else b'DUMP' + value
+
+    def cmd_pttl(self, key):
+        return -1 if self.cmd_exists(key) else -2
+
+    def cmd_restore(self, key, ttl, payload, *options):
+        if not payload.startswith(b'DUMP'):
+            return Error('ERR DUMP payload version or checksum are wrong')
+        if self.cmd_exists(key) and b'replace' not in [
+                o.lower() for o in options]:
+            return Error('BUSYKEY Target key name already exists.')
+        return self.cmd_set(key, payload[4:])
+
+    def cmd_migrate(self, host, port, key, db, timeout, *options):
+        target = self.registry.get((host.decode(), int(port)))
+        if target is None or target.failed:
+            return Error('IOERR error or timeout connecting to the client')
+        options = list(options)
+        replace = False
+        copy = False
+        keys = [key]
+        while options:
+            o = options.pop(0).lower()
+            if o == b'replace':
+                replace = True
+            elif o == b'copy':
+                copy = True
+            elif o == b'keys':
+                keys = options
+                options = []
+        moved = 0
+        for k in keys:
+            slot = key_slot(k)
+            value = self.data.get(slot, {}).get(k)
+            if value is None:
+                continue
+            target_keys = target.data.setdefault(slot, {})
+            if k in target_keys and not replace:
+                return Error('BUSYKEY Target key name already exists.')
+            target_keys[k] = value
+            if not copy:
+                del self.data[slot][k]
+            moved += 1
+        return OK if moved else Status('NOKEY')
+
+    # CLUSTER sub commands
+
+    def cluster_myid(self):
+        return self.node_id
+
+    def cluster_info(self):
+        state, assigned = self.cluster.state()
+        return ('cluster_enabled:1\r\n'
+                'cluster_state:%s\r\n'
+                'cluster_slots_assigned:%d\r\n'
+                'cluster_slots_ok:%d\r\n'
+                'cluster_known_nodes:%d\r\n'
+                'cluster_size:%d\r\n'
+                'cluster_current_epoch:%d\r\n'
+                'cluster_my_epoch:%d\r\n' %
+                (state, assigned, assigned, len(self.known),
+                 len(self.cluster.ranges()), self.cluster.current_epoch,
+                 self.config_epoch))
+
+    def cluster_nodes(self):
+        ranges = self.cluster.ranges()
+        lines = []
+        for node_id in sorted(self.known):
+            n = self.cluster.nodes[node_id]
+            flags = ['master' if n.master_id is None else 'slave']
+            if n is self:
+                flags.insert(0, 'myself')
+            if n.failed:
+                flags.append('fail')
+            slots = [
+                str(b) if b == e else '%d-%d' % (b, e)
+                for b, e in ranges.get(node_id, [])
+            ]
+            if n is self:
+                slots.extend('[%d->-%s]' % i
+                             for i in sorted(self.migrating.items()))
+                slots.extend('[%d-<-%s]' % i
+                             for i in sorted(self.importing.items()))
+            lines.append('%s %s@%d %s %s 0 0 %d %s%s\n' %
+                         (node_id, n.addr(), n.port + 10000, ','.join(flags),
+                          n.master_id or '-', n.config_epoch,
+                          'disconnected' if n.failed else 'connected',
+                          ''.join(' ' + s for s in slots)))
+        return ''.join(lines)
+
+    def cluster_meet(self, host, port):
+        other = self.registry.get((host.decode(), int(port)))
+        if other is None or other.failed:
+            return Error('ERR Invalid node address specified: %s:%s' %
+                         (host.decode(), port.decode()))
+        if other.cluster is self.cluster:
+            self.known.add(other.node_id)
+            other.known.add(self.node_id)
+            return OK
+        merged = self.cluster
+        absorbed = other.cluster
+        for slot, owner in enumerate(absorbed.slots):
+            if owner is not None and merged.slots[slot] is None:
+                merged.assign(slot, owner)
+        merged.current_epoch = max(merged.current_epoch,
+                                   absorbed.current_epoch)
+        merged.nodes.update(absorbed.nodes)
+        ids = set(merged.nodes)
+        for n in merged.nodes.values():
+            n.cluster = merged
+            n.known = set(ids)
+        return OK
+
+    def _add_slots(self, slots):
+        for slot in slots:
+            if not 0 <= slot < SLOT_COUNT:
+                return Error('ERR Invalid or out of range slot')
+            owner = self.cluster.slots[slot]
+            # a slot of a failed node is taken as if this node had not heard
+            #   of the owner yet, which is what a rescue relies on
+            if owner is not None and not self.cluster.nodes[owner].failed:
+                return Error('ERR Slot %d is already busy' % slot)
+        for slot in slots:
+            self.cluster.assign(slot, self.node_id)
+        return OK
+
+    def cluster_addslots(self, *slots):
+        return self._add_slots([int(s) for s in slots])
+
+    def cluster_addslotsrange(self, *bounds):
+        if len(bounds) % 2 != 0:
+            return Error('ERR wrong number of arguments')
+        slots = []
+        for i in range(0, len(bounds), 2):
+            slots.extend(range(int(bounds[i]), int(bounds[i + 1]) + 1))
+        return self._add_slots(slots)
+
+    def cluster_setslot(self, slot, action, node_id=None):
+        slot = int(slot)
+        action = action.decode().lower()
+        owner = self.cluster.slots[slot]
+        if action == 'stable':
+            self.migrating.pop(slot, None)
+            self.importing.pop(slot, None)
+            return OK
+        if node_id is None:
+            return Error('ERR Invalid CLUSTER SETSLOT action or number of'
+                         ' arguments')
+        node = self._node(node_id)
+        if node is None:
+            return Error('ERR I don\'t know about node %s' % node_id.decode())
+        if action == 'migrating':
+            if owner != self.node_id:
+                return Error('ERR I\'m not the owner of hash slot %d' % slot)
+            self.migrating[slot] = node.node_id
+        elif action == 'importing':
+            if owner == self.node_id:
+                return Error('ERR I\'m already the owner of hash slot %d' %
+                             slot)
+            self.importing[slot] = node.node_id
+        elif action == 'node':
+            if (owner == self.node_id and node is not self
+                    and self.data.get(slot)):
+                return Error('ERR Can\'t assign hashslot %d to a different'
+                             ' node while I still hold keys for this hash'
+                             ' slot.' % slot)
+            self.migrating.pop(slot, None)
+            if self.importing.pop(slot, None) is not None and node is self:
+                self.cluster.current_epoch += 1
+                self.config_epoch = self.cluster.current_epoch
+            if owner != node.node_id:
+                self.cluster.assign(slot, node.node_id)
+        else:
+            return Error('ERR Invalid CLUSTER SETSLOT action or number of'
+                         ' arguments')
+        return OK
+
+    def cluster_getkeysinslot(self, slot, count):
+        return list(self.data.get(int(slot), {}))[:int(count)]
+
+    def cluster_countkeysinslot(self, slot):
+        return len(self.data.get(int(slot), {}))
+
+    def cluster_keyslot(self, key):
+        return key_slot(key)
+
+    def cluster_replicate(self, node_id):
+        master = self._node(node_id)
+        if master is None:
+            return Error('ERR Unknown node %s' % node_id.decode())
+        if master is self:
+            return Error('ERR Can\'t replicate myself')
+        if master.master_id is not None:
+            return Error('ERR I can only replicate a master, not a replica.')
+        if self.node_id in self.cluster.ranges() or self._keys_count():
+            return Error('ERR To set a master the node must be empty and'
+                         ' without assigned slots.')
+        self.master_id = master.node_id
+        return OK
+
+    def cluster_slaves(self, node_id):
+        master = self._node(node_id)
+        if master is None:
+            return Error('ERR Unknown node %s' % node_id.decode())
+        return [
+            line for line in self.cluster_nodes().splitlines()
+            if line.split(' ')[3] == master.node_id
+        ]
+
+    cluster_replicas = cluster_slaves
+
+    def cluster_count_failure_reports(self, node_id):
+        if self._node(node_id) is None:
+            return Error('ERR Unknown node %s' % node_id.decode())
+        return 0
+
+    def cluster_forget(self, node_id):
+        node = self._node(node_id)
+        if node is None:
+            return Error('ERR Unknown node %s' % node_id.decode())
+        if node is self:
+            return Error('ERR I tried hard but I can\'t forget myself...')
+        if self.master_id == node.node_id:
+            return Error('ERR Can\'t forget my master!')
+        self.known.discard(node.node_id)
+        return OK
+
+    def cluster_reset(self, mode=b'soft'):
+        if self.master_id is None and self._keys_count():
+            return Error('ERR CLUSTER RESET can\'t be called with master'
+                         ' nodes containing keys')
+        old = self.cluster
+        for slot in old.ranges().get(self.node_id, []):
+            for s in range(slot[0], slot[1] + 1):
+                old.assign(s, None)
+        del old.nodes[self.node_id]
+        for n in old.nodes.values():
+            n.known.discard(self.node_id)
+        if mode.lower() == b'hard':
+            self.node_id = self._new_id()
+            self.config_epoch = 0
+        self.cluster = FakeCluster(self)
+        self.known = {self.node_id}
+        self.master_id = None
+        self.migrating = {}
+        self.importing = {}
+        return OK
+
+
+class FakeServer(object):
+    # Serve fake nodes at `host` on random ports. `latency` maps lowercase
+    #   command names (with the sub command for CLUSTER and INFO, like
+    #   "cluster setslot") to seconds to wait before replying; other commands
+    #   wait `default_latency` seconds. A pipeline read at once waits the sum.
+    # If `version` is given like (4, 0), nodes reject the CLUSTER sub
+    #   commands of `CLUSTER_SUBCOMMANDS_SINCE` newer than it with the error
+    #   message of that Redis version; otherwise all of them are served.
+    def __init__(self, host='127.0.0.1', latency=None, default_latency=0,
+                 version=None):
+        self.host = host
+        self.latency = dict(latency or {})
+        self.default_latency = default_latency
+        self.version = version
+        self.nodes = {}
+        self.loop = None
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def call(self, func, *args):
+        # run `func` in the loop thread, to read or change the fake nodes
+        async def f():
+            return func(*args)
+
+        return self._run(f())
+
+    def add_nodes(self, count):
+        async def start():
+            nodes = [
+                FakeNode(self.nodes, self.host, self.latency,
+                         self.default_latency, self.version)
+                for _ in range(count)
+            ]
+            await asyncio.gather(*[n.start() for n in nodes])
+            for n in nodes:
+                self.nodes[(n.host, n.port)] = n
+            return [(n.host, n.port) for n in nodes]
+
+        return self._run(start())
+
+    def node(self, host, port):
+        return self.nodes[(host, port)]
+
+    def fail_node(self, host, port):
+        self._run(self.nodes[(host, port)].stop())
+
+    def populate(self, keys_count, value=b'v'):
+        # set keys to the owners of their slots directly
+        def populate():
+            owners = {}
+            for n in self.nodes.values():
+                if n.failed:
+                    continue
+                for b, e in n.cluster.ranges().get(n.node_id, []):
+                    for slot in range(b, e + 1):
+                        owners[slot] = n
+            for i in range(keys_count):
+                key = b'key:%d' % i
+                slot = key_slot(key)
+                if slot in owners:
+                    owners[slot].data.setdefault(slot, {})[key] = value
+
+        self.call(populate)
+
+    def close(self):
+        if self.loop is None:
+            return
+
+        async def stop():
+            for n in self.nodes.values():
+                if not n.failed:
+                    await n.stop()
+
+        self._run(stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+
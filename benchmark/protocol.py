@@ -0,0 +1,223 @@
+# Micro-benchmarks of the protocol layer and the CLUSTER NODES parser, like
+#
+#     python -m benchmark.protocol --output protocol.json
+#     python -m benchmark.protocol --compare protocol.json --threshold 0.2
+#
+# The comparison exits with status 1 if any benchmark is slower than in the
+#   baseline file by more than the threshold (a ratio of the baseline time).
+
+from __future__ import print_function
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import hiredis
+from six.moves import range
+
+from redistrib import command
+from redistrib.connection import (CMD_CLUSTER_NODES, EMPTY, ENCODING,
+                                  RECV_BUFFER_SIZE, Connection,
+                                  squash_commands)
+
+SLOT_COUNT = 16384
+
+
+class _ReplaySocket(object):
+    # replays `data` to `recv` and `recv_into` in chunks, and drops whatever
+    #   is sent
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def send(self, data):
+        return len(data)
+
+    sendall = send
+
+    def recv(self, size):
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += len(chunk)
+        return chunk
+
+    def recv_into(self, buf):
+        n = min(len(buf), len(self.data) - self.offset)
+        buf[:n] = self.data[self.offset:self.offset + n]
+        self.offset += n
+        return n
+
+
+def _replay_conn(data, decode_replies=True):
+    conn = Connection.__new__(Connection)
+    conn.host = '127.0.0.1'
+    conn.port = 7000
+    conn.sock = _ReplaySocket(data)
+    conn.reader = (hiredis.Reader(encoding=ENCODING)
+                   if decode_replies else hiredis.Reader())
+    conn.buf = bytearray(RECV_BUFFER_SIZE)
+    return conn
+
+
+def _bulk(value):
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+def _node_id(i):
+    return ('%040x' % (i * 2654435761))[-40:]
+
+
+def cluster_nodes_text(node_count):
+    # masters and slaves in turn, slots evenly assigned to the masters
+    masters = (node_count + 1) // 2
+    slots_each = SLOT_COUNT // masters
+    lines = []
+    for i in range(node_count):
+        flags = 'myself,master' if i == 0 else 'master'
+        master_id = '-'
+        slots = ''
+        if i % 2 == 0:
+            index = i // 2
+            begin = index * slots_each
+            end = (SLOT_COUNT if index == masters - 1 else begin +
+                   slots_each) - 1
+            slots = ' %d-%d' % (begin, end)
+        else:
+            flags = 'slave'
+            master_id = _node_id(i - 1)
+        lines.append('%s 10.0.%d.%d:6379@16379 %s %s 0 1500000000000 %d'
+                     ' connected%s' % (_node_id(i), i // 256, i % 256, flags,
+                                       master_id, i // 2 + 1, slots))
+    return '\n'.join(lines) + '\n'
+
+
+def _benchmarks():
+    node_id = _node_id(1)
+    migrate_batch = [['migrate', '10.0.0.1', 6379, 'key:%d' % i, 0, 30000]
+                     for i in range(100)]
+    setslot_batch = [('cluster', 'setslot', slot, 'node', node_id)
+                     for slot in range(1000)]
+    addslots = [['cluster', 'addslots'] + list(range(1024))]
+
+    keys_reply = b'*1000\r\n' + EMPTY.join(
+        _bulk(b'key:%d' % i) for i in range(1000))
+    ok_replies = b'+OK\r\n' * 1000
+    nodes_reply = _bulk(cluster_nodes_text(1000).encode())
+
+    def recv_keys(decode_replies=True):
+        _replay_conn(keys_reply, decode_replies).execute(
+            'cluster', 'getkeysinslot', 0, 1000)
+
+    def recv_ok_replies(decode_replies=True):
+        _replay_conn(ok_replies, decode_replies).execute_bulk(setslot_batch)
+
+    def stream_ok_replies():
+        for _ in _replay_conn(ok_replies * 10).execute_stream(
+                ('cluster', 'setslot', slot, 'node', node_id)
+                for slot in range(10000)):
+            pass
+
+    def recv_cluster_nodes(decode_replies=True):
+        _replay_conn(nodes_reply, decode_replies).send_raw(CMD_CLUSTER_NODES)
+
+    result = [
+        ('encode_migrate_batch_100', lambda: squash_commands(migrate_batch)),
+        ('encode_setslot_batch_1000', lambda: squash_commands(setslot_batch)),
+        ('encode_addslots_1024', lambda: squash_commands(addslots)),
+        ('recv_getkeysinslot_1000', recv_keys),
+        ('recv_multi_ok_1000', recv_ok_replies),
+        ('recv_cluster_nodes_1000', recv_cluster_nodes),
+        ('stream_setslot_10000', stream_ok_replies),
+        ('recv_getkeysinslot_1000_bytes', lambda: recv_keys(False)),
+        ('recv_multi_ok_1000_bytes', lambda: recv_ok_replies(False)),
+        ('recv_cluster_nodes_1000_bytes', lambda: recv_cluster_nodes(False)),
+    ]
+    for n in (10, 100, 1000):
+        text = cluster_nodes_text(n)
+        result.append(('parse_cluster_nodes_%d' % n,
+                       lambda text=text: command._parse_nodes(
+                           text, '127.0.0.1')))
+    return result
+
+
+def measure(func, min_time=0.2, repeat=5):
+    # seconds per call, the best of `repeat` runs of at least `min_time` each
+    loops = 1
+    while True:
+        start = time.time()
+        for _ in range(loops):
+            func()
+        elapsed = time.time() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2 if elapsed == 0 else max(
+            2, int(min_time / elapsed * 1.2))
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        start = time.time()
+        for _ in range(loops):
+            func()
+        best = min(best, (time.time() - start) / loops)
+    return best
+
+
+def compare(results, baseline, threshold):
+    # return lines of the comparison, and whether any benchmark regressed
+    lines = []
+    regressed = False
+    for name, seconds in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            lines.append('%-32s %12.2fus (new)' % (name, seconds * 1e6))
+            continue
+        ratio = seconds / base
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = ' REGRESSION'
+            regressed = True
+        lines.append('%-32s %12.2fus %12.2fus %+7.1f%%%s' %
+                     (name, base * 1e6, seconds * 1e6, (ratio - 1) * 100,
+                      mark))
+    return lines, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Micro-benchmarks of the protocol layer')
+    parser.add_argument('--output', help='save results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON file to compare to')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown ratio reported as a regression')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='min seconds of each measurement')
+    parser.add_argument('--filter', default='',
+                        help='run only benchmarks whose names contain this')
+    args = parser.parse_args()
+
+    results = {}
+    for name, func in _benchmarks():
+        if args.filter in name:
+            results[name] = measure(func, args.min_time)
+            if not args.compare:
+                print('%-32s %12.2fus' % (name, results[name] * 1e6))
+                sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        lines, regressed = compare(results, baseline, args.threshold)
+        print('\n'.join(lines))
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+# Time the startup of CLI subcommands, and the imports they cost, like
+#
+#     python -m benchmark.startup --budget 80 --output startup.json
+#
+# Each subcommand runs in a new interpreter against an address nobody
+#   listens on, so it fails right after its imports and its argument parsing.
+#   The import time is summed from `python -X importtime` over the modules the
+#   bare interpreter does not import; the run exits with status 1 if it is
+#   over --budget milliseconds for any subcommand.
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+DEAD_ADDR = '127.0.0.1:1'
+SUBCOMMANDS = {
+    'list': ['list', '--addr', DEAD_ADDR],
+    'execute': ['execute', '--addr', DEAD_ADDR, 'ping'],
+}
+RUN_CLI = 'from redistrib.console import main; main()'
+
+
+def _env():
+    env = dict(os.environ)
+    # compiling the modules would be counted as importing them
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def _run(args, env):
+    start = time.time()
+    p = subprocess.Popen([sys.executable, '-X', 'importtime'] + args,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         env=env)
+    _, err = p.communicate()
+    return time.time() - start, err.decode('utf-8', 'replace')
+
+
+def parse_importtime(output):
+    # [(module, self microseconds, cumulative microseconds, whether it is
+    #   imported at the top level)]
+    result = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        self_us = int(parts[0].split(':')[1])
+        name = parts[2][1:]
+        result.append((name.strip(), self_us, int(parts[1]),
+                       not name.startswith(' ')))
+    return result
+
+
+def measure(args, baseline_modules, env, repeat):
+    # best wall time in seconds, import time of the best run in microseconds,
+    #   and [(module, self microseconds)] of that run
+    best = None
+    for _ in range(repeat):
+        elapsed, output = _run(args, env)
+        imports = parse_importtime(output)
+        total = sum(c for m, _, c, top in imports
+                    if top and m not in baseline_modules)
+        if best is None or total < best[1]:
+            best = (elapsed, total, [(m, t) for m, t, _, _ in imports
+                                     if m not in baseline_modules])
+        else:
+            best = (min(elapsed, best[0]), best[1], best[2])
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark startup time of CLI subcommands')
+    parser.add_argument('--budget', type=float, default=80,
+                        help='max milliseconds of imports of a subcommand')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs of each subcommand, the best is taken')
+    parser.add_argument('--top', type=int, default=5,
+                        help='print this number of modules taking the most'
+                        ' time to import, not counting their imports')
+    parser.add_argument('--output', help='save results as JSON to this file')
+    args = parser.parse_args()
+
+    env = _env()
+    # write bytecode of the modules first
+    _run(['-c', RUN_CLI] + SUBCOMMANDS['list'], env)
+    baseline_modules = set(i[0] for i in parse_importtime(
+        _run(['-c', 'pass'], env)[1]))
+
+    results = {}
+    over_budget = False
+    for name, argv in sorted(SUBCOMMANDS.items()):
+        elapsed, import_us, imports = measure(
+            ['-c', RUN_CLI] + argv, baseline_modules, env, args.repeat)
+        results[name] = {'wall': elapsed, 'imports': import_us / 1e6}
+        mark = ''
+        if import_us / 1000.0 > args.budget:
+            mark = ' OVER BUDGET'
+            over_budget = True
+        print('%-8s wall %8.2fms imports %8.2fms%s' %
+              (name, elapsed * 1000, import_us / 1000.0, mark))
+        for module, us in sorted(imports, key=lambda i: -i[1])[:args.top]:
+            print('    %-24s %8.2fms' % (module, us / 1000.0))
+        sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'budget': args.budget,
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
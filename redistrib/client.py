@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+
+import hiredis
+
+from .command import _filter_not_failed_master, _list_nodes
+from .connection import PIPELINE_IN_FLIGHT, Connection
+from .exceptions import RedisIOError
+from .keyslot import SLOT_COUNT, key_slot, key_slots
+from .parallel import DEFAULT_CONCURRENCY, pmap
+
+# times a command is sent again after MOVED, ASK, TRYAGAIN or CLUSTERDOWN
+MAX_REDIRECTS = 5
+
+# seconds to wait before sending again commands failed by TRYAGAIN or
+#   CLUSTERDOWN, which also make the slot map fetched again
+RETRY_INTERVAL = 0.1
+
+
+def _parse_redirect(message):
+    # "MOVED 3999 127.0.0.1:6381" -> (3999, ('127.0.0.1', 6381))
+    _, slot, addr = message.split(' ')
+    host, port = addr.rsplit(':', 1)
+    return int(slot), (host, int(port))
+
+
+def _split_by_slot(keys):
+    # [(slot, [index of key])] of keys in the same slots
+    by_slot = {}
+    for i, slot in enumerate(key_slots(keys)):
+        by_slot.setdefault(slot, []).append(i)
+    return sorted(by_slot.items())
+
+
+# Send data commands to the masters owning their keys, which are the second
+#   arguments by default (commands without keys go to any master). The owner
+#   of each slot is looked up in a list of SLOT_COUNT addresses, fetched from
+#   the cluster of HOST:PORT at first, then patched by each MOVED reply; ASK
+#   replies are followed by ASKING for the command only. Connections to the
+#   masters are kept open until `close`.
+#
+# A client must not be used by several threads at the same time.
+class ClusterClient(object):
+    def __init__(self,
+                 host,
+                 port,
+                 decode_replies=True,
+                 concurrency=DEFAULT_CONCURRENCY,
+                 transport=None):
+        self.host = host
+        self.port = port
+        self.decode_replies = decode_replies
+        self.concurrency = concurrency
+        self.transport = transport
+        # (host, port) of the owner of each slot, or None
+        self.slots = [None] * SLOT_COUNT
+        self.conns = {}
+        self.conns_lock = threading.Lock()
+        # number of redirections followed
+        self.moved = 0
+        self.ask = 0
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, except_type, except_obj, tb):
+        self.close()
+        return False
+
+    def close(self):
+        for c in self.conns.values():
+            c.close()
+        self.conns = {}
+
+    # fetch the whole slot map from the first node answering, among HOST:PORT
+    #   and the masters known
+    def refresh(self):
+        addrs = [(self.host, self.port)]
+        addrs.extend(sorted(set(a for a in self.slots if a is not None)))
+        error = None
+        for host, port in addrs:
+            try:
+                with Connection(host, port, transport=self.transport) as t:
+                    masters = _list_nodes(t, host,
+                                          _filter_not_failed_master)[0]
+                break
+            except (IOError, hiredis.HiredisError) as e:
+                logging.debug('Fail to list nodes from %s:%d: %s', host,
+                              port, e)
+                error = e
+        else:
+            raise error
+        slots = [None] * SLOT_COUNT
+        for m in masters:
+            for slot in m.assigned_slots:
+                slots[slot] = (m.host, m.port)
+        self.slots = slots
+
+    def get_conn(self, addr):
+        with self.conns_lock:
+            conn = self.conns.get(addr)
+            if conn is None:
+                conn = self.conns[addr] = Connection(
+                    addr[0],
+                    addr[1],
+                    transport=self.transport,
+                    decode_replies=self.decode_replies)
+            return conn
+
+    def node_of(self, key):
+        # (host, port) of the master owning `key`, or None
+        return self.slots[key_slot(key)]
+
+    def _any_master(self):
+        for addr in self.slots:
+            if addr is not None:
+                return addr
+        return (self.host, self.port)
+
+    def _send(self, addr, commands, asking):
+        # send `commands` in a pipeline to a node, each one whose index is in
+        #   `asking` right after ASKING, and return their replies
+        conn = self.get_conn(addr)
+        sent = commands
+        if asking:
+            sent = []
+            for i, c in enumerate(commands):
+                if i in asking:
+                    sent.append(('asking', ))
+                sent.append(c)
+        try:
+            replies = list(
+                conn.execute_stream(sent, PIPELINE_IN_FLIGHT, False))
+        except RedisIOError:
+            with self.conns_lock:
+                self.conns.pop(addr, None)
+            conn.close()
+            raise
+        if not asking:
+            return replies
+        result = []
+        replies = iter(replies)
+        for i in range(len(commands)):
+            if i in asking:
+                next(replies)
+            result.append(next(replies))
+        return result
+
+    # Send `commands` grouped by the masters owning their keys, in a pipeline
+    #   to each master and to all masters at the same time. Return the
+    #   replies in the order of `commands`. If `raise_error` is set, the first
+    #   error reply is raised after all commands are replied, otherwise it is
+    #   left in the result as a `hiredis.ReplyError`. The keys are the
+    #   arguments at `key_index`.
+    #
+    # Commands to a node are sent in one pipeline, including those redirected
+    #   by ASK, which are sent right after ASKING, so that a connection is
+    #   used by one thread only.
+    def execute_bulk(self, commands, raise_error=True, key_index=1):
+        commands = [tuple(c) for c in commands]
+        replies = [None] * len(commands)
+        keyed = [i for i, c in enumerate(commands) if len(c) > key_index]
+        slots = [None] * len(commands)
+        for i, slot in zip(keyed, key_slots([commands[i][key_index]
+                                             for i in keyed])):
+            slots[i] = slot
+        # index of command -> (host, port) to send it to after ASKING
+        asking = {}
+
+        def send(group):
+            # group: ((host, port), [(index of command, after ASKING)])
+            addr, sent = group
+            return self._send(addr, [commands[i] for i, _ in sent],
+                              set(j for j, (_, a) in enumerate(sent) if a))
+
+        pending = list(range(len(commands)))
+        for attempt in range(MAX_REDIRECTS + 1):
+            groups = {}
+            retry = []
+            for i in pending:
+                if i in asking:
+                    groups.setdefault(asking.pop(i), []).append((i, True))
+                    continue
+                addr = (self._any_master() if slots[i] is None else
+                        self.slots[slots[i]])
+                if addr is None:
+                    replies[i] = hiredis.ReplyError(
+                        'CLUSTERDOWN Hash slot not served')
+                    retry.append(i)
+                else:
+                    groups.setdefault(addr, []).append((i, False))
+            retry_later = len(retry) > 0
+            groups = sorted(groups.items())
+            results = pmap(send, groups, self.concurrency)
+
+            for (_, sent), group_replies in zip(groups, results):
+                for (i, _), r in zip(sent, group_replies):
+                    replies[i] = r
+                    if not isinstance(r, hiredis.ReplyError):
+                        continue
+                    message = str(r)
+                    if message.startswith('MOVED '):
+                        self.moved += 1
+                        slot, addr = _parse_redirect(message)
+                        self.slots[slot] = addr
+                        # the slot of the key the node found in the command
+                        slots[i] = slot
+                        retry.append(i)
+                    elif message.startswith('ASK '):
+                        self.ask += 1
+                        asking[i] = _parse_redirect(message)[1]
+                        retry.append(i)
+                    elif message.startswith(('TRYAGAIN', 'CLUSTERDOWN')):
+                        retry_later = True
+                        retry.append(i)
+            pending = retry
+            if not pending or attempt == MAX_REDIRECTS:
+                break
+            if retry_later:
+                time.sleep(RETRY_INTERVAL)
+                self.refresh()
+
+        if raise_error:
+            for r in replies:
+                if isinstance(r, hiredis.ReplyError):
+                    raise r
+        return replies
+
+    def execute(self, *args):
+        return self.execute_bulk([args])[0]
+
+    def _multi_key(self, command, keys):
+        # one command for the keys in each slot, as multi-key commands
+        #   require all keys in the same slot
+        groups = _split_by_slot(keys)
+        replies = self.execute_bulk([(command, ) + tuple(keys[i]
+                                                         for i in indexes)
+                                     for _, indexes in groups])
+        return groups, replies
+
+    def mget(self, keys):
+        keys = list(keys)
+        values = [None] * len(keys)
+        for (_, indexes), r in zip(*self._multi_key('mget', keys)):
+            for i, v in zip(indexes, r):
+                values[i] = v
+        return values
+
+    def exists(self, keys):
+        return sum(self._multi_key('exists', list(keys))[1])
+
+    def delete(self, keys):
+        return sum(self._multi_key('del', list(keys))[1])
+
+    def unlink(self, keys):
+        return sum(self._multi_key('unlink', list(keys))[1])
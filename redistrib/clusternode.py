@@ -1,8 +1,21 @@
-from werkzeug.utils import cached_property
-
 from .connection import Connection
 
 
+class cached_property(object):
+    # computed at the first access and then stored in the instance, which
+    #   shadows this descriptor afterwards
+    def __init__(self, func):
+        self.func = func
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = obj.__dict__[self.__name__] = self.func(obj)
+        return value
+
+
 class ClusterNode(object):
     def __init__(self, node_id, latest_know_ip_address_and_port, flags,
                  master_id, last_ping_sent_time, last_pong_received_time,
@@ -13,12 +26,22 @@ class ClusterNode(object):
         self.port = int(port)
         self.flags = flags.split(',')
         self.master_id = None if master_id == '-' else master_id
+        self.config_epoch = int(node_index)
         self.assigned_slots = []
         self.slots_migrating = False
+        # slot -> id of the node the slot is migrating to / importing from
+        self.migrating = {}
+        self.importing = {}
         for slots_range in assigned_slots:
             if '[' == slots_range[0] and ']' == slots_range[-1]:
                 # exclude migrating slot
                 self.slots_migrating = True
+                if '->-' in slots_range:
+                    slot, node_id = slots_range[1:-1].split('->-')
+                    self.migrating[int(slot)] = node_id
+                else:
+                    slot, node_id = slots_range[1:-1].split('-<-')
+                    self.importing[int(slot)] = node_id
                 continue
             if '-' in slots_range:
                 begin, end = slots_range.split('-')
@@ -74,6 +97,41 @@ class BaseBalancer(object):
         return 1
 
 
+class SlotStatsBalancer(BaseBalancer):
+    # Weight masters by the result of `redistrib.command.slot_stats`, so that
+    #   masters whose slots hold more keys (or memory, if `by` is "memory")
+    #   than the average are given fewer slots. Masters not in the stats,
+    #   holding no slot or not supporting MEMORY USAGE are weighted as
+    #   average. Weighting by memory requires stats with `memory_samples`.
+    SCALE = 1000
+    MAX_RATIO = 8
+
+    def __init__(self, stats, by='keys'):
+        self.density = {}
+        total = 0
+        slot_count = 0
+        for s in stats:
+            values = s[by]
+            if by == 'memory' and values == {} and s['keys']:
+                raise ValueError('Memory is not estimated in the stats;'
+                                 ' pass memory_samples to slot_stats')
+            if not values:
+                continue
+            self.density[s['node'].node_id] = (
+                float(sum(values.values())) / len(values))
+            total += sum(values.values())
+            slot_count += len(values)
+        self.average = float(total) / slot_count if slot_count else 0
+
+    def weight(self, clusternode):
+        density = self.density.get(clusternode.node_id, self.average)
+        if self.average == 0:
+            return self.SCALE
+        if density * self.MAX_RATIO <= self.average:
+            return self.SCALE * self.MAX_RATIO
+        return max(1, int(self.SCALE * self.average / density))
+
+
 def base_balance_plan(nodes, balancer=None):
     if balancer is None:
         balancer = BaseBalancer()
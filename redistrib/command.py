@@ -1,65 +1,83 @@
 import logging
 import re
+import threading
+import time
 
 import hiredis
 import six
-from retrying import retry
 from six.moves import range
 
 from .clusternode import ClusterNode, base_balance_plan
-from .connection import (CMD_CLUSTER_INFO, CMD_CLUSTER_NODES, CMD_INFO,
-                         Connection)
+from .connection import CMD_CLUSTER_INFO, CMD_CLUSTER_NODES, Connection
+from .exceptions import RedisMigrateError
+from .keyslot import SLOT_COUNT
+from .parallel import DEFAULT_CONCURRENCY, pmap, wait_until
 
-SLOT_COUNT = 16384
 PAT_CLUSTER_ENABLED = re.compile('cluster_enabled:([01])')
 PAT_CLUSTER_STATE = re.compile('cluster_state:([a-z]+)')
 PAT_CLUSTER_SLOT_ASSIGNED = re.compile('cluster_slots_assigned:([0-9]+)')
 PAT_MIGRATING_IN = re.compile(r'\[([0-9]+)-<-(\w+)\]')
 PAT_MIGRATING_OUT = re.compile(r'\[([0-9]+)->-(\w+)\]')
 
+# seconds to wait for the cluster status to become OK, or for a new slave to
+#   be known by its master
+CONVERGE_TIMEOUT = 32
+SLAVE_TIMEOUT = 16
+
+# max number of commands in one pipeline when asking all slots of a node
+STATS_PIPELINE_SIZE = 4096
+
+# max number of slots migrating at the same time between a pair of nodes;
+#   each of them takes one more connection to both the source and the target
+MAX_MIGRATING_WINDOW = 16
+
+# keys asked by each CLUSTER GETKEYSINSLOT and migrated in one pipeline
+MIGRATE_BATCH = 10
+# a key failed to migrate is retried so many times, sleeping from
+#   MIGRATE_RETRY_INTERVAL seconds, doubled after each retry, to
+#   MIGRATE_MAX_RETRY_INTERVAL seconds at most
+MIGRATE_RETRIES = 5
+MIGRATE_RETRY_INTERVAL = 0.05
+MIGRATE_MAX_RETRY_INTERVAL = 1
+
 
 def _valid_node_info(n):
     return len(n) != 0 and 'handshake' not in n
 
 
-def _ensure_cluster_status_unset(t):
-    m = t.send_raw(CMD_INFO)
-    logging.debug('Ask `info` Rsp %s', m)
-    cluster_enabled = PAT_CLUSTER_ENABLED.findall(m)
+def _cluster_status(t):
+    # ask `info cluster` and `cluster info` in one round trip
+    m_info, m = t.execute_bulk(
+        [('info', 'cluster'), ('cluster', 'info')], raise_error=False)
+    logging.debug('Ask `info cluster` Rsp %s', m_info)
+    cluster_enabled = PAT_CLUSTER_ENABLED.findall(m_info)
     if len(cluster_enabled) == 0 or int(cluster_enabled[0]) == 0:
         raise hiredis.ProtocolError(
             'Node %s:%d is not cluster enabled' % (t.host, t.port))
+    if isinstance(m, hiredis.ReplyError):
+        raise m
 
-    m = t.send_raw(CMD_CLUSTER_INFO)
     logging.debug('Ask `cluster info` Rsp %s', m)
     cluster_state = PAT_CLUSTER_STATE.findall(m)
     cluster_slot_assigned = PAT_CLUSTER_SLOT_ASSIGNED.findall(m)
-    if cluster_state[0] != 'fail' or int(cluster_slot_assigned[0]) != 0:
+    return cluster_state[0], int(cluster_slot_assigned[0])
+
+
+def _ensure_cluster_status_unset(t):
+    cluster_state, cluster_slot_assigned = _cluster_status(t)
+    if cluster_state != 'fail' or cluster_slot_assigned != 0:
         raise hiredis.ProtocolError(
             'Node %s:%d is already in a cluster' % (t.host, t.port))
 
 
 def _ensure_cluster_status_set(t):
-    m = t.send_raw(CMD_INFO)
-    logging.debug('Ask `info` Rsp %s', m)
-    cluster_enabled = PAT_CLUSTER_ENABLED.findall(m)
-    if len(cluster_enabled) == 0 or int(cluster_enabled[0]) == 0:
-        raise hiredis.ProtocolError(
-            'Node %s:%d is not cluster enabled' % (t.host, t.port))
-
-    m = t.send_raw(CMD_CLUSTER_INFO)
-    logging.debug('Ask `cluster info` Rsp %s', m)
-    cluster_state = PAT_CLUSTER_STATE.findall(m)
-    cluster_slot_assigned = PAT_CLUSTER_SLOT_ASSIGNED.findall(m)
-    if cluster_state[0] != 'ok' and int(cluster_slot_assigned[0]) == 0:
+    cluster_state, cluster_slot_assigned = _cluster_status(t)
+    if cluster_state != 'ok' and cluster_slot_assigned == 0:
         raise hiredis.ProtocolError(
             'Node %s:%d is not in a cluster' % (t.host, t.port))
 
 
-# Redis instance responses to clients BEFORE changing its 'cluster_state'
-#   just retry some times, it should become OK
-@retry(stop_max_attempt_number=64, wait_fixed=500)
-def _poll_check_status(t):
+def _check_status(t):
     m = t.send_raw(CMD_CLUSTER_INFO)
     logging.debug('Ask `cluster info` Rsp %s', m)
     cluster_state = PAT_CLUSTER_STATE.findall(m)
@@ -68,16 +86,64 @@ def _poll_check_status(t):
         t.raise_('Unexpected status: %s' % m)
 
 
-def _add_slots(conn, slots_list, max_slots):
-    def addslots(slots_chunk):
-        m = conn.execute('cluster', 'addslots', *slots_chunk)
-        logging.debug('Ask `cluster addslots` Rsp %s', m)
+# Redis instance responses to clients BEFORE changing its 'cluster_state'
+#   just poll all of them until they become OK
+def _poll_check_status(conns, timeout=CONVERGE_TIMEOUT):
+    wait_until(_check_status, conns, timeout)
+
+
+def _poll_check_known(conns, node_ids, timeout=CONVERGE_TIMEOUT):
+    # a cheap way to ask whether a node is known,
+    #   it replies "Unknown node" error otherwise
+    wait_until(lambda t: t.execute_bulk(
+        [('cluster', 'count-failure-reports', i) for i in node_ids]), conns,
+               timeout)
+
+
+def _slots_to_ranges(slots):
+    ranges = []
+    for slot in sorted(slots):
+        if ranges and ranges[-1][1] == slot - 1:
+            ranges[-1][1] = slot
+        else:
+            ranges.append([slot, slot])
+    return ranges
+
+
+def _expect_ok_replies(conn, replies, command):
+    for m in replies:
+        logging.debug('Ask `cluster %s` Rsp %s', command.lower(), m)
         if m.lower() != 'ok':
-            conn.raise_('Unexpected reply after ADDSLOTS: %s' % m)
+            conn.raise_('Unexpected reply after %s: %s' % (command, m))
+
 
-    # split list to evenly sized chunks
-    for i in range(0, len(slots_list), max_slots):
-        addslots(slots_list[i:i + max_slots])
+# errors of CLUSTER ADDSLOTSRANGE sent to Redis before 7.0: "ERR Unknown
+#   subcommand ..." since 5.0, "ERR Wrong CLUSTER subcommand ..." before
+_UNKNOWN_SUBCOMMAND_ERRORS = ('unknown subcommand', 'wrong cluster subcommand')
+
+
+def _add_slots(conn, slots_list, max_slots):
+    # CLUSTER ADDSLOTSRANGE is available since Redis 7.0, in which each
+    #   contiguous range of slots costs only 2 arguments
+    ranges = _slots_to_ranges(slots_list)
+    ranges_each = max(1, max_slots // 2)
+    try:
+        m = conn.execute_stream(
+            ['cluster', 'addslotsrange'] +
+            [s for r in ranges[i:i + ranges_each] for s in r]
+            for i in range(0, len(ranges), ranges_each))
+        return _expect_ok_replies(conn, m, 'ADDSLOTSRANGE')
+    except hiredis.ReplyError as e:
+        message = str(e).lower()
+        if not any(m in message for m in _UNKNOWN_SUBCOMMAND_ERRORS):
+            raise
+
+    # split list to evenly sized chunks, and pipeline them
+    slots_list = sorted(slots_list)
+    m = conn.execute_stream(
+        ['cluster', 'addslots'] + slots_list[i:i + max_slots]
+        for i in range(0, len(slots_list), max_slots))
+    _expect_ok_replies(conn, m, 'ADDSLOTS')
 
 
 def _add_slots_range(conn, begin, end, max_slots):
@@ -85,42 +151,49 @@ def _add_slots_range(conn, begin, end, max_slots):
 
 
 def create(host_port_list, max_slots=1024):
-    conns = []
-    try:
-        for host, port in set(host_port_list):
-            t = Connection(host, port)
-            conns.append(t)
-            _ensure_cluster_status_unset(t)
-            logging.info('Instance at %s:%d checked', t.host, t.port)
+    # remove duplicated addresses but keep the order
+    addrs = sorted(set(host_port_list), key=host_port_list.index)
+    conns = [None] * len(addrs)
+
+    def check(i):
+        t = conns[i] = Connection(*addrs[i])
+        _ensure_cluster_status_unset(t)
+        logging.info('Instance at %s:%d checked', t.host, t.port)
 
+    def meet(t):
+        m = t.execute('cluster', 'meet', first_conn.host, first_conn.port)
+        logging.debug('Ask `cluster meet` Rsp %s', m)
+        if m.lower() != 'ok':
+            t.raise_('Unexpected reply after MEET: %s' % m)
+
+    def add_slots(i):
+        t = conns[i]
+        begin = 0 if i == 0 else (i - 1) * slots_each + first_node_slots
+        end = i * slots_each + first_node_slots
+        _add_slots_range(t, begin, end, max_slots)
+        logging.info('Add %d slots to %s:%d', end - begin, t.host, t.port)
+
+    try:
+        pmap(check, range(len(addrs)))
         first_conn = conns[0]
-        for i, t in enumerate(conns[1:]):
-            t.execute('cluster', 'meet', first_conn.host, first_conn.port)
+        pmap(meet, conns[1:])
 
         slots_each = SLOT_COUNT // len(conns)
         slots_residue = SLOT_COUNT - slots_each * len(conns)
         first_node_slots = slots_residue + slots_each
-
-        _add_slots_range(first_conn, 0, first_node_slots, max_slots)
-        logging.info('Add %d slots to %s:%d', slots_residue + slots_each,
-                     first_conn.host, first_conn.port)
-        for i, t in enumerate(conns[1:]):
-            _add_slots_range(t, i * slots_each + first_node_slots,
-                             (i + 1) * slots_each + first_node_slots,
-                             max_slots)
-            logging.info('Add %d slots to %s:%d', slots_each, t.host, t.port)
-        for t in conns:
-            _poll_check_status(t)
+        pmap(add_slots, range(len(conns)))
+        _poll_check_status(conns)
     finally:
         for t in conns:
-            t.close()
+            if t is not None:
+                t.close()
 
 
 def start_cluster(host, port, max_slots=SLOT_COUNT):
     with Connection(host, port) as t:
         _ensure_cluster_status_unset(t)
         _add_slots_range(t, 0, SLOT_COUNT, max_slots)
-        _poll_check_status(t)
+        _poll_check_status([t])
         logging.info('Instance at %s:%d started as a standalone cluster', host,
                      port)
 
@@ -129,31 +202,193 @@ def start_cluster_on_multi(host_port_list, max_slots=SLOT_COUNT):
     return create(host_port_list, max_slots)
 
 
-def _migr_keys(src_conn, target_host, target_port, slot):
-    key_count = 0
-    while True:
-        keys = src_conn.execute('cluster', 'getkeysinslot', slot, 10)
+# progress of slots migration in this process, summed up over all calls;
+#   exported by `redistrib.exporter`
+migration_progress = {
+    'slots_planned': 0,
+    'slots_migrated': 0,
+    'slots_migrating': 0,
+    'keys_migrated': 0,
+}
+_migration_progress_lock = threading.Lock()
+
+
+def _add_migration_progress(**kwargs):
+    with _migration_progress_lock:
+        for k, v in six.iteritems(kwargs):
+            migration_progress[k] += v
+
+
+def _migr_key_batch(src_conn, target_host, target_port, keys, replace):
+    # return the number of keys migrated, and {key: error message} of keys
+    #   still failing after retries; without `replace`, keys existing in the
+    #   target (BUSYKEY) are not retried
+    migrated = 0
+    failed = {}
+    interval = MIGRATE_RETRY_INTERVAL
+    for attempt in range(MIGRATE_RETRIES + 1):
+        if attempt > 0:
+            time.sleep(interval)
+            interval = min(interval * 2, MIGRATE_MAX_RETRY_INTERVAL)
+        options = ['replace'] if replace else []
+        replies = src_conn.execute_bulk(
+            [['migrate', target_host, target_port, k, 0, 30000] + options
+             for k in keys],
+            raise_error=False)
+        retry_keys = []
+        for k, m in zip(keys, replies):
+            if not isinstance(m, hiredis.ReplyError):
+                # NOKEY if the key has expired or been deleted
+                if m.lower() == 'ok':
+                    migrated += 1
+                failed.pop(k, None)
+                continue
+            logging.debug('Fail to migrate %s to %s:%d: %s', k, target_host,
+                          target_port, m)
+            failed[k] = str(m)
+            if replace or not str(m).startswith('BUSYKEY'):
+                retry_keys.append(k)
+        keys = retry_keys
         if len(keys) == 0:
-            return key_count
-        key_count += len(keys)
-        src_conn.execute_bulk(
-            [['migrate', target_host, target_port, k, 0, 30000] for k in keys])
+            break
+    return migrated, failed
 
 
-def _migr_slots(source_node, target_node, slots, nodes):
+def _migr_keys(src_conn, target_host, target_port, slot, replace=False):
+    # keys failed to migrate are left in the slot, so ask for as many more
+    #   keys to get a new batch
+    key_count = 0
+    failed = {}
+    while True:
+        keys = [
+            k for k in src_conn.execute('cluster', 'getkeysinslot', slot,
+                                        MIGRATE_BATCH + len(failed))
+            if k not in failed
+        ]
+        if len(keys) == 0:
+            break
+        migrated, batch_failed = _migr_key_batch(src_conn, target_host,
+                                                 target_port, keys, replace)
+        key_count += migrated
+        failed.update(batch_failed)
+        _add_migration_progress(keys_migrated=migrated)
+    if failed:
+        raise RedisMigrateError({slot: failed}, src_conn.host, src_conn.port)
+    return key_count
+
+
+# `node_locks` maps node ids to locks guarding the shared connections of
+#   `nodes`, which is required if other migrations of the same `nodes` are
+#   running at the same time; slots are then migrated over connections of
+#   their own to the source and the target even if `window` is 1.
+# A slot having keys failed to migrate is left migrating while the other
+#   slots go on, and a `RedisMigrateError` of all such keys is raised at the
+#   end. MIGRATE is sent with REPLACE if `replace` is set.
+def _migr_slots(source_node,
+                target_node,
+                slots,
+                nodes,
+                window=1,
+                node_locks=None,
+                replace=False):
+    slots = list(slots)
+    window = max(1, min(window, MAX_MIGRATING_WINDOW, len(slots)))
     logging.info('Migrating %d slots from %s<%s:%d> to %s<%s:%d>', len(slots),
                  source_node.node_id, source_node.host, source_node.port,
                  target_node.node_id, target_node.host, target_node.port)
-    key_count = 0
-    for slot in slots:
-        key_count += _migr_one_slot(source_node, target_node, slot, nodes)
+    _add_migration_progress(slots_planned=len(slots))
+    failures = {}
+    if window == 1 and node_locks is None:
+        key_count = 0
+        for slot in slots:
+            key_count += _migr_one_slot(
+                source_node,
+                target_node,
+                slot,
+                nodes,
+                replace=replace,
+                failures=failures)
+    else:
+        key_count = sum(
+            _migr_slots_in_window(source_node, target_node, slots, nodes,
+                                  window, node_locks, replace, failures))
     logging.info('Migrated: %d slots %d keys from %s<%s:%d> to %s<%s:%d>',
                  len(slots), key_count, source_node.node_id, source_node.host,
                  source_node.port, target_node.node_id, target_node.host,
                  target_node.port)
+    if failures:
+        raise RedisMigrateError(failures, source_node.host, source_node.port)
+
+
+def _migr_slots_in_window(source_node,
+                          target_node,
+                          slots,
+                          nodes,
+                          window,
+                          node_locks=None,
+                          replace=False,
+                          failures=None):
+    # each lane takes its own connections to the source and the target so
+    #   that MIGRATE batches of different slots are on the wire at the same
+    #   time; SETSLOT broadcasts go through the shared connections of `nodes`
+    pending = iter(slots)
+    pending_lock = threading.Lock()
+    if node_locks is None:
+        node_locks = _node_locks(nodes)
+
+    def lane(_):
+        key_count = 0
+        with Connection(source_node.host, source_node.port) as source_conn, \
+                Connection(target_node.host, target_node.port) as target_conn:
+            while True:
+                with pending_lock:
+                    slot = next(pending, None)
+                if slot is None:
+                    return key_count
+                key_count += _migr_one_slot(
+                    source_node,
+                    target_node,
+                    slot,
+                    nodes,
+                    source_conn=source_conn,
+                    target_conn=target_conn,
+                    node_locks=node_locks,
+                    replace=replace,
+                    failures=failures)
+
+    return pmap(lane, range(window), window)
+
+
+def _migr_one_slot(source_node,
+                   target_node,
+                   slot,
+                   nodes,
+                   source_conn=None,
+                   target_conn=None,
+                   node_locks=None,
+                   replace=False,
+                   failures=None):
+    # keys failed to migrate are added to `failures` if it is given,
+    #   otherwise the `RedisMigrateError` is raised
+    _add_migration_progress(slots_migrating=1)
+    try:
+        keys = _do_migr_one_slot(source_node, target_node, slot, nodes,
+                                 source_conn, target_conn, node_locks,
+                                 replace)
+    except RedisMigrateError as e:
+        if failures is None:
+            raise
+        logging.error('Slot %d left migrating: %s', slot, e)
+        failures.update(e.failed_keys)
+        return 0
+    finally:
+        _add_migration_progress(slots_migrating=-1)
+    _add_migration_progress(slots_migrated=1)
+    return keys
 
 
-def _migr_one_slot(source_node, target_node, slot, nodes):
+def _do_migr_one_slot(source_node, target_node, slot, nodes, source_conn,
+                      target_conn, node_locks, replace):
     def expect_exec_ok(m, conn, slot):
         if m.lower() != 'ok':
             conn.raise_('\n'.join([
@@ -163,13 +398,27 @@ def _migr_one_slot(source_node, target_node, slot, nodes):
                 'Got %s' % m
             ]))
 
+    # imported here, as only migrations need it
+    from retrying import retry
+
     @retry(stop_max_attempt_number=16, wait_fixed=100)
     def setslot_stable(conn, slot, node_id):
         m = conn.execute('cluster', 'setslot', slot, 'node', node_id)
         expect_exec_ok(m, conn, slot)
 
-    source_conn = source_node.get_conn()
-    target_conn = target_node.get_conn()
+    def broadcast_setslot_stable():
+        for node in nodes:
+            if not node.master:
+                continue
+            if node_locks is None:
+                setslot_stable(node.get_conn(), slot, target_node.node_id)
+            else:
+                with node_locks[node.node_id]:
+                    setslot_stable(node.get_conn(), slot,
+                                   target_node.node_id)
+
+    source_conn = source_conn or source_node.get_conn()
+    target_conn = target_conn or target_node.get_conn()
 
     try:
         expect_exec_ok(
@@ -187,14 +436,41 @@ def _migr_one_slot(source_node, target_node, slot, nodes):
         if 'not the owner of' not in str(e):
             source_conn.raise_(str(e))
 
-    keys = _migr_keys(source_conn, target_node.host, target_node.port, slot)
+    keys = _migr_keys(source_conn, target_node.host, target_node.port, slot,
+                      replace)
     setslot_stable(source_conn, slot, target_node.node_id)
-    for node in nodes:
-        if node.master:
-            setslot_stable(node.get_conn(), slot, target_node.node_id)
+    broadcast_setslot_stable()
     return keys
 
 
+def _node_locks(nodes):
+    return {node.node_id: threading.Lock() for node in nodes}
+
+
+# Migrate slots of each (source, target, slots) of `tasks`, all at the same
+#   time if `node_locks` is given, otherwise one after another. Keys failed
+#   to migrate do not stop the other tasks; a `RedisMigrateError` of all of
+#   them is raised at the end.
+def _migr_tasks(tasks, nodes, window=1, node_locks=None):
+    def migrate(task):
+        try:
+            _migr_slots(task[0], task[1], task[2], nodes, window, node_locks)
+        except RedisMigrateError as e:
+            return e
+        return None
+
+    if node_locks is None:
+        errors = [migrate(task) for task in tasks]
+    else:
+        errors = pmap(migrate, tasks)
+    errors = [e for e in errors if e is not None]
+    if errors:
+        failed_keys = {}
+        for e in errors:
+            failed_keys.update(e.failed_keys)
+        raise RedisMigrateError(failed_keys, errors[0].host, errors[0].port)
+
+
 def _join_to_cluster(clst, new):
     _ensure_cluster_status_set(clst)
     _ensure_cluster_status_unset(new)
@@ -203,7 +479,7 @@ def _join_to_cluster(clst, new):
     logging.debug('Ask `cluster meet` Rsp %s', m)
     if m.lower() != 'ok':
         clst.raise_('Unexpected reply after MEET: %s' % m)
-    _poll_check_status(new)
+    _poll_check_status([new])
 
 
 def join_cluster(cluster_host,
@@ -211,7 +487,8 @@ def join_cluster(cluster_host,
                  newin_host,
                  newin_port,
                  balancer=None,
-                 balance_plan=base_balance_plan):
+                 balance_plan=base_balance_plan,
+                 window=1):
     with Connection(newin_host, newin_port) as t, \
             Connection(cluster_host, cluster_port) as cnode:
         _join_to_cluster(cnode, t)
@@ -221,13 +498,76 @@ def join_cluster(cluster_host,
                 'Instance at %s:%d has joined %s:%d; now balancing slots',
                 newin_host, newin_port, cluster_host, cluster_port)
             nodes = _list_nodes(t, default_host=newin_host)[0]
-            for src, dst, count in balance_plan(nodes, balancer):
-                _migr_slots(src, dst, src.assigned_slots[:count], nodes)
+            _migr_tasks(_plan_slots(balance_plan(nodes, balancer)), nodes,
+                        window)
         finally:
             for n in nodes:
                 n.close()
 
 
+def _plan_slots(plan):
+    # a source appearing more than once in the plan gives different slots to
+    #   each of its targets
+    given = {}
+    result = []
+    for src, dst, count in plan:
+        begin = given.get(src.node_id, 0)
+        result.append((src, dst, src.assigned_slots[begin:begin + count]))
+        given[src.node_id] = begin + count
+    return result
+
+
+# Add all nodes of `newin_list`, a list of (HOST, PORT) tuples, to a cluster
+#   as masters, then balance slots among all masters by a single plan which
+#   moves each slot at most once, with all moves of the plan running
+#   concurrently
+def join_many(cluster_host,
+              cluster_port,
+              newin_list,
+              balancer=None,
+              balance_plan=base_balance_plan,
+              window=1):
+    addrs = sorted(set(newin_list), key=newin_list.index)
+    conns = [None] * len(addrs)
+    masters = []
+    nodes = []
+
+    def check(i):
+        t = conns[i] = Connection(*addrs[i])
+        _ensure_cluster_status_unset(t)
+        return t.execute('cluster', 'myid')
+
+    def meet(t):
+        m = t.execute('cluster', 'meet', cluster_host, cluster_port)
+        logging.debug('Ask `cluster meet` Rsp %s', m)
+        if m.lower() != 'ok':
+            t.raise_('Unexpected reply after MEET: %s' % m)
+
+    try:
+        with Connection(cluster_host, cluster_port) as cnode:
+            _ensure_cluster_status_set(cnode)
+            masters = _list_masters(cnode)[0]
+            newin_ids = pmap(check, range(len(addrs)))
+            pmap(meet, conns)
+            _poll_check_status(conns)
+            # nodes are listed from `cnode`, which could be a replica that
+            #   learns of the new nodes later than the masters
+            _poll_check_known([cnode] + [n.get_conn() for n in masters],
+                              newin_ids)
+            nodes = _list_nodes(cnode)[0]
+        logging.info('%d instances have joined %s:%d; now balancing slots',
+                     len(addrs), cluster_host, cluster_port)
+
+        _migr_tasks(_plan_slots(balance_plan(nodes, balancer)), nodes,
+                    window, _node_locks(nodes))
+    finally:
+        for t in conns:
+            if t is not None:
+                t.close()
+        for n in masters + nodes:
+            n.close()
+
+
 def add_node(cluster_host, cluster_port, newin_host, newin_port):
     with Connection(newin_host, newin_port) as t, \
             Connection(cluster_host, cluster_port) as c:
@@ -238,7 +578,7 @@ def join_no_load(cluster_host, cluster_port, newin_host, newin_port):
     return add_node(cluster_host, cluster_port, newin_host, newin_port)
 
 
-def _check_master_and_migrate_slots(nodes, myself):
+def _check_master_and_migrate_slots(nodes, myself, window=1):
     other_masters = []
     master_ids = set()
     for node in nodes:
@@ -252,15 +592,16 @@ def _check_master_and_migrate_slots(nodes, myself):
         raise ValueError('The master still has slaves')
 
     mig_slots_to_each = len(myself.assigned_slots) // len(other_masters)
+    slots = list(myself.assigned_slots)
+    tasks = []
     for node in other_masters[:-1]:
-        _migr_slots(myself, node, myself.assigned_slots[:mig_slots_to_each],
-                    nodes)
-        del myself.assigned_slots[:mig_slots_to_each]
-    node = other_masters[-1]
-    _migr_slots(myself, node, myself.assigned_slots, nodes)
+        tasks.append((myself, node, slots[:mig_slots_to_each]))
+        del slots[:mig_slots_to_each]
+    tasks.append((myself, other_masters[-1], slots))
+    _migr_tasks(tasks, nodes, window)
 
 
-def del_node(host, port):
+def del_node(host, port, window=1):
     myself = None
     nodes = []
     t = Connection(host, port)
@@ -269,7 +610,7 @@ def del_node(host, port):
         nodes, myself = _list_nodes(t, filter_func=_filter_not_failed)
         nodes.remove(myself)
         if myself.master:
-            _check_master_and_migrate_slots(nodes, myself)
+            _check_master_and_migrate_slots(nodes, myself, window)
         logging.info('Migrated for %s / Broadcast a `forget`', myself.node_id)
         for node in nodes:
             tk = node.get_conn()
@@ -287,6 +628,77 @@ def del_node(host, port):
             n.close()
 
 
+def _drain_plan(leaving, survivors):
+    # move all slots of leaving masters to surviving masters, giving to each
+    #   survivor no more than it lacks of an even share of all slots, the
+    #   ones lacking most first; survivors are not rebalanced among
+    #   themselves
+    total = sum(len(n.assigned_slots) for n in leaving + survivors)
+    each, residue = divmod(total, len(survivors))
+    lacks = sorted(
+        [[each + (1 if i < residue else 0) - len(n.assigned_slots), n]
+         for i, n in enumerate(survivors)],
+        key=lambda x: -x[0])
+    plan = []
+    i = 0
+    for src in leaving:
+        slots = list(src.assigned_slots)
+        while slots:
+            count = min(len(slots), lacks[i][0])
+            if count > 0:
+                plan.append((src, lacks[i][1], slots[:count]))
+                lacks[i][0] -= count
+                del slots[:count]
+            if lacks[i][0] <= 0:
+                i += 1
+    return plan
+
+
+def _forget_all(node, node_ids):
+    for m in node.get_conn().execute_bulk(
+            [('cluster', 'forget', i) for i in node_ids], raise_error=False):
+        if isinstance(m, hiredis.ReplyError) and 'Unknown node' not in str(m):
+            raise m
+
+
+# Remove all nodes of `host_port_list`, a list of (HOST, PORT) tuples, from
+#   their cluster. Slots of leaving masters are moved directly to the
+#   surviving masters, with all moves running concurrently, then each
+#   surviving node forgets all leaving nodes.
+def del_many(host_port_list, window=1):
+    addrs = set(host_port_list)
+    nodes = []
+    try:
+        with Connection(*host_port_list[0]) as t:
+            _ensure_cluster_status_set(t)
+            nodes = _list_nodes(t, filter_func=_filter_not_failed)[0]
+        leaving = [n for n in nodes if (n.host, n.port) in addrs]
+        survivors = [n for n in nodes if (n.host, n.port) not in addrs]
+        if len(leaving) != len(addrs):
+            missing = addrs - set((n.host, n.port) for n in leaving)
+            raise ValueError('Not in the cluster: %s' %
+                             ', '.join('%s:%d' % a for a in sorted(missing)))
+        leaving_ids = set(n.node_id for n in leaving)
+        for n in survivors:
+            if n.slave and n.master_id in leaving_ids:
+                raise ValueError('The master of %s is leaving' % n.addr())
+        leaving_masters = [n for n in leaving if n.master]
+        surviving_masters = [n for n in survivors if n.master]
+        if len(surviving_masters) == 0:
+            raise ValueError('No master would be left')
+
+        _migr_tasks(_drain_plan(leaving_masters, surviving_masters), nodes,
+                    window, _node_locks(nodes))
+
+        logging.info('Migrated for %d nodes / Broadcast a `forget`',
+                     len(leaving))
+        pmap(lambda n: _forget_all(n, leaving_ids), survivors)
+        pmap(lambda n: n.get_conn().execute('cluster', 'reset'), leaving)
+    finally:
+        for n in nodes:
+            n.close()
+
+
 def quit_cluster(host, port):
     return del_node(host, port)
 
@@ -360,14 +772,127 @@ def fix_migrating(host, port):
             n.close()
 
 
-@retry(stop_max_attempt_number=16, wait_fixed=1000)
-def _check_slave(slave_host, slave_port, t):
+def _gather_open_slots(nodes, views):
+    # (source node, target node, slot) for each slot marked as migrating or
+    #   importing in the view of any node; a slot marked on both sides is
+    #   taken once, and a slot marked between different pairs is skipped
+    by_id = {n.node_id: n for n in nodes}
+    pairs = {}
+    for node, view in zip(nodes, views):
+        me = [n for n in view or [] if n.myself]
+        if not me:
+            continue
+        for slot, node_id in six.iteritems(me[0].migrating):
+            pairs.setdefault(slot, set()).add((node.node_id, node_id))
+        for slot, node_id in six.iteritems(me[0].importing):
+            pairs.setdefault(slot, set()).add((node_id, node.node_id))
+
+    result = []
+    for slot, slot_pairs in sorted(six.iteritems(pairs)):
+        if len(slot_pairs) > 1:
+            logging.error('Fail to fix slot %d - open between %s', slot,
+                          ', '.join('%s->%s' % p for p in sorted(slot_pairs)))
+            continue
+        src_id, dst_id = slot_pairs.pop()
+        for node_id in (src_id, dst_id):
+            if node_id not in by_id:
+                logging.error('Fail to fix slot %d - node %s is missing',
+                              slot, node_id)
+                break
+        else:
+            result.append((by_id[src_id], by_id[dst_id], slot))
+    return result
+
+
+def _fix_open_slots(tasks, nodes, per_node, replace, failures):
+    # at most `per_node` slots are fixed at the same time on each node, each
+    #   over connections of its own to the source and the target
+    node_locks = _node_locks(nodes)
+    semaphores = {n.node_id: threading.Semaphore(per_node) for n in nodes}
+    idle_conns = {n.node_id: [] for n in nodes}
+    all_conns = []
+    conns_lock = threading.Lock()
+
+    def borrow(node):
+        with conns_lock:
+            if idle_conns[node.node_id]:
+                return idle_conns[node.node_id].pop()
+        conn = Connection(node.host, node.port)
+        with conns_lock:
+            all_conns.append(conn)
+        return conn
+
+    def fix(task):
+        src, dst, slot = task
+        first, second = sorted([src.node_id, dst.node_id])
+        with semaphores[first], semaphores[second]:
+            source_conn = borrow(src)
+            target_conn = borrow(dst)
+            keys = _migr_one_slot(
+                src,
+                dst,
+                slot,
+                nodes,
+                source_conn=source_conn,
+                target_conn=target_conn,
+                node_locks=node_locks,
+                replace=replace,
+                failures=failures)
+            with conns_lock:
+                idle_conns[src.node_id].append(source_conn)
+                idle_conns[dst.node_id].append(target_conn)
+            return keys
+
+    _add_migration_progress(slots_planned=len(tasks))
+    try:
+        return sum(
+            pmap(fix, tasks, max(1, min(DEFAULT_CONCURRENCY,
+                                        per_node * len(nodes)))))
+    finally:
+        for conn in all_conns:
+            conn.close()
+
+
+# Fix all migrating and importing slots in the cluster, as seen by all
+#   nodes, with at most `per_node` slots fixed at the same time on each node.
+#   Return a list of (source node, target node, slot) of the fixed slots.
+#   Like `migrate_slots`, a `RedisMigrateError` is raised at the end if any
+#   key failed to migrate.
+def fix_cluster_migrating(host, port, per_node=4, replace=False):
+    nodes = []
+    try:
+        with Connection(host, port) as t:
+            nodes = _list_nodes(t, filter_func=_filter_not_failed)[0]
+        views = []
+        for node, (view, _, exc) in zip(nodes, pmap(_fetch_view, nodes)):
+            if exc is not None:
+                logging.warning('Fail to ask %s: %s', node.addr(), exc)
+            views.append(view)
+        tasks = _gather_open_slots(nodes, views)
+        logging.info('%d open slots to fix', len(tasks))
+        failures = {}
+        keys = _fix_open_slots(tasks, nodes, per_node, replace, failures)
+        if failures:
+            raise RedisMigrateError(failures, host, port)
+        logging.info('Fixed %d slots, %d keys migrated', len(tasks), keys)
+        return tasks
+    finally:
+        for n in nodes:
+            n.close()
+
+
+def _check_slave(slave_host, slave_port, master_id, t):
     slave_addr = '%s:%d' % (slave_host, slave_port)
-    for line in t.execute('cluster', 'nodes').split('\n'):
+    for line in t.execute('cluster', 'slaves', master_id):
         if slave_addr in line:
-            if 'slave' in line:
-                return
-            t.raise_('%s not switched to a slave' % slave_addr)
+            return
+    t.raise_('%s not switched to a slave' % slave_addr)
+
+
+def _poll_check_slave(slave_host, slave_port, master_id, t,
+                      timeout=SLAVE_TIMEOUT):
+    wait_until(lambda t: _check_slave(slave_host, slave_port, master_id, t),
+               [t], timeout)
 
 
 def replicate(master_host, master_port, slave_host, slave_port):
@@ -385,11 +910,110 @@ def replicate(master_host, master_port, slave_host, slave_port):
         logging.debug('Ask `cluster replicate` Rsp %s', m)
         if m.lower() != 'ok':
             t.raise_('Unexpected reply after REPCLIATE: %s' % m)
-        _check_slave(slave_host, slave_port, master_conn)
+        _poll_check_slave(slave_host, slave_port, myid, master_conn)
         logging.info('Instance at %s:%d set as replica to %s', slave_host,
                      slave_port, myid)
 
 
+def _place_replicas(masters, slaves, free_addrs, replicas):
+    # Assign free nodes, a list of (HOST, PORT) tuples, to masters until each
+    #   has `replicas` slaves, counting existing `slaves`; masters having
+    #   the fewest slaves are served first. Each takes the free node best by
+    #   not being on the host of the master, then not on a host of its other
+    #   slaves, then on the host carrying the fewest slaves.
+    slave_hosts = {m.node_id: [] for m in masters}
+    host_slaves = {}
+    for s in slaves:
+        if s.master_id in slave_hosts:
+            slave_hosts[s.master_id].append(s.host)
+        host_slaves[s.host] = host_slaves.get(s.host, 0) + 1
+
+    free_addrs = list(free_addrs)
+    result = []
+    while free_addrs:
+        wanting = [
+            m for m in masters if len(slave_hosts[m.node_id]) < replicas
+        ]
+        if not wanting:
+            break
+        master = min(wanting, key=lambda m: len(slave_hosts[m.node_id]))
+        hosts = slave_hosts[master.node_id]
+        addr = min(
+            free_addrs,
+            key=lambda a: (a[0] == master.host, a[0] in hosts,
+                           host_slaves.get(a[0], 0)))
+        if addr[0] == master.host:
+            logging.warning('Replica %s:%d is on the same host as its master'
+                            ' %s', addr[0], addr[1], master.addr())
+        free_addrs.remove(addr)
+        hosts.append(addr[0])
+        host_slaves[addr[0]] = host_slaves.get(addr[0], 0) + 1
+        result.append((addr, master))
+    return result
+
+
+# Add free nodes of `slave_list`, a list of (HOST, PORT) tuples, as slaves
+#   until each master holding slots in the cluster has `replicas` slaves,
+#   spreading them over hosts by `_place_replicas`. All nodes are joined,
+#   set as replicas and verified concurrently. Return a list of
+#   ((HOST, PORT), master node) for the nodes set as slaves.
+def replicate_many(host, port, slave_list, replicas=1):
+    nodes = []
+    conns = {}
+
+    def check(addr):
+        t = conns[addr] = Connection(*addr)
+        _ensure_cluster_status_unset(t)
+
+    def join(addr):
+        t = conns[addr]
+        m = t.execute('cluster', 'meet', host, port)
+        logging.debug('Ask `cluster meet` Rsp %s', m)
+        if m.lower() != 'ok':
+            t.raise_('Unexpected reply after MEET: %s' % m)
+
+    def set_replica(item):
+        addr, master = item
+        t = conns[addr]
+        m = t.execute('cluster', 'replicate', master.node_id)
+        logging.debug('Ask `cluster replicate` Rsp %s', m)
+        if m.lower() != 'ok':
+            t.raise_('Unexpected reply after REPLICATE: %s' % m)
+
+    def verify(master):
+        for addr, m in placement:
+            if m is master:
+                _poll_check_slave(addr[0], addr[1], master.node_id,
+                                  master.get_conn())
+
+    try:
+        with Connection(host, port) as conn:
+            _ensure_cluster_status_set(conn)
+            nodes = _list_nodes(conn, filter_func=_filter_not_failed)[0]
+        masters = [n for n in nodes if n.master and n.assigned_slots]
+        placement = _place_replicas(masters, [n for n in nodes if n.slave],
+                                    sorted(set(slave_list),
+                                           key=slave_list.index), replicas)
+        if len(placement) == 0:
+            logging.info('No replica to set')
+            return placement
+
+        addrs = [addr for addr, _ in placement]
+        pmap(check, addrs)
+        pmap(join, addrs)
+        _poll_check_known([conns[a] for a in addrs],
+                          [m.node_id for m in masters])
+        pmap(set_replica, placement)
+        pmap(verify, masters)
+        logging.info('%d instances set as replicas', len(placement))
+        return placement
+    finally:
+        for t in conns.values():
+            t.close()
+        for n in nodes:
+            n.close()
+
+
 def _alive_master(node):
     return node.master and not node.fail
 
@@ -409,8 +1033,10 @@ def _filter_not_failed_master(node):
 def _list_nodes(conn, default_host=None, filter_func=lambda node: True):
     m = conn.send_raw(CMD_CLUSTER_NODES)
     logging.debug('Ask `cluster nodes` Rsp %s', m)
-    default_host = default_host or conn.host
+    return _parse_nodes(m, default_host or conn.host, filter_func)
+
 
+def _parse_nodes(m, default_host, filter_func=lambda node: True):
     nodes = []
     myself = None
     for node_info in m.split('\n'):
@@ -441,7 +1067,27 @@ def list_masters(host, port, default_host=None):
         return _list_masters(t, default_host or host)
 
 
-def migrate_slots(src_host, src_port, dst_host, dst_port, slots):
+# Sum up `slot_counts`, the numbers of keys in each slot like from
+#   `redistrib.keyslot.count_slots`, by the masters owning the slots. Return
+#   [(master, number of keys)], and the number of keys in unassigned slots.
+def count_keys_by_master(host, port, slot_counts):
+    masters = list_nodes(host, port, filter_func=_filter_master)[0]
+    result = []
+    unassigned = sum(slot_counts)
+    for m in sorted(masters, key=lambda m: (m.host, m.port)):
+        keys = sum(slot_counts[s] for s in m.assigned_slots)
+        unassigned -= keys
+        result.append((m, keys))
+    return result, unassigned
+
+
+def migrate_slots(src_host,
+                  src_port,
+                  dst_host,
+                  dst_port,
+                  slots,
+                  window=1,
+                  replace=False):
     if src_host == dst_host and src_port == dst_port:
         raise ValueError('Same node')
     with Connection(src_host, src_port) as t:
@@ -455,7 +1101,8 @@ def migrate_slots(src_host, src_port, dst_host, dst_port, slots):
     try:
         for n in nodes:
             if n.host == dst_host and n.port == dst_port:
-                return _migr_slots(myself, n, slots, nodes)
+                return _migr_slots(
+                    myself, n, slots, nodes, window, replace=replace)
         raise ValueError('Two nodes are not in the same cluster')
     finally:
         for n in nodes:
@@ -486,6 +1133,8 @@ def rescue_cluster(host, port, subst_host, subst_port, max_slots=1024):
         logging.debug('Ask `cluster meet` Rsp %s', m)
         if m.lower() != 'ok':
             conn_subst.raise_('Unexpected reply after MEET: %s' % m)
+        _poll_check_known([n.get_conn() for n in nodes],
+                          [node_subst.node_id])
 
         _add_slots(conn_subst, list(failed_slots), max_slots)
         for slot in failed_slots:
@@ -494,9 +1143,7 @@ def rescue_cluster(host, port, subst_host, subst_port, max_slots=1024):
                                             node_subst.node_id)
                 if m.lower() != 'ok':
                     conn_subst.raise_('Unexpected reply after SETSLOT: %s' % m)
-        _poll_check_status(conn_subst)
-        for node in nodes:
-            _poll_check_status(node.get_conn())
+        _poll_check_status([conn_subst] + [n.get_conn() for n in nodes])
         logging.info('Instance at %s:%d serves %d slots to rescue the cluster',
                      subst_host, subst_port, len(failed_slots))
     finally:
@@ -505,7 +1152,37 @@ def rescue_cluster(host, port, subst_host, subst_port, max_slots=1024):
             node.close()
 
 
-def execute(host, port, master_only, slave_only, commands):
+# Call `func` on each of `nodes`, on at most `concurrency` nodes at the same
+#   time, and return a list of {node, result, exception} in the order of the
+#   nodes; connections of the nodes are closed after the call
+def _execute_each(nodes, func, concurrency=DEFAULT_CONCURRENCY):
+    def execute_on(n):
+        r = None
+        exc = None
+        try:
+            r = func(n)
+        except Exception as e:
+            exc = e
+        finally:
+            n.close()
+        return {
+            'node': n,
+            'result': r,
+            'exception': exc,
+        }
+
+    return pmap(execute_on, nodes, concurrency)
+
+
+# Send a command to the nodes of the cluster of HOST:PORT, to at most
+#   `concurrency` nodes at the same time, and return a list of
+#   {node, result, exception} in the order of the nodes
+def execute(host,
+            port,
+            master_only,
+            slave_only,
+            commands,
+            concurrency=DEFAULT_CONCURRENCY):
     with Connection(host, port) as c:
         filter_func = lambda n: True
         if master_only:
@@ -513,18 +1190,266 @@ def execute(host, port, master_only, slave_only, commands):
         elif slave_only:
             filter_func = lambda n: n.slave
         nodes = _list_nodes(c, filter_func=filter_func)[0]
+    return _execute_each(nodes, lambda n: n.get_conn().execute(*commands),
+                         concurrency)
+
 
-        result = []
+def _fetch_view(node):
+    try:
+        m, info = node.get_conn().execute_bulk([('cluster', 'nodes'),
+                                                ('cluster', 'info')])
+    except (IOError, hiredis.ReplyError) as e:
+        return None, None, e
+    logging.debug('Ask `cluster nodes` Rsp %s', m)
+    view = _parse_nodes(m, node.host)[0]
+    return view, PAT_CLUSTER_STATE.findall(info)[0], None
+
+
+def _diff_slot_owners(views):
+    # views holding exactly the same slots map are grouped together,
+    #   and only slots of the different groups are compared one by one
+    groups = {}
+    for viewer, view in views:
+        signature = tuple(
+            sorted((n.node_id, tuple(n.assigned_slots)) for n in view
+                   if n.master and n.assigned_slots))
+        groups.setdefault(signature, []).append(viewer.addr())
+
+    owners = []
+    for signature, viewers in six.iteritems(groups):
+        slot_owner = [None] * SLOT_COUNT
+        for node_id, slots in signature:
+            for slot in slots:
+                slot_owner[slot] = node_id
+        owners.append((slot_owner, viewers))
+
+    uncovered = [
+        slot for slot in range(SLOT_COUNT)
+        if all(slot_owner[slot] is None for slot_owner, _ in owners)
+    ]
+    disagreements = []
+    if len(owners) > 1:
+        last = None
+        for slot in range(SLOT_COUNT):
+            seen = {}
+            for slot_owner, viewers in owners:
+                seen.setdefault(slot_owner[slot], []).extend(viewers)
+            if len(seen) == 1:
+                last = None
+            elif last is not None and last[2] == seen:
+                last[1] = slot
+            else:
+                last = [slot, slot, seen]
+                disagreements.append(last)
+    return [tuple(d) for d in disagreements], uncovered
+
+
+def _diff_node_views(views):
+    seen = {}
+    for viewer, view in views:
+        for n in view:
+            s = seen.setdefault(n.node_id, {
+                'flags': {},
+                'master_id': {},
+                'config_epoch': {},
+                'viewers': set(),
+            })
+            flags = ','.join(sorted(f for f in n.flags if f != 'myself'))
+            s['flags'].setdefault(flags, []).append(viewer.addr())
+            s['master_id'].setdefault(n.master_id, []).append(viewer.addr())
+            s['config_epoch'].setdefault(n.config_epoch,
+                                         []).append(viewer.addr())
+            s['viewers'].add(viewer.addr())
+
+    all_viewers = set(viewer.addr() for viewer, _ in views)
+    disagreements = []
+    for node_id, s in sorted(six.iteritems(seen)):
+        for attr in ['flags', 'master_id', 'config_epoch']:
+            if len(s[attr]) > 1:
+                disagreements.append((node_id, attr, s[attr]))
+        unknown_by = all_viewers - s['viewers']
+        if unknown_by:
+            disagreements.append((node_id, 'unknown', sorted(unknown_by)))
+    return disagreements
+
+
+def _check_views(views):
+    slots_disagree, uncovered = _diff_slot_owners(views)
+    open_slots = []
+    for viewer, view in views:
+        for n in view:
+            if not n.myself:
+                continue
+            for slot, node_id in sorted(six.iteritems(n.migrating)):
+                open_slots.append((viewer, slot, 'migrating', node_id))
+            for slot, node_id in sorted(six.iteritems(n.importing)):
+                open_slots.append((viewer, slot, 'importing', node_id))
+    return {
+        'slots_disagree': slots_disagree,
+        'nodes_disagree': _diff_node_views(views),
+        'open_slots': open_slots,
+        'uncovered_slots': _slots_to_ranges(uncovered),
+    }
+
+
+def check_cluster(host, port):
+    with Connection(host, port) as t:
+        nodes = _list_nodes(t, default_host=host)[0]
+    try:
+        fetched = pmap(_fetch_view, nodes)
+    finally:
         for n in nodes:
-            r = None
-            exc = None
+            n.close()
+
+    views = []
+    result = {'nodes': nodes, 'unreachable': [], 'not_ok': []}
+    for node, (view, state, exc) in zip(nodes, fetched):
+        if exc is not None:
+            result['unreachable'].append((node, exc))
+            continue
+        views.append((node, view))
+        if state != 'ok':
+            result['not_ok'].append((node, state))
+    result.update(_check_views(views))
+    return result
+
+
+def _master_slot_stats(node, memory_samples):
+    conn = node.get_conn()
+    slots = node.assigned_slots
+    counts = conn.execute_stream(
+        (('cluster', 'countkeysinslot', slot) for slot in slots),
+        STATS_PIPELINE_SIZE)
+    keys = dict(zip(slots, counts))
+    memory = {}
+    if memory_samples > 0:
+        # estimate memory usage of a slot by the average of sampled keys
+        memory = dict.fromkeys(slots, 0)
+        slots = [slot for slot in slots if keys[slot] > 0]
+        samples = list(
+            conn.execute_stream((('cluster', 'getkeysinslot', slot,
+                                  memory_samples) for slot in slots),
+                                STATS_PIPELINE_SIZE))
+        first = next((sample[0] for sample in samples if sample), None)
+        if first is None:
+            return {'node': node, 'keys': keys, 'memory': memory}
+        try:
+            conn.execute('memory', 'usage', first)
+        except hiredis.ReplyError as e:
+            # MEMORY USAGE is available since Redis 4.0
+            if 'unknown command' not in str(e).lower():
+                raise
+            logging.warning('%s:%d does not support MEMORY USAGE: %s',
+                            node.host, node.port, e)
+            return {'node': node, 'keys': keys, 'memory': None}
+        usages = conn.execute_stream(
+            (('memory', 'usage', k) for sample in samples for k in sample),
+            STATS_PIPELINE_SIZE)
+        for slot, sample in zip(slots, samples):
+            usage = [next(usages) for _ in sample]
+            usage = [u for u in usage if u is not None]
+            if usage:
+                memory[slot] = sum(usage) * keys[slot] // len(usage)
+    return {'node': node, 'keys': keys, 'memory': memory}
+
+
+def slot_stats(host, port, memory_samples=0):
+    with Connection(host, port) as t:
+        masters = _list_nodes(
+            t, default_host=host, filter_func=_filter_not_failed_master)[0]
+    try:
+        return pmap(lambda n: _master_slot_stats(n, memory_samples), masters)
+    finally:
+        for n in masters:
+            n.close()
+
+
+def _parse_info(m):
+    info = {}
+    for line in m.split('\n'):
+        line = line.strip()
+        if len(line) == 0 or line[0] == '#' or ':' not in line:
+            continue
+        key, value = line.split(':', 1)
+        try:
+            info[key] = int(value)
+        except ValueError:
             try:
-                r = n.get_conn().execute(*commands)
-            except Exception as e:
-                exc = e
-            result.append({
-                'node': n,
-                'result': r,
-                'exception': exc,
-            })
-        return result
+                info[key] = float(value)
+            except ValueError:
+                info[key] = value
+    return info
+
+
+def _poll_node_info(conn):
+    replies = conn.execute_bulk([('info', 'stats'), ('info', 'memory'),
+                                 ('info', 'keyspace'), ('cluster', 'info')])
+    info = {}
+    for m in replies:
+        info.update(_parse_info(m))
+    info['time'] = time.time()
+    return info
+
+
+def _info_delta(info, last):
+    r = {
+        'ops_per_sec': None,
+        'input_per_sec': None,
+        'output_per_sec': None,
+        'used_memory': info.get('used_memory'),
+        'used_memory_delta': None,
+    }
+    if last is None:
+        return r
+    elapsed = info['time'] - last['time']
+    if elapsed > 0:
+        for key, field in [('ops_per_sec', 'total_commands_processed'),
+                           ('input_per_sec', 'total_net_input_bytes'),
+                           ('output_per_sec', 'total_net_output_bytes')]:
+            r[key] = (info[field] - last[field]) / elapsed
+    r['used_memory_delta'] = info['used_memory'] - last['used_memory']
+    return r
+
+
+# Poll `INFO stats`, `INFO memory` and `CLUSTER INFO` of all nodes
+#   concurrently every `interval` seconds and yield a list of dicts for each
+#   node, containing the node itself, the INFO fields, the changes since the
+#   last poll, and the exception if it fails to poll the node.
+def watch(host, port, interval=1, count=None):
+    conns = {}
+    last_infos = {}
+    polls = 0
+    try:
+        with Connection(host, port) as t:
+            while count is None or polls < count:
+                start = time.time()
+                nodes = _list_nodes(t, default_host=host)[0]
+
+                def poll(node):
+                    addr = node.addr()
+                    try:
+                        if addr not in conns:
+                            conns[addr] = Connection(node.host, node.port)
+                        info = _poll_node_info(conns[addr])
+                    except (IOError, hiredis.ReplyError) as e:
+                        conn = conns.pop(addr, None)
+                        if conn is not None:
+                            conn.close()
+                        last_infos.pop(addr, None)
+                        return {'node': node, 'info': None, 'exception': e}
+                    r = _info_delta(info, last_infos.get(addr))
+                    last_infos[addr] = info
+                    r.update({'node': node, 'info': info, 'exception': None})
+                    return r
+
+                yield pmap(poll, nodes)
+                polls += 1
+                addrs = set(n.addr() for n in nodes)
+                for addr in [a for a in conns if a not in addrs]:
+                    conns.pop(addr).close()
+                    last_infos.pop(addr, None)
+                if count is None or polls < count:
+                    time.sleep(max(0, interval - (time.time() - start)))
+    finally:
+        for conn in six.itervalues(conns):
+            conn.close()
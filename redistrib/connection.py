@@ -1,11 +1,14 @@
 import logging
 import socket
+from collections import deque
 from functools import wraps
+from itertools import islice
 
 import hiredis
 import six
 from six import b
 
+from . import latency
 from .exceptions import RedisIOError, RedisStatusError
 
 SYM_STAR = b('*')
@@ -15,6 +18,12 @@ EMPTY = b('')
 
 ENCODING = 'utf-8'
 
+# bytes of the buffer each connection receives replies into
+RECV_BUFFER_SIZE = 65536
+
+# commands sent and not yet replied in `Connection.execute_stream`
+PIPELINE_IN_FLIGHT = 1024
+
 
 def encode(value):
     if isinstance(value, six.binary_type):
@@ -31,22 +40,27 @@ def encode(value):
 
 
 def squash_commands(commands):
+    # pieces are joined once into chunks of about 6000 bytes, big arguments
+    #   are chunks by themselves
     output = []
-    buf = EMPTY
+    pieces = []
+    size = 0
 
     for c in commands:
-        buf = EMPTY.join((buf, SYM_STAR, b(str(len(c))), SYM_CRLF))
+        pieces.extend((SYM_STAR, b(str(len(c))), SYM_CRLF))
 
         for arg in map(encode, c):
-            if len(buf) > 6000 or len(arg) > 6000:
-                output.append(
-                    EMPTY.join((buf, SYM_DOLLAR, b(str(len(arg))), SYM_CRLF)))
+            arg_len = b(str(len(arg)))
+            if size > 6000 or len(arg) > 6000:
+                pieces.extend((SYM_DOLLAR, arg_len, SYM_CRLF))
+                output.append(EMPTY.join(pieces))
                 output.append(arg)
-                buf = SYM_CRLF
+                pieces = [SYM_CRLF]
+                size = 0
             else:
-                buf = EMPTY.join((buf, SYM_DOLLAR, b(str(len(arg))), SYM_CRLF,
-                                  arg, SYM_CRLF))
-    output.append(buf)
+                pieces.extend((SYM_DOLLAR, arg_len, SYM_CRLF, arg, SYM_CRLF))
+                size += len(arg) + len(arg_len) + 5
+    output.append(EMPTY.join(pieces))
     return output
 
 
@@ -59,6 +73,111 @@ CMD_CLUSTER_NODES = pack_command('cluster', 'nodes')
 CMD_CLUSTER_INFO = pack_command('cluster', 'info')
 
 
+# hosts whose nodes are reached over Unix sockets if `Transport` is given
+#   `unix_socket`, besides the addresses of the interfaces of this machine
+LOCAL_HOSTS = {'127.0.0.1', 'localhost', '::1'}
+
+# host -> whether it is an address of this machine
+_local_addresses = {}
+
+
+def is_local_host(host):
+    # a host is taken as one of this machine if a socket could be bound to
+    #   it, which covers LAN addresses announced by nodes in CLUSTER NODES
+    if host in LOCAL_HOSTS:
+        return True
+    local = _local_addresses.get(host)
+    if local is None:
+        local = _local_addresses[host] = _bindable(host)
+    return local
+
+
+def _bindable(host):
+    try:
+        addrs = socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM)
+    except socket.gaierror:
+        return False
+    for family, socktype, proto, _, addr in addrs:
+        sock = socket.socket(family, socktype, proto)
+        try:
+            sock.bind((addr[0], 0) + tuple(addr[2:]))
+            return True
+        except IOError:
+            pass
+        finally:
+            sock.close()
+    return False
+
+
+class Transport(object):
+    # How `Connection` reaches a node. A node on this machine, on one of
+    #   `LOCAL_HOSTS` or an address of its interfaces, is reached over a Unix
+    #   socket if `unix_socket` is given, which is a path
+    #   template like "/var/run/redis/{port}.sock" formatted with the host and
+    #   the port of the node, or a function taking the host and the port and
+    #   returning the path (or None to use TCP). Other nodes are reached over
+    #   TCP, with TCP_NODELAY and SO_KEEPALIVE set as `nodelay` and
+    #   `keepalive`, and SO_SNDBUF and SO_RCVBUF set to `sndbuf` and `rcvbuf`
+    #   bytes if given.
+    def __init__(self,
+                 unix_socket=None,
+                 nodelay=True,
+                 keepalive=False,
+                 sndbuf=None,
+                 rcvbuf=None):
+        self.unix_socket = unix_socket
+        self.nodelay = nodelay
+        self.keepalive = keepalive
+        self.sndbuf = sndbuf
+        self.rcvbuf = rcvbuf
+        # hosts logged as reached over TCP in spite of `unix_socket`
+        self.tcp_hosts = set()
+
+    def unix_socket_path(self, host, port):
+        if self.unix_socket is None:
+            return None
+        if callable(self.unix_socket):
+            return self.unix_socket(host, port)
+        if not is_local_host(host):
+            if host not in self.tcp_hosts:
+                self.tcp_hosts.add(host)
+                logging.info('%s is not an address of this machine; its'
+                             ' nodes are reached over TCP', host)
+            return None
+        return self.unix_socket.format(host=host, port=port)
+
+    def connect(self, host, port, timeout):
+        path = self.unix_socket_path(host, port)
+        if path is not None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address = path
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            address = (host, port)
+            if self.nodelay:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.keepalive:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if self.sndbuf:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF,
+                                self.sndbuf)
+            if self.rcvbuf:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                                self.rcvbuf)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(address)
+        except IOError:
+            sock.close()
+            raise
+        return sock
+
+
+# the `Transport` of connections created without one, which are all the
+#   connections created by `redistrib.command` APIs
+default_transport = Transport()
+
+
 def _wrap_sock_op(f):
     @wraps(f)
     def g(conn, *args, **kwargs):
@@ -71,70 +190,149 @@ def _wrap_sock_op(f):
 
 
 class Connection(object):
-    def __init__(self, host, port, timeout=5):
+    # Replies are decoded as UTF-8 strings by the hiredis reader, or left as
+    #   bytes if `decode_replies` is not set, which suits binary keys and
+    #   saves the decoding.
+    def __init__(self,
+                 host,
+                 port,
+                 timeout=5,
+                 transport=None,
+                 decode_replies=True):
         self.host = host
         self.port = port
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.reader = hiredis.Reader()
-        self.last_raw_message = EMPTY
+        self.transport = transport or default_transport
+        self.sock = None
+        if decode_replies:
+            self.reader = hiredis.Reader(encoding=ENCODING)
+        else:
+            self.reader = hiredis.Reader()
+        # replies are received into this buffer and fed to the reader from
+        #   it, instead of a new bytes object for each read
+        self.buf = bytearray(RECV_BUFFER_SIZE)
 
-        self.sock.settimeout(timeout)
         logging.debug('Connect to %s:%d', host, port)
-        self._conn()
+        self._conn(timeout)
 
     @_wrap_sock_op
-    def _conn(self):
-        self.sock.connect((self.host, self.port))
+    def _conn(self, timeout):
+        self.sock = self.transport.connect(self.host, self.port, timeout)
+
+    def _feed(self):
+        n = self.sock.recv_into(self.buf)
+        if n == 0:
+            raise IOError('Connection closed by the server')
+        self.reader.feed(self.buf, 0, n)
 
     @_wrap_sock_op
     def _recv(self):
         while True:
-            m = self.sock.recv(16384)
-            self.last_raw_message += m
-            self.reader.feed(m)
+            self._feed()
             r = self.reader.gets()
             # From hiredis.Reader : https://github.com/redis/hiredis-py#usage
             # > When the buffer does not contain a full reply, gets returns False.
-            if r != False:
+            if r is not False:
                 return r
 
     @_wrap_sock_op
     def _recv_multi(self, n):
+        # replies after the first `n` are left in the reader
         resp = []
         while len(resp) < n:
-            m = self.sock.recv(16384)
-            self.last_raw_message += m
-            self.reader.feed(m)
-
             r = self.reader.gets()
             # See the previous comment
-            while r != False:
+            if r is False:
+                self._feed()
+            else:
                 resp.append(r)
-                r = self.reader.gets()
         return resp
 
+    @_wrap_sock_op
+    def _send(self, command):
+        for c in command:
+            self.sock.sendall(c)
+
     @_wrap_sock_op
     def send_raw(self, command, recv=None):
+        stats = latency.stats
+        if stats is not None:
+            start = latency.now()
+        pipeline = recv is not None
         recv = recv or self._recv
-        for c in command:
-            self.sock.send(c)
+        self._send(command)
         r = recv()
+        if stats is not None:
+            stats.record(
+                latency.command_name(command, pipeline),
+                '%s:%d' % (self.host, self.port),
+                latency.now() - start)
         if r is None:
             raise ValueError('No reply')
         if isinstance(r, hiredis.ReplyError):
             raise r
-
-        if isinstance(r, list):
-            return [i.decode(ENCODING) for i in r]
-        return r.decode(ENCODING)
+        return r
 
     def execute(self, *args):
         return self.send_raw(pack_command(*args))
 
-    def execute_bulk(self, cmd_list):
-        return self.send_raw(
+    # an error reply is raised if `raise_error` is set, otherwise it is left
+    #   in the result list as a `hiredis.ReplyError`
+    def execute_bulk(self, cmd_list, raise_error=True):
+        r = self.send_raw(
             squash_commands(cmd_list),
             recv=lambda: self._recv_multi(len(cmd_list)))
+        if raise_error:
+            for i in r:
+                if isinstance(i, hiredis.ReplyError):
+                    raise i
+        return r
+
+    # Send commands from the iterable `commands` in batches, keeping at most
+    #   `in_flight` commands unreplied, and yield the replies in order. If
+    #   `raise_error` is set, the first error reply is raised after the
+    #   replies in flight are read, otherwise it is yielded as a
+    #   `hiredis.ReplyError`. The generator should be run to the end or
+    #   closed, which reads the replies in flight as well.
+    def execute_stream(self, commands, in_flight=PIPELINE_IN_FLIGHT,
+                       raise_error=True):
+        commands = iter(commands)
+        batch_size = max(1, in_flight // 2)
+        # (command count, start time) of batches sent
+        batches = deque()
+        unreplied = 0
+        stats = latency.stats
+        name = None
+        try:
+            while True:
+                while unreplied + batch_size <= in_flight or not batches:
+                    batch = list(islice(commands, batch_size))
+                    if not batch:
+                        break
+                    if name is None and stats is not None:
+                        name = latency.command_name(
+                            pack_command(*batch[0]), True)
+                    start = None if stats is None else latency.now()
+                    self._send(squash_commands(batch))
+                    batches.append((len(batch), start))
+                    unreplied += len(batch)
+                if not batches:
+                    return
+                count, start = batches.popleft()
+                replies = self._recv_multi(count)
+                unreplied -= count
+                if start is not None:
+                    stats.record(
+                        name,
+                        '%s:%d' % (self.host, self.port),
+                        latency.now() - start)
+                for r in replies:
+                    if raise_error and isinstance(r, hiredis.ReplyError):
+                        raise r
+                    yield r
+        except (hiredis.ReplyError, GeneratorExit):
+            if unreplied:
+                self._recv_multi(unreplied)
+            raise
 
     def close(self):
         return self.sock.close()
@@ -1,9 +1,16 @@
+import functools
+import itertools
 import logging
+import sys
+import time
 
 import click
 from six.moves import range
 
-from . import __version__, command
+from . import __version__, command, connection, latency
+from .exceptions import RedisMigrateError
+from .keyslot import count_slots, key_slots
+from .parallel import DEFAULT_CONCURRENCY
 
 
 def _parse_host_port(addr):
@@ -11,10 +18,63 @@ def _parse_host_port(addr):
     return host, int(port)
 
 
+def _report_migrate_error(f):
+    # slots with keys failed to migrate are left migrating; print the keys
+    #   so that the cause could be cleared before running `fix`
+    @functools.wraps(f)
+    def g(*args, **kwargs):
+        try:
+            return f(*args, **kwargs)
+        except RedisMigrateError as e:
+            click.echo(str(e), err=True)
+            for slot, keys in sorted(e.failed_keys.items()):
+                for key, error in sorted(keys.items()):
+                    click.echo('slot %d key %r: %s' % (slot, key, error),
+                               err=True)
+            sys.exit(1)
+
+    return g
+
+
+def _print_latency_stats():
+    for line in latency.stats.summary():
+        click.echo(line, err=True)
+
+
 @click.group(help='Note: each `--xxxx-addr` argument in the following commands'
              ' is in the form of HOST:PORT')
-def cli():
-    pass
+@click.option(
+    '--stats',
+    is_flag=True,
+    help='Print round trip time of commands sent to Redis nodes at exit')
+@click.option(
+    '--unix-socket',
+    help='Path of Unix sockets to connect to nodes on this machine, by'
+    ' localhost or the address of any interface, in which {port} is replaced'
+    ' by the port of each node, like /var/run/redis/{port}.sock')
+@click.option(
+    '--tcp-nodelay/--no-tcp-nodelay',
+    default=True,
+    help='Set TCP_NODELAY on TCP connections (set by default)')
+@click.option(
+    '--tcp-keepalive',
+    is_flag=True,
+    help='Set SO_KEEPALIVE on TCP connections')
+@click.option(
+    '--socket-buffer',
+    type=int,
+    help='Bytes of send and receive buffers of TCP connections')
+@click.pass_context
+def cli(ctx, stats, unix_socket, tcp_nodelay, tcp_keepalive, socket_buffer):
+    if stats:
+        latency.enable()
+        ctx.call_on_close(_print_latency_stats)
+    connection.default_transport = connection.Transport(
+        unix_socket=unix_socket,
+        nodelay=tcp_nodelay,
+        keepalive=tcp_keepalive,
+        sndbuf=socket_buffer,
+        rcvbuf=socket_buffer)
 
 
 @cli.command(help='Create a cluster with several Redis nodes')
@@ -40,6 +100,28 @@ def add_node(existing_addr, new_addr):
     command.add_node(cluster_host, cluster_port, newin_host, newin_port)
 
 
+@cli.command(
+    'add-nodes',
+    help='Add several Redis nodes to a cluster as masters, and balance slots'
+    ' among all masters by a single plan')
+@click.option(
+    '--existing-addr',
+    required=True,
+    help='Address of any node in the cluster')
+@click.option(
+    '--window',
+    type=int,
+    default=1,
+    help='number of slots migrating at the same time between each pair of'
+    ' nodes (at most %d)' % command.MAX_MIGRATING_WINDOW)
+@click.argument('new_addrs', nargs=-1, required=True)
+@_report_migrate_error
+def add_nodes(existing_addr, window, new_addrs):
+    host, port = _parse_host_port(existing_addr)
+    command.join_many(host, port, [_parse_host_port(a) for a in new_addrs],
+                      window=window)
+
+
 @cli.command(help='Add a slave node to a master')
 @click.option('--master-addr', required=True, help='Address of the master')
 @click.option('--slave-addr', required=True, help='Address of the slave')
@@ -49,11 +131,55 @@ def replicate(master_addr, slave_addr):
     command.replicate(master_host, master_port, slave_host, slave_port)
 
 
+@cli.command(
+    'replicate-many',
+    help='Add free Redis nodes as slaves to masters holding slots in a'
+    ' cluster, spreading them over hosts')
+@click.option(
+    '--existing-addr',
+    required=True,
+    help='Address of any node in the cluster')
+@click.option(
+    '--replicas',
+    type=int,
+    default=1,
+    help='number of slaves each master should have')
+@click.argument('slave_addrs', nargs=-1, required=True)
+def replicate_many(existing_addr, replicas, slave_addrs):
+    host, port = _parse_host_port(existing_addr)
+    for addr, master in command.replicate_many(
+            host, port, [_parse_host_port(a) for a in slave_addrs], replicas):
+        click.echo('%s:%d -> %s' % (addr[0], addr[1], master.addr()))
+
+
 @cli.command(help='Remove a Redis node from a cluster')
 @click.option('--addr', required=True, help='Address of the node')
-def del_node(addr):
+@click.option(
+    '--window',
+    type=int,
+    default=1,
+    help='number of slots migrating at the same time to each node'
+    ' (at most %d)' % command.MAX_MIGRATING_WINDOW)
+@_report_migrate_error
+def del_node(addr, window):
     host, port = _parse_host_port(addr)
-    command.del_node(host, port)
+    command.del_node(host, port, window)
+
+
+@cli.command(
+    'del-nodes',
+    help='Remove several Redis nodes from a cluster, moving slots of leaving'
+    ' masters directly to the remaining masters')
+@click.option(
+    '--window',
+    type=int,
+    default=1,
+    help='number of slots migrating at the same time between each pair of'
+    ' nodes (at most %d)' % command.MAX_MIGRATING_WINDOW)
+@click.argument('addrs', nargs=-1, required=True)
+@_report_migrate_error
+def del_nodes(addrs, window):
+    command.del_many([_parse_host_port(a) for a in addrs], window)
 
 
 @cli.command(help='Shutdown a cluster. The cluster should have no more than'
@@ -71,9 +197,30 @@ def shutdown(addr, ignore_failed):
 
 @cli.command(help='Fix migrating status')
 @click.option('--addr', required=True, help='Address of the node')
-def fix(addr):
+@click.option(
+    '--cluster-wide',
+    is_flag=True,
+    default=False,
+    help='Fix slots migrating or importing on any node in the cluster,'
+    ' several at the same time')
+@click.option(
+    '--per-node',
+    type=int,
+    default=4,
+    help='with --cluster-wide, number of slots fixed at the same time on each'
+    ' node')
+@click.option(
+    '--replace',
+    is_flag=True,
+    default=False,
+    help='with --cluster-wide, overwrite keys existing in the target nodes')
+@_report_migrate_error
+def fix(addr, cluster_wide, per_node, replace):
     host, port = _parse_host_port(addr)
-    command.fix_migrating(host, port)
+    if cluster_wide:
+        command.fix_cluster_migrating(host, port, per_node, replace)
+    else:
+        command.fix_migrating(host, port)
 
 
 @cli.command(help='Add a Redis node to a broken cluster to undertake missing'
@@ -99,8 +246,20 @@ def rescue(existing_addr, new_addr, max_slots=1024):
     '--src-addr', required=True, help='Address of the migrating source')
 @click.option(
     '--dst-addr', required=True, help='Address of the migrating destination')
+@click.option(
+    '--window',
+    type=int,
+    default=1,
+    help='number of slots migrating at the same time (at most %d)' %
+    command.MAX_MIGRATING_WINDOW)
+@click.option(
+    '--replace',
+    is_flag=True,
+    default=False,
+    help='overwrite keys existing in the destination')
 @click.argument('slots_ranges', nargs=-1, required=True)
-def migrate(src_addr, dst_addr, slots_ranges):
+@_report_migrate_error
+def migrate(src_addr, dst_addr, slots_ranges, window, replace):
     src_host, src_port = _parse_host_port(src_addr)
     dst_host, dst_port = _parse_host_port(dst_addr)
 
@@ -112,7 +271,8 @@ def migrate(src_addr, dst_addr, slots_ranges):
         else:
             slots.append(int(rg))
 
-    command.migrate_slots(src_host, src_port, dst_host, dst_port, slots)
+    command.migrate_slots(src_host, src_port, dst_host, dst_port, slots,
+                          window, replace)
 
 
 def _format_master(node):
@@ -127,13 +287,9 @@ def _format_slave(node, master):
     return ' S %s %s %s' % (node.addr(), ','.join(node.flags), master.addr())
 
 
-@cli.command(help='List Redis nodes in a cluster')
-@click.option(
-    '--addr', required=True, help='Address of any node in the cluster')
-def list(addr):
-    host, port = _parse_host_port(addr)
+def _nodes_tree(nodes):
     id_map = {}
-    nodes = sorted(command.list_nodes(host, port)[0], key=lambda n: n.addr())
+    nodes = sorted(nodes, key=lambda n: n.addr())
     master_count = 0
     fail_count = 0
     for node in nodes:
@@ -147,6 +303,16 @@ def list(addr):
                 id_map[node.master_id].slaves.append(node)
         else:
             master_count += 1
+    return nodes, master_count, fail_count
+
+
+@cli.command(help='List Redis nodes in a cluster')
+@click.option(
+    '--addr', required=True, help='Address of any node in the cluster')
+def list(addr):
+    host, port = _parse_host_port(addr)
+    nodes, master_count, fail_count = _nodes_tree(
+        command.list_nodes(host, port)[0])
     print('Total %d nodes, %d masters, %d fail' % (len(nodes), master_count,
                                                    fail_count))
     for node in nodes:
@@ -156,6 +322,282 @@ def list(addr):
                 print(_format_slave(slave, node))
 
 
+# number of keys read and hashed at a time by `keyslot`
+KEYSLOT_BATCH = 65536
+
+
+def _read_keys(key_file):
+    while True:
+        batch = [
+            line.rstrip(b'\r\n')
+            for line in itertools.islice(key_file, KEYSLOT_BATCH)
+        ]
+        if not batch:
+            return
+        yield batch
+
+
+@cli.command(help='Compute the hash slots of keys, which are the arguments,'
+             ' or read from a file (or stdin) one per line')
+@click.option(
+    '--file',
+    'key_file',
+    type=click.File('rb'),
+    default='-',
+    help='File to read keys from if no key is given as arguments;'
+    ' - for stdin (by default)')
+@click.option(
+    '--by',
+    type=click.Choice(['key', 'slot', 'master']),
+    default='key',
+    help='Output the slot of each key (by default), or the number of keys in'
+    ' each slot, or in slots of each master')
+@click.option(
+    '--addr', help='Address of any node in the cluster, required by'
+    ' --by master')
+@click.option(
+    '--no-numpy',
+    is_flag=True,
+    help='Do not hash keys by numpy even if it is installed')
+@click.argument('keys', nargs=-1)
+def keyslot(key_file, by, addr, no_numpy, keys):
+    if by == 'master' and addr is None:
+        raise click.UsageError('--by master requires --addr')
+    if keys:
+        batches = [[k.encode('utf-8') for k in keys]]
+    else:
+        batches = _read_keys(key_file)
+    use_numpy = False if no_numpy else None
+    out = click.get_binary_stream('stdout')
+    counts = None
+    for batch in batches:
+        slots = key_slots(batch, use_numpy)
+        if by == 'key':
+            out.write(b''.join(
+                b'%d %s\n' % (slot, key) for slot, key in zip(slots, batch)))
+        else:
+            counts = count_slots(slots, counts)
+    if by == 'key' or counts is None:
+        return
+    if by == 'slot':
+        for slot, n in enumerate(counts):
+            if n != 0:
+                print('%d %d' % (slot, n))
+        return
+    host, port = _parse_host_port(addr)
+    masters, unassigned = command.count_keys_by_master(host, port, counts)
+    total = sum(counts)
+    for m, n in masters:
+        print('%s %s %d %.2f%%' % (m.addr(), m.node_id, n, 100.0 * n / total))
+    if unassigned:
+        print('unassigned - %d %.2f%%' % (unassigned,
+                                          100.0 * unassigned / total))
+
+
+def _format_bytes(n):
+    for unit in ['B', 'K', 'M', 'G']:
+        if abs(n) < 1024:
+            return '%.1f%s' % (n, unit)
+        n /= 1024.0
+    return '%.1fT' % n
+
+
+def _format_load(r):
+    if r['exception'] is not None:
+        return '  -%s' % r['exception']
+    s = '  mem %s' % _format_bytes(r['used_memory'])
+    if r['ops_per_sec'] is None:
+        return s
+    return s + ' (%s%s) ops/s %d in %s/s out %s/s' % (
+        '-' if r['used_memory_delta'] < 0 else '+',
+        _format_bytes(abs(r['used_memory_delta'])), r['ops_per_sec'],
+        _format_bytes(r['input_per_sec']), _format_bytes(r['output_per_sec']))
+
+
+@cli.command(help='Poll load of each Redis node in a cluster repeatedly,'
+             ' and show it in the same layout as the `list` command')
+@click.option(
+    '--addr', required=True, help='Address of any node in the cluster')
+@click.option(
+    '--interval', type=float, default=1, help='seconds between two polls')
+@click.option(
+    '--count',
+    type=int,
+    default=None,
+    help='exit after this number of polls; run until interrupted by default')
+def watch(addr, interval, count):
+    host, port = _parse_host_port(addr)
+    try:
+        for result in command.watch(host, port, interval, count):
+            loads = {r['node'].node_id: r for r in result}
+            nodes, master_count, fail_count = _nodes_tree(
+                [r['node'] for r in result])
+            click.clear()
+            print('%s Total %d nodes, %d masters, %d fail' %
+                  (time.strftime('%H:%M:%S'), len(nodes), master_count,
+                   fail_count))
+            for node in nodes:
+                if node.master:
+                    print(_format_master(node) + _format_load(
+                        loads[node.node_id]))
+                    for slave in node.slaves:
+                        print(
+                            _format_slave(slave, node) + _format_load(
+                                loads[slave.node_id]))
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.command(help='Serve Prometheus metrics of topology and load of a'
+             ' cluster over HTTP at /metrics')
+@click.option(
+    '--addr', required=True, help='Address of any node in the cluster')
+@click.option(
+    '--listen',
+    default='127.0.0.1:9479',
+    help='Address to serve HTTP at, in the form of HOST:PORT')
+@click.option(
+    '--budget',
+    type=float,
+    default=5,
+    help='seconds to wait for the topology and INFO of all nodes in a'
+    ' scrape')
+@click.option(
+    '--topology-ttl',
+    type=float,
+    default=60,
+    help='seconds to cache the topology of the cluster')
+def exporter(addr, listen, budget, topology_ttl):
+    from .exporter import start_exporter
+    host, port = _parse_host_port(addr)
+    listen_host, listen_port = _parse_host_port(listen)
+    server = start_exporter(host, port, listen_host, listen_port, budget,
+                            topology_ttl)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        server.collector.close()
+
+
+def _format_slots_range(begin, end):
+    return str(begin) if begin == end else '%d-%d' % (begin, end)
+
+
+def _format_seen_by(seen):
+    return '; '.join('%s (seen by %s)' % (k, ','.join(v))
+                     for k, v in sorted(seen.items(), key=str))
+
+
+@cli.command(help='Check whether all nodes in a cluster agree on slots, flags'
+             ' and epochs of each other, and whether there are open or'
+             ' uncovered slots')
+@click.option(
+    '--addr', required=True, help='Address of any node in the cluster')
+def check(addr):
+    host, port = _parse_host_port(addr)
+    r = command.check_cluster(host, port)
+    print('Checked %d nodes' % len(r['nodes']))
+    problems = 0
+    for node, exc in r['unreachable']:
+        problems += 1
+        print('Unreachable %s - %s' % (node.addr(), exc))
+    for node, state in r['not_ok']:
+        problems += 1
+        print('State %s %s' % (node.addr(), state))
+    for begin, end, seen in r['slots_disagree']:
+        problems += 1
+        print('Slots %s owned by %s' % (_format_slots_range(begin, end),
+                                        _format_seen_by(seen)))
+    for node_id, attr, seen in r['nodes_disagree']:
+        problems += 1
+        if attr == 'unknown':
+            print('Node %s unknown by %s' % (node_id, ','.join(seen)))
+        else:
+            print('Node %s %s %s' % (node_id, attr, _format_seen_by(seen)))
+    for node, slot, direction, node_id in r['open_slots']:
+        problems += 1
+        print('Open slot %d %s %s %s %s' %
+              (slot, node.addr(), direction,
+               'to' if direction == 'migrating' else 'from', node_id))
+    if r['uncovered_slots']:
+        problems += 1
+        print('Uncovered slots %s' % ' '.join(
+            _format_slots_range(b, e) for b, e in r['uncovered_slots']))
+    if problems == 0:
+        print('OK')
+    else:
+        print('%d problems found' % problems)
+        sys.exit(1)
+
+
+@cli.command(
+    'slot-stats',
+    help='Count keys in each slot, and optionally estimate the memory usage'
+    ' of each slot by sampling keys in it')
+@click.option(
+    '--addr', required=True, help='Address of any node in the cluster')
+@click.option(
+    '--memory-samples',
+    type=int,
+    default=0,
+    help='number of keys sampled by MEMORY USAGE in each slot;'
+    ' 0 to skip memory estimation')
+@click.option(
+    '--top',
+    type=int,
+    default=20,
+    help='only output this number of slots holding the most keys (or'
+    ' memory); 0 to output all slots')
+@click.option('--json', 'as_json', is_flag=True, help='Output in JSON')
+def slot_stats(addr, memory_samples, top, as_json):
+    host, port = _parse_host_port(addr)
+    stats = command.slot_stats(host, port, memory_samples)
+    unsupported = [s['node'].addr() for s in stats if s['memory'] is None]
+    if unsupported:
+        click.echo('Memory is not estimated: MEMORY USAGE requires Redis 4.0'
+                   ' or later, which %s is not' % ', '.join(sorted(
+                       unsupported)), err=True)
+    estimated = memory_samples > 0 and not unsupported
+    masters = []
+    slots = []
+    for s in sorted(stats, key=lambda s: s['node'].addr()):
+        node = s['node']
+        masters.append({
+            'addr': node.addr(),
+            'node_id': node.node_id,
+            'slots': len(s['keys']),
+            'keys': sum(s['keys'].values()),
+            'memory': sum(s['memory'].values()) if estimated else None,
+        })
+        for slot, keys in s['keys'].items():
+            slots.append({
+                'slot': slot,
+                'master': node.addr(),
+                'keys': keys,
+                'memory': s['memory'].get(slot) if estimated else None,
+            })
+    slots.sort(key=lambda s: (s['memory'], s['keys']), reverse=True)
+    if top > 0:
+        slots = slots[:top]
+
+    if as_json:
+        import json
+        print(json.dumps({'masters': masters, 'slots': slots}))
+        return
+    print('Masters: address node_id slots keys keys/slot memory')
+    for m in masters:
+        print('  %s %s %d %d %.2f %s' %
+              (m['addr'], m['node_id'], m['slots'], m['keys'],
+               float(m['keys']) / m['slots'] if m['slots'] else 0,
+               '-' if m['memory'] is None else m['memory']))
+    print('Slots: slot master keys memory')
+    for s in slots:
+        print('  %d %s %d %s' % (s['slot'], s['master'], s['keys'],
+                                 '-' if s['memory'] is None else s['memory']))
+
+
 @cli.command(help='Send a command to all nodes in the cluster')
 @click.option(
     '--master-only',
@@ -174,8 +616,263 @@ def execute(master_only, slave_only, addr, commands):
             print('%s +%s' % (r['node'].addr(), r['result']))
 
 
+def _print_load_progress(result):
+    click.echo('%d commands, %d errors, %.0f commands/s' %
+               (result['commands'], result['errors'],
+                result['commands'] / max(result['seconds'], 1e-6)),
+               err=True)
+
+
+@cli.command(help='Load commands, or key/value records, from a file (or'
+             ' stdin) into a cluster, in pipelines to the masters owning the'
+             ' keys')
+@click.option(
+    '--addr', required=True, help='Address of any node in the cluster')
+@click.option(
+    '--file',
+    'data_file',
+    type=click.File('rb'),
+    default='-',
+    help='File to read from; - for stdin (by default)')
+@click.option(
+    '--format',
+    'data_format',
+    type=click.Choice(['commands', 'records']),
+    default='commands',
+    help='"commands" (by default) for a command per line, split like in a'
+    ' shell, whose second argument is the key; "records" for a key and a'
+    ' value separated by a tab per line, each loaded by SET')
+@click.option(
+    '--concurrency',
+    type=int,
+    default=DEFAULT_CONCURRENCY,
+    help='number of masters to send pipelines to at the same time')
+@click.option('--quiet', is_flag=True, help='Do not report progress')
+def load(addr, data_file, data_format, concurrency, quiet):
+    from .loader import load, read_commands, read_records
+    host, port = _parse_host_port(addr)
+    if data_format == 'records':
+        commands = read_records(data_file)
+    else:
+        commands = read_commands(data_file)
+    result = load(host, port, commands, concurrency=concurrency,
+                  progress=None if quiet else _print_load_progress)
+    for c, error in result['error_samples']:
+        click.echo('%r: %s' % (c, error), err=True)
+    print('%d commands in %.2fs, %.0f commands/s, %d errors, %d MOVED,'
+          ' %d ASK' % (result['commands'], result['seconds'],
+                       result['commands'] / max(result['seconds'], 1e-6),
+                       result['errors'], result['moved'], result['ask']))
+    if result['errors']:
+        sys.exit(1)
+
+
+@cli.command(help='Scan keys of all masters (or replicas) in a cluster at'
+             ' the same time, and output them one per line')
+@click.option(
+    '--addr', required=True, help='Address of any node in the cluster')
+@click.option('--match', help='Glob-style pattern of keys, for SCAN MATCH')
+@click.option(
+    '--count',
+    type=int,
+    default=1000,
+    help='hint of the number of keys each SCAN returns, for SCAN COUNT')
+@click.option('--type', 'type_', help='Type of keys, for SCAN TYPE')
+@click.option(
+    '--replicas',
+    is_flag=True,
+    help='Scan a replica of each master if any, instead of the masters')
+@click.option(
+    '--interval',
+    type=float,
+    default=0,
+    help='seconds to wait between each SCAN on a node')
+@click.option(
+    '--limit', type=int, default=0, help='stop after this number of keys')
+@click.option(
+    '--cursors',
+    'cursors_file',
+    help='JSON file of the cursors of nodes to resume from, if it exists,'
+    ' and to save the cursors to when the command stops')
+@click.option(
+    '--concurrency',
+    type=int,
+    default=DEFAULT_CONCURRENCY,
+    help='number of nodes scanned at the same time')
+def scan(addr, match, count, type_, replicas, interval, limit, cursors_file,
+         concurrency):
+    import json
+    import os
+    from .scan import ClusterScan
+    host, port = _parse_host_port(addr)
+    cursors = {}
+    if cursors_file is not None and os.path.exists(cursors_file):
+        with open(cursors_file) as f:
+            cursors = json.load(f)
+    s = ClusterScan(host, port, match=match, count=count, type_=type_,
+                    replicas=replicas, cursors=cursors, interval=interval,
+                    decode_keys=False, concurrency=concurrency)
+    out = click.get_binary_stream('stdout')
+    start = time.time()
+    try:
+        for key in s:
+            out.write(key + b'\n')
+            if s.keys == limit:
+                break
+    finally:
+        out.flush()
+        if cursors_file is not None:
+            with open(cursors_file, 'w') as f:
+                json.dump(cursors, f)
+        elapsed = time.time() - start
+        click.echo('%d keys in %.2fs, %.0f keys/s, %s' %
+                   (s.keys, elapsed, s.keys / max(elapsed, 1e-6),
+                    'done' if s.done() else 'not done'), err=True)
+
+
+@cli.command(
+    'delete-pattern',
+    help='Delete keys matching PATTERN in a cluster, scanned on all masters'
+    ' at the same time and unlinked in pipelines to the masters')
+@click.option(
+    '--addr', required=True, help='Address of any node in the cluster')
+@click.option(
+    '--count',
+    type=int,
+    default=1000,
+    help='hint of the number of keys each SCAN returns, for SCAN COUNT')
+@click.option(
+    '--batch',
+    type=int,
+    default=1000,
+    help='number of keys unlinked at a time')
+@click.option(
+    '--rate',
+    type=int,
+    default=0,
+    help='max keys deleted per second; 0 for no limit (by default)')
+@click.option(
+    '--dry-run', is_flag=True, help='Only count keys matching PATTERN')
+@click.option(
+    '--concurrency',
+    type=int,
+    default=DEFAULT_CONCURRENCY,
+    help='number of masters scanned and unlinked at the same time')
+@click.option('--quiet', is_flag=True, help='Do not report progress')
+@click.argument('pattern')
+def delete_pattern(addr, count, batch, rate, dry_run, concurrency, quiet,
+                   pattern):
+    from .scan import delete_pattern
+    host, port = _parse_host_port(addr)
+    last_report = [0]
+
+    def report(result):
+        if time.time() - last_report[0] < 1:
+            return
+        last_report[0] = time.time()
+        click.echo('%d keys matched, %d deleted, %.0f keys/s' %
+                   (result['matched'], result['deleted'],
+                    result['matched'] / max(result['seconds'], 1e-6)),
+                   err=True)
+
+    result = delete_pattern(host, port, pattern, count=count, batch=batch,
+                            rate=rate, dry_run=dry_run,
+                            concurrency=concurrency,
+                            progress=None if quiet else report)
+    if dry_run:
+        print('%d keys matched in %.2fs' % (result['matched'],
+                                            result['seconds']))
+    else:
+        print('%d keys matched, %d deleted in %.2fs' %
+              (result['matched'], result['deleted'], result['seconds']))
+
+
+def _print_dump_progress(result):
+    click.echo('%d keys, %.2fMB, %.0f keys/s' %
+               (result['keys'], result['bytes'] / 1048576.0,
+                result['keys'] / max(result['seconds'], 1e-6)),
+               err=True)
+
+
+@cli.command(help='Export keys of a cluster to a file (or stdout), as DUMP'
+             ' payloads and TTLs of keys scanned on all masters at the same'
+             ' time, to be imported into any cluster')
+@click.option(
+    '--addr', required=True, help='Address of any node in the cluster')
+@click.option(
+    '--file',
+    'dump_file',
+    type=click.File('wb'),
+    default='-',
+    help='File to write to; - for stdout (by default)')
+@click.option('--match', help='Glob-style pattern of keys to export')
+@click.option(
+    '--batch',
+    type=int,
+    default=1000,
+    help='number of keys dumped at a time')
+@click.option(
+    '--concurrency',
+    type=int,
+    default=DEFAULT_CONCURRENCY,
+    help='number of masters scanned and dumped at the same time')
+@click.option('--quiet', is_flag=True, help='Do not report progress')
+def export(addr, dump_file, match, batch, concurrency, quiet):
+    from .dump import export_dump
+    host, port = _parse_host_port(addr)
+    result = export_dump(host, port, dump_file, match=match, batch=batch,
+                         concurrency=concurrency,
+                         progress=None if quiet else _print_dump_progress)
+    dump_file.flush()
+    click.echo('%d keys, %d bytes in %.2fs, %.0f keys/s' %
+               (result['keys'], result['bytes'], result['seconds'],
+                result['keys'] / max(result['seconds'], 1e-6)),
+               err=True)
+
+
+@cli.command(
+    'import',
+    help='Import keys from a file (or stdin) written by `export` into a'
+    ' cluster, restored in pipelines to the masters owning the keys')
+@click.option(
+    '--addr', required=True, help='Address of any node in the cluster')
+@click.option(
+    '--file',
+    'dump_file',
+    type=click.File('rb'),
+    default='-',
+    help='File to read from; - for stdin (by default)')
+@click.option(
+    '--replace', is_flag=True, help='Replace keys existing already')
+@click.option(
+    '--batch',
+    type=int,
+    default=4096,
+    help='number of keys restored at a time')
+@click.option(
+    '--concurrency',
+    type=int,
+    default=DEFAULT_CONCURRENCY,
+    help='number of masters to send pipelines to at the same time')
+@click.option('--quiet', is_flag=True, help='Do not report progress')
+def import_(addr, dump_file, replace, batch, concurrency, quiet):
+    from .dump import import_dump
+    host, port = _parse_host_port(addr)
+    result = import_dump(host, port, dump_file, replace=replace, batch=batch,
+                         concurrency=concurrency,
+                         progress=None if quiet else _print_load_progress)
+    for key, error in result['error_samples']:
+        click.echo('%r: %s' % (key, error), err=True)
+    print('%d keys in %.2fs, %.0f keys/s, %d errors, %d MOVED, %d ASK' %
+          (result['commands'], result['seconds'],
+           result['commands'] / max(result['seconds'], 1e-6),
+           result['errors'], result['moved'], result['ask']))
+    if result['errors']:
+        sys.exit(1)
+
+
 def main():
     logging.basicConfig(level=logging.INFO)
     click.echo('Redis-trib %s Copyright (c) HunanTV Platform developers' %
-               __version__)
+               __version__, err=True)
     cli()
@@ -0,0 +1,184 @@
+import struct
+import time
+import zlib
+
+from .client import ClusterClient
+from .loader import load
+from .parallel import DEFAULT_CONCURRENCY
+from .scan import SCAN_COUNT, ClusterScan
+
+# A dump file is DUMP_MAGIC followed by chunks, each of a CHUNK_HEADER of
+#   the length of the chunk and the number of records in it, then the records
+#   compressed by zlib. A record is a RECORD_HEADER of the length of the key,
+#   the TTL in milliseconds (0 for no expiry) and the length of the value,
+#   then the key and the value as serialized by DUMP. The file ends with an
+#   empty chunk, so that a truncated file is told from a complete one.
+DUMP_MAGIC = b'REDISTRIB-DUMP 1\n'
+CHUNK_HEADER = struct.Struct('>II')
+RECORD_HEADER = struct.Struct('>IqI')
+
+# uncompressed bytes of records in a chunk, at most unless a record is larger
+DUMP_CHUNK_SIZE = 1 << 20
+
+DUMP_COMPRESS_LEVEL = 1
+
+# keys dumped at a time by `export_dump`
+EXPORT_BATCH = 1000
+
+# records restored at a time by `import_dump`
+IMPORT_BATCH = 4096
+
+
+class DumpWriter(object):
+    def __init__(self, f, chunk_size=DUMP_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.pieces = []
+        self.size = 0
+        self.records = 0
+        # bytes written to `f`
+        self.written = 0
+        self._write(DUMP_MAGIC)
+
+    def _write(self, data):
+        self.f.write(data)
+        self.written += len(data)
+
+    def write(self, key, ttl, value):
+        self.pieces.append(RECORD_HEADER.pack(len(key), ttl, len(value)))
+        self.pieces.append(key)
+        self.pieces.append(value)
+        self.size += RECORD_HEADER.size + len(key) + len(value)
+        self.records += 1
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.records:
+            return
+        data = zlib.compress(b''.join(self.pieces), DUMP_COMPRESS_LEVEL)
+        self._write(CHUNK_HEADER.pack(len(data), self.records))
+        self._write(data)
+        self.pieces = []
+        self.size = 0
+        self.records = 0
+
+    def close(self):
+        self.flush()
+        self._write(CHUNK_HEADER.pack(0, 0))
+
+
+def _read_exactly(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError('Dump file is truncated')
+    return data
+
+
+def read_dump(f):
+    # (key, TTL, value) of each record of a dump file, a chunk in memory at a
+    #   time
+    if f.read(len(DUMP_MAGIC)) != DUMP_MAGIC:
+        raise ValueError('Not a dump file')
+    while True:
+        size, records = CHUNK_HEADER.unpack(
+            _read_exactly(f, CHUNK_HEADER.size))
+        if records == 0:
+            return
+        data = zlib.decompress(_read_exactly(f, size))
+        offset = 0
+        for _ in range(records):
+            key_len, ttl, value_len = RECORD_HEADER.unpack_from(data, offset)
+            offset += RECORD_HEADER.size
+            key = data[offset:offset + key_len]
+            offset += key_len
+            yield key, ttl, data[offset:offset + value_len]
+            offset += value_len
+
+
+# Export keys (matching `match` if given) of the cluster of HOST:PORT to `f`,
+#   a binary file, as a dump file. Keys are scanned on all masters at the
+#   same time by a `ClusterScan`, and DUMP and PTTL of each batch of `batch`
+#   keys are sent by a `ClusterClient` in pipelines to all masters in
+#   parallel. Keys deleted or expired since scanned are skipped. TTLs are
+#   saved as they are when dumped, so that they restart when imported.
+#   `progress`, if given, is called with the result after each batch.
+#   Return a dict of
+#     - keys: number of keys exported
+#     - bytes: size of the file
+#     - done: whether all masters have been scanned
+#     - seconds: time taken
+def export_dump(host,
+                port,
+                f,
+                match=None,
+                count=SCAN_COUNT,
+                batch=EXPORT_BATCH,
+                concurrency=DEFAULT_CONCURRENCY,
+                progress=None):
+    start = time.time()
+    result = {
+        'keys': 0,
+        'bytes': 0,
+        'done': False,
+        'seconds': 0,
+    }
+    writer = DumpWriter(f)
+    s = ClusterScan(host, port, match=match, count=count, decode_keys=False,
+                    concurrency=concurrency)
+
+    with ClusterClient(host, port, decode_replies=False,
+                       concurrency=concurrency) as client:
+
+        def dump(keys):
+            replies = client.execute_bulk(
+                [c for k in keys for c in (('dump', k), ('pttl', k))])
+            for key, value, ttl in zip(keys, replies[::2], replies[1::2]):
+                if value is None or ttl == -2:
+                    continue
+                writer.write(key, max(ttl, 0), value)
+                result['keys'] += 1
+            result['bytes'] = writer.written
+            result['seconds'] = time.time() - start
+            if progress is not None:
+                progress(result)
+
+        keys = []
+        for k in s:
+            keys.append(k)
+            if len(keys) == batch:
+                dump(keys)
+                keys = []
+        if keys:
+            dump(keys)
+    writer.close()
+    result['bytes'] = writer.written
+    result['done'] = s.done()
+    result['seconds'] = time.time() - start
+    return result
+
+
+# Import a dump file read from `f` into the cluster of HOST:PORT by RESTORE,
+#   with `loader.load`, so that records are routed to the masters owning
+#   their keys and restored in pipelines to all masters in parallel, `batch`
+#   records at a time. Keys existing already fail unless `replace` is set.
+#   Return the result of `loader.load`, but with (key, error message) as
+#   error_samples.
+def import_dump(host,
+                port,
+                f,
+                replace=False,
+                batch=IMPORT_BATCH,
+                concurrency=DEFAULT_CONCURRENCY,
+                progress=None):
+    options = ('replace', ) if replace else ()
+    result = load(
+        host,
+        port, (('restore', key, ttl, value) + options
+               for key, ttl, value in read_dump(f)),
+        chunk_size=batch,
+        concurrency=concurrency,
+        progress=progress)
+    result['error_samples'] = [(c[1], error)
+                               for c, error in result['error_samples']]
+    return result
@@ -13,3 +13,13 @@ class RedisIOError(IOError, RedisErrorBase):
     def __init__(self, error, host, port):
         IOError.__init__(self, error)
         RedisErrorBase.__init__(self, error, host, port)
+
+
+class RedisMigrateError(RedisErrorBase):
+    def __init__(self, failed_keys, host, port):
+        RedisErrorBase.__init__(
+            self, '%d keys in %d slots failed to migrate' % (sum(
+                len(keys) for keys in failed_keys.values()), len(failed_keys)),
+            host, port)
+        # {slot: {key: error message of the last attempt}}
+        self.failed_keys = failed_keys
@@ -0,0 +1,296 @@
+import logging
+import re
+import threading
+import time
+
+import hiredis
+import six
+from six.moves import BaseHTTPServer, socketserver
+
+from . import command
+from .connection import Connection
+from .parallel import DEFAULT_CONCURRENCY, pmap
+
+PAT_DB = re.compile('^db[0-9]+$')
+PAT_KEYSPACE_KEYS = re.compile('keys=([0-9]+)')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def _format_metric(name, metric_type, help, samples):
+    lines = [
+        '# HELP %s %s' % (name, help),
+        '# TYPE %s %s' % (name, metric_type),
+    ]
+    for labels, value in samples:
+        if labels:
+            lines.append('%s{%s} %s' % (name, ','.join(
+                '%s="%s"' % (k, _escape(v))
+                for k, v in sorted(six.iteritems(labels))), value))
+        else:
+            lines.append('%s %s' % (name, value))
+    return lines
+
+
+class ClusterCollector(object):
+    # Collect metrics of a cluster for Prometheus. Each scrape finishes in
+    #   about `budget` seconds. The topology of the cluster is fetched by
+    #   `redistrib.command.check_cluster` in a thread of its own once it is
+    #   older than `topology_ttl` seconds; a scrape waits for it until the
+    #   deadline, and then goes on with the topology cached before, while the
+    #   fetch finishes for later scrapes. INFO of all nodes is polled
+    #   concurrently on each scrape over persistent connections, and a node
+    #   not replying by the deadline is reported as down in this scrape.
+    def __init__(self, host, port, budget=5, topology_ttl=60,
+                 concurrency=DEFAULT_CONCURRENCY):
+        self.host = host
+        self.port = port
+        self.budget = budget
+        self.topology_ttl = topology_ttl
+        self.concurrency = concurrency
+        self.topology = None
+        self.topology_time = 0
+        self.topology_error = None
+        self.refreshing = None
+        self.conns = {}
+        self.lock = threading.Lock()
+
+    def _refresh_topology(self):
+        try:
+            topology = command.check_cluster(self.host, self.port)
+            topology['time'] = self.topology_time = time.time()
+            self.topology = topology
+            self.topology_error = None
+        except Exception as e:
+            logging.exception('Fail to fetch the topology')
+            self.topology_error = e
+
+    def _wait_topology(self, deadline):
+        if (self.refreshing is None
+                and time.time() - self.topology_time >= self.topology_ttl):
+            self.refreshing = threading.Thread(target=self._refresh_topology)
+            self.refreshing.daemon = True
+            self.refreshing.start()
+        if self.refreshing is not None:
+            self.refreshing.join(max(0, deadline - time.time()))
+            if not self.refreshing.is_alive():
+                self.refreshing = None
+        if self.topology is None:
+            if self.topology_error is not None:
+                raise self.topology_error
+            raise RuntimeError('No topology of %s:%d fetched in %s seconds' %
+                               (self.host, self.port, self.budget))
+        addrs = set(n.addr() for n in self.topology['nodes'])
+        for addr in [a for a in self.conns if a not in addrs]:
+            self.conns.pop(addr).close()
+        return self.topology
+
+    def _poll(self, node, deadline):
+        addr = node.addr()
+        try:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                return None
+            if addr not in self.conns:
+                self.conns[addr] = Connection(
+                    node.host, node.port, timeout=timeout)
+            conn = self.conns[addr]
+            conn.sock.settimeout(max(0.001, deadline - time.time()))
+            info = command._poll_node_info(conn)
+            return info if time.time() <= deadline else None
+        except (IOError, hiredis.ReplyError) as e:
+            logging.debug('Fail to poll %s: %s', addr, e)
+            conn = self.conns.pop(addr, None)
+            if conn is not None:
+                conn.close()
+            return None
+
+    def collect(self):
+        with self.lock:
+            start = time.time()
+            deadline = start + self.budget
+            topology = self._wait_topology(deadline)
+            nodes = topology['nodes']
+            infos = pmap(lambda n: self._poll(n, deadline), nodes,
+                         self.concurrency)
+            lines = (self._topology_metrics(topology) + self._node_metrics(
+                nodes, infos) + self._migration_metrics())
+            lines.extend(
+                _format_metric('redistrib_scrape_duration_seconds', 'gauge',
+                               'Seconds spent on this scrape',
+                               [({}, time.time() - start)]))
+            return '\n'.join(lines) + '\n'
+
+    def _topology_metrics(self, t):
+        nodes = t['nodes']
+        masters = [n for n in nodes if n.master and not n.fail]
+        replicated = set(n.master_id for n in nodes if n.slave and not n.fail)
+        slots = [len(n.assigned_slots) for n in masters if n.assigned_slots]
+        role_samples = [
+            ({'role': 'master'}, sum(1 for n in nodes if n.master)),
+            ({'role': 'slave'}, sum(1 for n in nodes if n.slave)),
+        ]
+        slots_samples = [({'addr': n.addr()}, len(n.assigned_slots))
+                         for n in nodes if n.master]
+
+        lines = _format_metric('redistrib_cluster_nodes', 'gauge',
+                               'Number of nodes by role', role_samples)
+        for name, help, value in [
+            ('redistrib_cluster_failed_nodes',
+             'Number of nodes flagged as fail or fail?',
+             sum(1 for n in nodes if n.fail)),
+            ('redistrib_cluster_unreachable_nodes',
+             'Number of nodes failed to reply CLUSTER NODES',
+             len(t['unreachable'])),
+            ('redistrib_cluster_not_ok_nodes',
+             'Number of nodes whose cluster_state is not ok',
+             len(t['not_ok'])),
+            ('redistrib_cluster_masters_without_slave',
+             'Number of alive masters holding slots without any alive slave',
+             sum(1 for n in masters
+                 if n.assigned_slots and n.node_id not in replicated)),
+            ('redistrib_cluster_slots_covered',
+             'Number of slots served by alive masters', sum(slots)),
+            ('redistrib_cluster_slots_uncovered',
+             'Number of slots not assigned to any node',
+             sum(e - b + 1 for b, e in t['uncovered_slots'])),
+            ('redistrib_cluster_slots_open',
+             'Number of migrating or importing slot markers',
+             len(t['open_slots'])),
+            ('redistrib_cluster_views_disagree',
+             'Number of slot ranges and node attributes on which nodes'
+             ' disagree', len(t['slots_disagree']) + len(t['nodes_disagree'])),
+            ('redistrib_cluster_slots_imbalance',
+             'Difference between the max and min numbers of slots of alive'
+             ' masters holding slots',
+             max(slots) - min(slots) if slots else 0),
+            ('redistrib_cluster_topology_age_seconds',
+             'Seconds since the topology was fetched',
+             time.time() - t['time']),
+        ]:
+            lines.extend(_format_metric(name, 'gauge', help, [({}, value)]))
+        lines.extend(
+            _format_metric('redistrib_master_slots', 'gauge',
+                           'Number of slots assigned to a master',
+                           slots_samples))
+        return lines
+
+    def _node_metrics(self, nodes, infos):
+        def labels(node):
+            return {'addr': node.addr(), 'role': node.role_in_cluster}
+
+        def samples(f):
+            return [(labels(n), f(info)) for n, info in zip(nodes, infos)
+                    if info is not None]
+
+        def keys(info):
+            return sum(
+                int(PAT_KEYSPACE_KEYS.findall(v)[0])
+                for k, v in six.iteritems(info) if PAT_DB.match(k))
+
+        lines = _format_metric('redistrib_node_up', 'gauge',
+                               'Whether the node replied INFO by the deadline'
+                               ' of the scrape',
+                               [(labels(n), 0 if info is None else 1)
+                                for n, info in zip(nodes, infos)])
+        for name, metric_type, help, f in [
+            ('redistrib_node_used_memory_bytes', 'gauge',
+             'used_memory of INFO', lambda i: i['used_memory']),
+            ('redistrib_node_keys', 'gauge', 'Number of keys in all DBs',
+             keys),
+            ('redistrib_node_commands_processed_total', 'counter',
+             'total_commands_processed of INFO',
+             lambda i: i['total_commands_processed']),
+            ('redistrib_node_net_input_bytes_total', 'counter',
+             'total_net_input_bytes of INFO',
+             lambda i: i['total_net_input_bytes']),
+            ('redistrib_node_net_output_bytes_total', 'counter',
+             'total_net_output_bytes of INFO',
+             lambda i: i['total_net_output_bytes']),
+            ('redistrib_node_cluster_state_ok', 'gauge',
+             'Whether cluster_state of the node is ok',
+             lambda i: 1 if i['cluster_state'] == 'ok' else 0),
+        ]:
+            lines.extend(_format_metric(name, metric_type, help, samples(f)))
+        return lines
+
+    def _migration_metrics(self):
+        lines = []
+        for key, metric_type, help in [
+            ('slots_planned', 'counter',
+             'Slots to migrate by redistrib in this process'),
+            ('slots_migrated', 'counter',
+             'Slots migrated by redistrib in this process'),
+            ('slots_migrating', 'gauge',
+             'Slots being migrated by redistrib in this process'),
+            ('keys_migrated', 'counter',
+             'Keys migrated by redistrib in this process'),
+        ]:
+            name = 'redistrib_migration_%s' % key
+            if metric_type == 'counter':
+                name += '_total'
+            lines.extend(
+                _format_metric(name, metric_type, help,
+                               [({}, command.migration_progress[key])]))
+        return lines
+
+    def close(self):
+        with self.lock:
+            for conn in six.itervalues(self.conns):
+                conn.close()
+            self.conns = {}
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def _handler_class(collector):
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            try:
+                body = collector.collect().encode('utf-8')
+            except Exception as e:
+                logging.exception('Fail to collect metrics')
+                self.send_error(500, str(e))
+                return
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            logging.debug(fmt, *args)
+
+    return Handler
+
+
+# Serve /metrics of the cluster at `listen_host`:`listen_port` in a daemon
+#   thread, and return the HTTP server; call `shutdown` of the returned server
+#   to stop it. Slots migration of other APIs running in this process is also
+#   exported.
+def start_exporter(host,
+                   port,
+                   listen_host='127.0.0.1',
+                   listen_port=9479,
+                   budget=5,
+                   topology_ttl=60):
+    collector = ClusterCollector(host, port, budget, topology_ttl)
+    server = _ThreadingHTTPServer((listen_host, listen_port),
+                                  _handler_class(collector))
+    server.collector = collector
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    logging.info('Serving metrics of %s:%d at http://%s:%d/metrics', host,
+                 port, listen_host, server.server_address[1])
+    return server
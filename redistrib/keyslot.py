@@ -0,0 +1,122 @@
+import six
+
+SLOT_COUNT = 16384
+
+# keys longer than this are hashed one by one instead of in numpy batches,
+#   which are as wide as their longest key
+NUMPY_MAX_KEY_LEN = 256
+
+# fewer keys than this are hashed one by one, unless numpy is asked for
+NUMPY_MIN_KEYS = 64
+
+
+def _crc16_table():
+    # CRC16-CCITT (XMODEM), as used by Redis Cluster
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1) & 0xffff
+        table.append(crc)
+    return table
+
+
+CRC16_TABLE = _crc16_table()
+
+_numpy = []
+
+
+def _import_numpy():
+    # numpy is optional, and imported only when keys are hashed in batches
+    if not _numpy:
+        try:
+            import numpy
+            _numpy.append(numpy)
+        except ImportError:
+            _numpy.append(None)
+    return _numpy[0]
+
+
+def hash_tag(key):
+    # the part of `key` hashed: what is inside the first "{...}" unless it is
+    #   empty, or the whole key
+    if isinstance(key, six.text_type):
+        key = key.encode('utf-8')
+    begin = key.find(b'{')
+    if begin != -1:
+        end = key.find(b'}', begin + 1)
+        if end > begin + 1:
+            return key[begin + 1:end]
+    return key
+
+
+def key_slot(key):
+    crc = 0
+    for c in bytearray(hash_tag(key)):
+        crc = ((crc << 8) & 0xffff) ^ CRC16_TABLE[(crc >> 8) ^ c]
+    return crc & (SLOT_COUNT - 1)
+
+
+def _key_slots_numpy(numpy, keys):
+    # CRC16 of all keys a byte at a time; keys are sorted from the longest
+    #   so that the keys still being hashed at each byte are a prefix
+    lengths = numpy.fromiter((len(k) for k in keys), numpy.intp, len(keys))
+    order = numpy.argsort(-lengths, kind='stable')
+    lengths = lengths[order]
+    width = int(lengths[0])
+    data = numpy.zeros((len(keys), width), numpy.uint8)
+    data[numpy.arange(width) < lengths[:, None]] = numpy.frombuffer(
+        b''.join(keys[i] for i in order), numpy.uint8)
+    hashing = numpy.searchsorted(-lengths, -numpy.arange(width), 'left')
+    table = numpy.array(CRC16_TABLE, numpy.uint16)
+    crc = numpy.zeros(len(keys), numpy.uint16)
+    for i in range(width):
+        n = hashing[i]
+        crc[:n] = (crc[:n] << 8) ^ table[(crc[:n] >> 8) ^ data[:n, i]]
+    slots = numpy.empty(len(keys), numpy.intp)
+    slots[order] = crc & (SLOT_COUNT - 1)
+    return slots.tolist()
+
+
+# Return the slots of `keys`, a list of bytes or text, hashed in a batch by
+#   numpy if it is installed and `use_numpy` is True, or if `use_numpy` is
+#   None (by default) and there are at least NUMPY_MIN_KEYS keys.
+def key_slots(keys, use_numpy=None):
+    numpy = None
+    if use_numpy or (use_numpy is None and len(keys) >= NUMPY_MIN_KEYS):
+        numpy = _import_numpy()
+    if numpy is None:
+        if use_numpy:
+            raise ImportError('numpy is not installed')
+        return [key_slot(k) for k in keys]
+    binary_type = six.binary_type
+    tags = [
+        k if isinstance(k, binary_type) and b'{' not in k else hash_tag(k)
+        for k in keys
+    ]
+    unfit = [
+        i for i, t in enumerate(tags)
+        if not 0 < len(t) <= NUMPY_MAX_KEY_LEN
+    ]
+    if not unfit:
+        return _key_slots_numpy(numpy, tags)
+    slots = [0] * len(tags)
+    for i in unfit:
+        slots[i] = key_slot(tags[i])
+    unfit = set(unfit)
+    fit = [i for i in range(len(tags)) if i not in unfit]
+    if fit:
+        for i, slot in zip(fit, _key_slots_numpy(numpy,
+                                                 [tags[i] for i in fit])):
+            slots[i] = slot
+    return slots
+
+
+def count_slots(slots, counts=None):
+    # add up the number of keys in each slot to `counts`, a list of
+    #   SLOT_COUNT numbers
+    if counts is None:
+        counts = [0] * SLOT_COUNT
+    for slot in slots:
+        counts[slot] += 1
+    return counts
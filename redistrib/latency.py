@@ -0,0 +1,139 @@
+import threading
+import timeit
+
+now = timeit.default_timer
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+# commands whose first argument is a sub command
+CONTAINER_COMMANDS = {
+    'client', 'cluster', 'command', 'config', 'debug', 'memory', 'object',
+    'script', 'slowlog', 'xinfo'
+}
+
+# the current `LatencyStats`, or None if not enabled;
+#   `redistrib.connection.Connection` records nothing if it is None
+stats = None
+
+
+def _bucket_index(value):
+    if value < SUB_BUCKET_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKET_COUNT + (value >> shift) - SUB_BUCKET_COUNT
+
+
+def _bucket_upper_bound(index):
+    if index < SUB_BUCKET_COUNT:
+        return index
+    shift = index // SUB_BUCKET_COUNT - 1
+    sub_bucket = index % SUB_BUCKET_COUNT + SUB_BUCKET_COUNT
+    return ((sub_bucket + 1) << shift) - 1
+
+
+class Histogram(object):
+    # HDR-style histogram of integers (microseconds): values less than 16
+    #   are counted exactly, and larger ones in 16 buckets for each power of
+    #   2, which bounds the relative error by 1/16 at any magnitude
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value):
+        value = max(0, int(value))
+        index = _bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None
+                                      or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def mean(self):
+        return float(self.total) / self.count if self.count else 0
+
+    # upper bound of the bucket containing the `p` percentile value
+    def percentile(self, p):
+        if self.count == 0:
+            return 0
+        rank = self.count * p / 100.0
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(_bucket_upper_bound(index), self.max)
+        return self.max
+
+
+def command_name(packed, pipeline=False):
+    # first one or two arguments from a packed command,
+    #   like b'*2\r\n$7\r\ncluster\r\n$5\r\nnodes\r\n'
+    parts = packed[0].split(b'\r\n', 5)
+    name = parts[2].decode('utf-8', 'replace').lower()
+    if name in CONTAINER_COMMANDS and len(parts) > 4:
+        name += ' ' + parts[4].decode('utf-8', 'replace').lower()
+    return 'pipeline:' + name if pipeline else name
+
+
+class LatencyStats(object):
+    # round trip time histograms by command name and node address
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, addr, seconds):
+        with self.lock:
+            h = self.histograms.get((name, addr))
+            if h is None:
+                h = self.histograms[(name, addr)] = Histogram()
+            h.record(seconds * 1000000)
+
+    def by_command(self):
+        result = {}
+        with self.lock:
+            for (name, _), h in self.histograms.items():
+                result.setdefault(name, Histogram()).merge(h)
+        return result
+
+    def summary(self):
+        lines = [
+            'command count mean(us) p50(us) p90(us) p99(us) max(us)'
+            ' slowest-node(p99 us)'
+        ]
+        for name, h in sorted(self.by_command().items()):
+            with self.lock:
+                slowest_p99, slowest = max(
+                    (n_h.percentile(99), addr)
+                    for (n, addr), n_h in self.histograms.items()
+                    if n == name)
+            lines.append('%s %d %d %d %d %d %d %s(%d)' %
+                         (name, h.count, h.mean(), h.percentile(50),
+                          h.percentile(90), h.percentile(99), h.max, slowest,
+                          slowest_p99))
+        return lines
+
+
+def enable():
+    global stats
+    stats = LatencyStats()
+    return stats
+
+
+def disable():
+    global stats
+    stats = None
@@ -0,0 +1,91 @@
+import logging
+import shlex
+import time
+from itertools import islice
+
+import hiredis
+
+from .client import ClusterClient
+from .parallel import DEFAULT_CONCURRENCY
+
+# commands read from the input and routed to masters at a time
+LOAD_CHUNK = 65536
+
+# error replies kept in the result of `load`
+LOAD_ERROR_SAMPLES = 10
+
+
+def read_commands(lines):
+    # a command per line, whose arguments are split like in a shell
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        args = shlex.split(line)
+        if args:
+            yield args
+
+
+def read_records(lines, command='set'):
+    # a key and a value separated by a tab per line, each loaded by `command`
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip(b'\r\n')
+        if not line:
+            continue
+        if b'\t' not in line:
+            raise ValueError('Line %d is not a key and a value separated by'
+                             ' a tab' % number)
+        key, value = line.split(b'\t', 1)
+        yield (command, key, value)
+
+
+# Load `commands`, an iterable of commands like ('set', KEY, VALUE) whose
+#   keys are at `key_index`, into the cluster of HOST:PORT by a
+#   `ClusterClient`. Commands are read in chunks of `chunk_size`, grouped by
+#   the masters owning their keys and sent in pipelines to at most
+#   `concurrency` masters at the same time, following MOVED and ASK
+#   redirections. `progress`, if given, is called with the result after each
+#   chunk.
+#   Return a dict of
+#     - commands: number of commands loaded, including failed ones
+#     - errors: number of commands failed
+#     - error_samples: [(command, error message)] of the first ones failed
+#     - moved, ask: number of redirections
+#     - seconds: time taken
+def load(host,
+         port,
+         commands,
+         key_index=1,
+         chunk_size=LOAD_CHUNK,
+         concurrency=DEFAULT_CONCURRENCY,
+         progress=None):
+    start = time.time()
+    result = {
+        'commands': 0,
+        'errors': 0,
+        'error_samples': [],
+        'moved': 0,
+        'ask': 0,
+        'seconds': 0,
+    }
+    commands = iter(commands)
+    with ClusterClient(host, port, concurrency=concurrency) as client:
+        while True:
+            chunk = list(islice(commands, chunk_size))
+            if not chunk:
+                break
+            replies = client.execute_bulk(chunk, raise_error=False,
+                                          key_index=key_index)
+            for c, r in zip(chunk, replies):
+                if isinstance(r, hiredis.ReplyError):
+                    result['errors'] += 1
+                    if len(result['error_samples']) < LOAD_ERROR_SAMPLES:
+                        result['error_samples'].append((c, str(r)))
+                    logging.debug('Fail to load %s: %s', c, r)
+            result['commands'] += len(chunk)
+            result['moved'] = client.moved
+            result['ask'] = client.ask
+            result['seconds'] = time.time() - start
+            if progress is not None:
+                progress(result)
+    result['seconds'] = time.time() - start
+    return result
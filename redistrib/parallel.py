@@ -0,0 +1,74 @@
+import sys
+import threading
+import time
+
+import six
+
+DEFAULT_CONCURRENCY = 64
+
+
+# Call `func` on each of `items` in at most `concurrency` threads and return
+#   the results in the order of `items`. Once a call raises, no more items are
+#   started and the first exception is re-raised after running calls return.
+def pmap(func, items, concurrency=DEFAULT_CONCURRENCY):
+    items = list(items)
+    concurrency = min(concurrency, len(items))
+    if concurrency <= 1:
+        return [func(i) for i in items]
+
+    results = [None] * len(items)
+    errors = []
+    lock = threading.Lock()
+    pending = iter(six.moves.range(len(items)))
+
+    def worker():
+        while True:
+            with lock:
+                if errors:
+                    return
+                index = next(pending, None)
+            if index is None:
+                return
+            try:
+                results[index] = func(items[index])
+            except Exception:
+                with lock:
+                    errors.append(sys.exc_info())
+                return
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        six.reraise(*errors[0])
+    return results
+
+
+# Call `check` on each of `items` concurrently until it returns without
+#   raising, sleeping `first_interval` seconds after the first failure and
+#   twice as long after each of the following ones (but `max_interval` at
+#   most). The last exception of an item is re-raised once `timeout` seconds
+#   have passed since the start. Return the results of `check`.
+def wait_until(check,
+               items,
+               timeout,
+               first_interval=0.005,
+               max_interval=0.5,
+               concurrency=DEFAULT_CONCURRENCY):
+    deadline = time.time() + timeout
+
+    def poll(item):
+        interval = first_interval
+        while True:
+            try:
+                return check(item)
+            except Exception:
+                if time.time() + interval > deadline:
+                    raise
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
+
+    return pmap(poll, items, concurrency)
@@ -0,0 +1,242 @@
+import logging
+import threading
+import time
+
+import hiredis
+from six.moves import queue
+
+from .client import ClusterClient
+from .command import _execute_each, _list_nodes
+from .connection import Connection
+from .parallel import DEFAULT_CONCURRENCY, pmap
+
+# the COUNT hint of each SCAN by default
+SCAN_COUNT = 1000
+
+# batches of keys scanned and not yet taken by the consumer, from all nodes
+SCAN_QUEUE_SIZE = 64
+
+# keys unlinked at a time by `delete_pattern`
+DELETE_BATCH = 1000
+
+# seconds to wait for the consumer before checking whether it has stopped
+_PUT_TIMEOUT = 0.1
+
+_DONE = object()
+
+
+def _node_addr(node):
+    return '%s:%d' % (node.host, node.port)
+
+
+def _scan_nodes(host, port, replicas):
+    # non-failed masters holding slots, or, with `replicas`, one replica of
+    #   each of them if any is not failed
+    with Connection(host, port) as t:
+        nodes = _list_nodes(t, host)[0]
+    masters = [n for n in nodes if n.master and not n.fail and
+               n.assigned_slots]
+    if not replicas:
+        return masters
+    result = []
+    for m in masters:
+        slaves = sorted((n for n in nodes
+                         if n.master_id == m.node_id and not n.fail),
+                        key=_node_addr)
+        result.append(slaves[0] if slaves else m)
+    return result
+
+
+# Iterate keys of the whole cluster of HOST:PORT by SCAN on all masters (or
+#   on one replica of each master if `replicas` is set) at the same time.
+#   Batches of keys from any node are yielded as they arrive, with at most
+#   SCAN_QUEUE_SIZE batches buffered.
+#
+# `cursors` is a dict {"HOST:PORT": cursor} of nodes: SCAN on a node starts
+#   at its cursor, or at 0 if it is not in `cursors`, and a node whose cursor
+#   is None has been scanned. While iterating, `cursors` is updated once all
+#   keys of a batch are taken, so that after the iteration stops for any
+#   reason, another scan given the same `cursors` resumes it (keys of the
+#   last batch might be yielded again, as SCAN does anyway).
+#
+# `interval` seconds are waited between each SCAN on a node, to lower the
+#   load of the nodes.
+class ClusterScan(object):
+    def __init__(self,
+                 host,
+                 port,
+                 match=None,
+                 count=SCAN_COUNT,
+                 type_=None,
+                 replicas=False,
+                 cursors=None,
+                 interval=0,
+                 decode_keys=True,
+                 concurrency=DEFAULT_CONCURRENCY):
+        self.host = host
+        self.port = port
+        self.options = []
+        if match is not None:
+            self.options.extend(['match', match])
+        self.options.extend(['count', count])
+        if type_ is not None:
+            self.options.extend(['type', type_])
+        self.replicas = replicas
+        self.cursors = {} if cursors is None else cursors
+        self.interval = interval
+        self.decode_keys = decode_keys
+        self.concurrency = concurrency
+        # number of keys yielded
+        self.keys = 0
+
+    def _put(self, batches, stop, item):
+        while not stop.is_set():
+            try:
+                return batches.put(item, timeout=_PUT_TIMEOUT)
+            except queue.Full:
+                pass
+
+    def _scan_node(self, node, batches, stop):
+        addr = _node_addr(node)
+        cursor = self.cursors.get(addr, '0')
+        if cursor is None:
+            return
+        with Connection(node.host, node.port,
+                        decode_replies=self.decode_keys) as conn:
+            while not stop.is_set():
+                cursor, keys = conn.execute('scan', cursor, *self.options)
+                if isinstance(cursor, bytes):
+                    cursor = cursor.decode('utf-8')
+                done = cursor == '0'
+                self._put(batches, stop, (addr, None if done else cursor,
+                                          keys))
+                if done:
+                    return
+                if self.interval:
+                    time.sleep(self.interval)
+
+    def _produce(self, nodes, batches, stop):
+        try:
+            pmap(lambda n: self._scan_node(n, batches, stop), nodes,
+                 self.concurrency)
+            self._put(batches, stop, (_DONE, None))
+        except Exception as e:
+            logging.debug('Scan failed: %s', e)
+            self._put(batches, stop, (_DONE, e))
+
+    def __iter__(self):
+        nodes = _scan_nodes(self.host, self.port, self.replicas)
+        for n in nodes:
+            self.cursors.setdefault(_node_addr(n), '0')
+        batches = queue.Queue(SCAN_QUEUE_SIZE)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._produce, args=(nodes, batches, stop))
+        producer.daemon = True
+        producer.start()
+        try:
+            while True:
+                item = batches.get()
+                if item[0] is _DONE:
+                    if item[1] is not None:
+                        raise item[1]
+                    return
+                addr, cursor, keys = item
+                for k in keys:
+                    self.keys += 1
+                    yield k
+                self.cursors[addr] = cursor
+        finally:
+            stop.set()
+            producer.join()
+
+    def done(self):
+        # whether all nodes have been scanned, after an iteration
+        return all(c is None for c in self.cursors.values())
+
+
+# Delete keys matching `match` in the cluster of HOST:PORT. Like
+#   `redistrib.command.execute`, all masters are worked on at the same time,
+#   each scanning its own keys and unlinking them in pipelines of `batch`
+#   UNLINK over its connection, or only counting them if `dry_run` is set.
+#   Keys moved away by a slot migration since scanned are unlinked by a
+#   `ClusterClient` at the end. If `rate` is not 0, batches are delayed so
+#   that at most `rate` keys are deleted (or counted) per second on all
+#   masters. `progress`, if given, is called with the result after each
+#   batch. Return a dict of
+#     - matched: number of keys scanned matching `match`
+#     - deleted: number of keys unlinked, which misses keys expired or
+#       deleted since scanned
+#     - done: whether all masters have been scanned
+#     - seconds: time taken
+def delete_pattern(host,
+                   port,
+                   match,
+                   count=SCAN_COUNT,
+                   batch=DELETE_BATCH,
+                   rate=0,
+                   dry_run=False,
+                   concurrency=DEFAULT_CONCURRENCY,
+                   progress=None):
+    start = time.time()
+    result = {
+        'matched': 0,
+        'deleted': 0,
+        'done': False,
+        'seconds': 0,
+    }
+    lock = threading.Lock()
+    redirected = []
+
+    def flush(conn, keys):
+        with lock:
+            result['matched'] += len(keys)
+            due = start + float(result['matched']) / rate if rate else 0
+        if due > time.time():
+            time.sleep(due - time.time())
+        deleted = 0
+        if not dry_run:
+            replies = conn.execute_bulk([('unlink', k) for k in keys],
+                                        raise_error=False)
+            for k, r in zip(keys, replies):
+                if not isinstance(r, hiredis.ReplyError):
+                    deleted += r
+                elif str(r).startswith(('MOVED ', 'ASK ')):
+                    redirected.append(k)
+                else:
+                    raise r
+        with lock:
+            result['deleted'] += deleted
+            result['seconds'] = time.time() - start
+            if progress is not None:
+                progress(result)
+
+    def delete_on(node):
+        with Connection(node.host, node.port, decode_replies=False) as conn:
+            cursor = '0'
+            keys = []
+            while True:
+                cursor, scanned = conn.execute('scan', cursor, 'match', match,
+                                               'count', count)
+                keys.extend(scanned)
+                while len(keys) >= batch:
+                    flush(conn, keys[:batch])
+                    keys = keys[batch:]
+                if cursor == b'0':
+                    break
+            if keys:
+                flush(conn, keys)
+
+    nodes = _scan_nodes(host, port, False)
+    errors = [r['exception'] for r in _execute_each(nodes, delete_on,
+                                                    concurrency)
+              if r['exception'] is not None]
+    if redirected:
+        with ClusterClient(host, port, decode_replies=False,
+                           concurrency=concurrency) as client:
+            result['deleted'] += client.unlink(redirected)
+    if errors:
+        raise errors[0]
+    result['done'] = True
+    result['seconds'] = time.time() - start
+    return result
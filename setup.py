@@ -3,10 +3,9 @@ from setuptools import setup
 
 requirements = [
     'click==6.7',
-    'hiredis==0.2.0',
+    'hiredis>=0.3.1,<4',
     'retrying==1.3.3',
     'six==1.11.0',
-    'Werkzeug==0.14.1',
 ]
 
 setup(
@@ -21,6 +20,7 @@ setup(
     packages=['redistrib'],
     long_description='Visit ' + redistrib.REPO + ' for details please.',
     install_requires=requirements,
+    extras_require={'numpy': ['numpy']},
     zip_safe=False,
     entry_points=dict(
         console_scripts=[
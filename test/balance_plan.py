@@ -60,3 +60,80 @@ class BalancePlanTest(base.TestCase):
             FakeNode('c', 1),
         ])
         self.assertEqual(0, len(r))
+
+    def test_slot_stats_balancer(self):
+        a = FakeNode('a', 8192)
+        b = FakeNode('b', 8192)
+        c = FakeNode('c', 0)
+        stats = [
+            {
+                'node': a,
+                'keys': dict.fromkeys(range(8192), 3),
+                'memory': {},
+            },
+            {
+                'node': b,
+                'keys': dict.fromkeys(range(8192, 16384), 1),
+                'memory': {},
+            },
+        ]
+        balancer = redistrib.clusternode.SlotStatsBalancer(stats)
+        self.assertEqual(666, balancer.weight(a))
+        self.assertEqual(2000, balancer.weight(b))
+        self.assertEqual(1000, balancer.weight(c))
+
+        # a: 8192 -> 16384 * 666 // 3666 + 1 (fragment) = 2977 slots
+        # b: 8192 -> 16384 * 2000 // 3666 = 8938 slots
+        # c: 0 -> 16384 * 1000 // 3666 = 4469 slots
+        r = redistrib.clusternode.base_balance_plan([a, b, c], balancer)
+        r = sorted(r, key=lambda x: x[1].node_id)
+        self.assertEqual(2, len(r))
+        source, target, count = r[0]
+        self.assertEqual('a', source.node_id)
+        self.assertEqual('b', target.node_id)
+        self.assertEqual(746, count)
+        source, target, count = r[1]
+        self.assertEqual('a', source.node_id)
+        self.assertEqual('c', target.node_id)
+        self.assertEqual(4469, count)
+
+        stats[1]['keys'] = dict.fromkeys(range(8192, 16384), 0)
+        balancer = redistrib.clusternode.SlotStatsBalancer(stats)
+        self.assertEqual(1000 * 8, balancer.weight(b))
+
+        # memory is not estimated without memory_samples
+        self.assertRaises(ValueError, redistrib.clusternode.SlotStatsBalancer,
+                          stats, 'memory')
+
+    def test_slot_stats_balancer_without_memory_usage(self):
+        # masters not supporting MEMORY USAGE are weighted as average
+        a = FakeNode('a', 8192)
+        b = FakeNode('b', 4096)
+        c = FakeNode('c', 4096)
+        stats = [
+            {
+                'node': a,
+                'keys': dict.fromkeys(range(8192), 1),
+                'memory': dict.fromkeys(range(8192), 100),
+            },
+            {
+                'node': b,
+                'keys': dict.fromkeys(range(8192, 12288), 1),
+                'memory': dict.fromkeys(range(8192, 12288), 400),
+            },
+            {
+                'node': c,
+                'keys': dict.fromkeys(range(12288, 16384), 1),
+                'memory': None,
+            },
+        ]
+        balancer = redistrib.clusternode.SlotStatsBalancer(stats, 'memory')
+        self.assertEqual(2000, balancer.weight(a))
+        self.assertEqual(500, balancer.weight(b))
+        self.assertEqual(1000, balancer.weight(c))
+
+        for s in stats:
+            s['memory'] = None
+        balancer = redistrib.clusternode.SlotStatsBalancer(stats, 'memory')
+        self.assertEqual(1000, balancer.weight(a))
+        self.assertEqual(1000, balancer.weight(b))
@@ -214,6 +214,16 @@ class ApiTest(base.TestCase):
         comm.fix_migrating('127.0.0.1', 7100)
         self.assertEqual('I am in slot 0', rc.get('h-893'))
 
+        t7101.execute('cluster', 'setslot', 1, 'importing', n7100.node_id)
+        t7100.execute('cluster', 'setslot', 1, 'migrating', n7101.node_id)
+        fixed = comm.fix_cluster_migrating('127.0.0.1', 7100)
+        self.assertEqual([(n7100.node_id, n7101.node_id, 1)],
+                         [(s.node_id, d.node_id, slot)
+                          for s, d, slot in fixed])
+        self.assertEqual('I am in slot 0', rc.get('h-893'))
+        nodes = base.list_nodes('127.0.0.1', 7100)
+        self.assertEqual([0, 1], nodes[('127.0.0.1', 7101)].assigned_slots)
+
         comm.quit_cluster('127.0.0.1', 7101)
         rc.delete('h-893')
         comm.shutdown_cluster('127.0.0.1', 7100)
@@ -277,3 +287,223 @@ class ApiTest(base.TestCase):
         finally:
             n7100.close()
             n7101.close()
+
+    def test_migrate_window(self):
+        comm.create([('127.0.0.1', 7100)])
+        rc = StrictRedisCluster(
+            startup_nodes=[{
+                'host': '127.0.0.1',
+                'port': 7100
+            }],
+            decode_responses=True)
+        for i in range(200):
+            rc.set('key_%s' % i, 'value_%s' % i)
+
+        comm.join_no_load('127.0.0.1', 7100, '127.0.0.1', 7101)
+        comm.migrate_slots(
+            '127.0.0.1', 7100, '127.0.0.1', 7101, range(8192), window=8)
+
+        nodes = base.list_nodes('127.0.0.1', 7100)
+        self.assertEqual(2, len(nodes))
+        self.assertEqual(
+            list(range(8192)), nodes[('127.0.0.1', 7101)].assigned_slots)
+        self.assertEqual(
+            list(range(8192, 16384)), nodes[('127.0.0.1',
+                                             7100)].assigned_slots)
+        for i in range(200):
+            self.assertEqual('value_%s' % i, rc.get('key_%s' % i))
+
+        comm.del_node('127.0.0.1', 7101, window=4)
+        nodes = base.list_nodes('127.0.0.1', 7100)
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(
+            list(range(16384)), nodes[('127.0.0.1', 7100)].assigned_slots)
+        for i in range(200):
+            self.assertEqual('value_%s' % i, rc.get('key_%s' % i))
+
+        rc.delete(*['key_%s' % i for i in range(200)])
+        comm.shutdown_cluster('127.0.0.1', 7100)
+
+    def test_join_many(self):
+        comm.create([('127.0.0.1', 7100)])
+        rc = StrictRedisCluster(
+            startup_nodes=[{
+                'host': '127.0.0.1',
+                'port': 7100
+            }],
+            decode_responses=True)
+        for i in range(200):
+            rc.set('key_%s' % i, 'value_%s' % i)
+
+        comm.join_many('127.0.0.1', 7100, [('127.0.0.1', 7101),
+                                           ('127.0.0.1', 7102)])
+        nodes = base.list_nodes('127.0.0.1', 7100)
+        self.assertEqual(3, len(nodes))
+        self.assertEqual(
+            [5462, 5461, 5461],
+            [len(nodes[('127.0.0.1', p)].assigned_slots)
+             for p in (7100, 7101, 7102)])
+        self.assertEqual(
+            set(range(16384)),
+            set(s for n in nodes.values() for s in n.assigned_slots))
+        for i in range(200):
+            self.assertEqual('value_%s' % i, rc.get('key_%s' % i))
+
+        comm.del_node('127.0.0.1', 7101)
+        comm.del_node('127.0.0.1', 7102)
+        rc.delete(*['key_%s' % i for i in range(200)])
+        comm.shutdown_cluster('127.0.0.1', 7100)
+
+    def test_del_many(self):
+        comm.create([('127.0.0.1', 7100), ('127.0.0.1', 7101),
+                     ('127.0.0.1', 7102)])
+        rc = StrictRedisCluster(
+            startup_nodes=[{
+                'host': '127.0.0.1',
+                'port': 7100
+            }],
+            decode_responses=True)
+        for i in range(200):
+            rc.set('key_%s' % i, 'value_%s' % i)
+
+        comm.del_many([('127.0.0.1', 7101), ('127.0.0.1', 7102)])
+        nodes = base.list_nodes('127.0.0.1', 7100)
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(
+            list(range(16384)),
+            sorted(nodes[('127.0.0.1', 7100)].assigned_slots))
+        for i in range(200):
+            self.assertEqual('value_%s' % i, rc.get('key_%s' % i))
+
+        rc.delete(*['key_%s' % i for i in range(200)])
+        comm.shutdown_cluster('127.0.0.1', 7100)
+
+    def test_check(self):
+        comm.create([('127.0.0.1', 7100)])
+        comm.join_no_load('127.0.0.1', 7100, '127.0.0.1', 7101)
+
+        r = comm.check_cluster('127.0.0.1', 7100)
+        self.assertEqual(2, len(r['nodes']))
+        self.assertEqual([], r['unreachable'])
+        self.assertEqual([], r['slots_disagree'])
+        self.assertEqual([], r['open_slots'])
+        self.assertEqual([], r['uncovered_slots'])
+
+        nodes = base.list_nodes('127.0.0.1', 7100)
+        n7100 = nodes[('127.0.0.1', 7100)]
+        n7101 = nodes[('127.0.0.1', 7101)]
+        t7101 = Connection('127.0.0.1', 7101)
+        t7101.execute('cluster', 'setslot', 0, 'importing', n7100.node_id)
+
+        r = comm.check_cluster('127.0.0.1', 7100)
+        self.assertEqual(1, len(r['open_slots']))
+        node, slot, direction, node_id = r['open_slots'][0]
+        self.assertEqual(7101, node.port)
+        self.assertEqual(0, slot)
+        self.assertEqual('importing', direction)
+        self.assertEqual(n7100.node_id, node_id)
+
+        t7101.execute('cluster', 'setslot', 0, 'node', n7100.node_id)
+        t7101.close()
+        comm.quit_cluster('127.0.0.1', 7101)
+        comm.shutdown_cluster('127.0.0.1', 7100)
+        self.assertEqual(16384, len(n7100.assigned_slots))
+        self.assertEqual(0, len(n7101.assigned_slots))
+
+    def test_slot_stats(self):
+        comm.create([('127.0.0.1', 7100), ('127.0.0.1', 7101)])
+        rc = StrictRedisCluster(
+            startup_nodes=[{
+                'host': '127.0.0.1',
+                'port': 7100
+            }],
+            decode_responses=True)
+        # "h-893" is in slot 0, "{a}" in slot 15495
+        for i in range(10):
+            rc.set('%d-{h-893}' % i, 'x' * 100)
+        rc.set('x-{a}', 'y')
+
+        stats = sorted(
+            comm.slot_stats('127.0.0.1', 7100, memory_samples=4),
+            key=lambda s: s['node'].port)
+        self.assertEqual(2, len(stats))
+        self.assertEqual(8192, len(stats[0]['keys']))
+        self.assertEqual(10, stats[0]['keys'][0])
+        self.assertEqual(10, sum(stats[0]['keys'].values()))
+        self.assertEqual(1, stats[1]['keys'][15495])
+        self.assertEqual(1, sum(stats[1]['keys'].values()))
+        self.assertLess(1000, stats[0]['memory'][0])
+        self.assertEqual(0, stats[0]['memory'][1])
+        self.assertLess(0, stats[1]['memory'][15495])
+
+        stats = comm.slot_stats('127.0.0.1', 7100)
+        self.assertEqual({}, stats[0]['memory'])
+
+        rc.delete('x-{a}', *['%d-{h-893}' % i for i in range(10)])
+        comm.quit_cluster('127.0.0.1', 7101)
+        comm.shutdown_cluster('127.0.0.1', 7100)
+
+    def test_watch(self):
+        comm.create([('127.0.0.1', 7100), ('127.0.0.1', 7101)])
+        polls = [
+            sorted(r, key=lambda n: n['node'].port)
+            for r in comm.watch('127.0.0.1', 7100, interval=0.1, count=2)
+        ]
+        self.assertEqual(2, len(polls))
+        self.assertEqual([7100, 7101], [r['node'].port for r in polls[0]])
+        for r in polls[0]:
+            self.assertIsNone(r['exception'])
+            self.assertIsNone(r['ops_per_sec'])
+            self.assertLess(0, r['used_memory'])
+            self.assertEqual('ok', r['info']['cluster_state'])
+        for r in polls[1]:
+            self.assertIsNone(r['exception'])
+            self.assertLess(0, r['ops_per_sec'])
+            self.assertLess(0, r['input_per_sec'])
+
+        comm.quit_cluster('127.0.0.1', 7101)
+        comm.shutdown_cluster('127.0.0.1', 7100)
+
+    def test_exporter(self):
+        from redistrib.exporter import start_exporter
+        from six.moves.urllib.request import urlopen
+
+        def scrape(server):
+            m = urlopen('http://127.0.0.1:%d/metrics' %
+                        server.server_address[1]).read().decode('utf-8')
+            return dict(
+                line.rsplit(' ', 1) for line in m.split('\n')
+                if line and line[0] != '#')
+
+        comm.create([('127.0.0.1', 7100)])
+        server = start_exporter('127.0.0.1', 7100, listen_port=0,
+                                topology_ttl=0)
+        try:
+            metrics = scrape(server)
+            self.assertEqual('1', metrics['redistrib_cluster_nodes'
+                                          '{role="master"}'])
+            self.assertEqual('16384',
+                             metrics['redistrib_cluster_slots_covered'])
+            self.assertEqual('1', metrics['redistrib_node_up'
+                                          '{addr="127.0.0.1:7100",'
+                                          'role="master"}'])
+            slots_migrated = int(
+                metrics['redistrib_migration_slots_migrated_total'])
+
+            comm.join_cluster('127.0.0.1', 7100, '127.0.0.1', 7101)
+            metrics = scrape(server)
+            self.assertEqual('2', metrics['redistrib_cluster_nodes'
+                                          '{role="master"}'])
+            self.assertEqual('8192', metrics['redistrib_master_slots'
+                                             '{addr="127.0.0.1:7101"}'])
+            self.assertEqual(
+                slots_migrated + 8192,
+                int(metrics['redistrib_migration_slots_migrated_total']))
+            self.assertEqual('0',
+                             metrics['redistrib_migration_slots_migrating'])
+        finally:
+            server.shutdown()
+            server.collector.close()
+
+        comm.quit_cluster('127.0.0.1', 7101)
+        comm.shutdown_cluster('127.0.0.1', 7100)
@@ -0,0 +1,90 @@
+from redistrib.clusternode import ClusterNode
+from redistrib.command import _check_views
+
+import base
+
+ID_A = '2d1866134ef5fabdfae0ca9ada4ea169f0e0c3fa'
+ID_B = '1739bb3232ef733500888051203b06b704f935a5'
+ID_C = '2ec421bd92fec4823e64f963e29792803ce5c13c'
+
+
+def parse_view(*lines):
+    return [ClusterNode(*line.strip().split(' ')) for line in lines]
+
+
+def node_a(slots, myself=False, epoch=2):
+    return '%s 127.0.0.1:7100@17100 %smaster - 0 0 %d connected %s' % (
+        ID_A, 'myself,' if myself else '', epoch, slots)
+
+
+def node_b(slots, myself=False, flags='master'):
+    return '%s 127.0.0.1:7101@17101 %s%s - 0 0 1 connected %s' % (
+        ID_B, 'myself,' if myself else '', flags, slots)
+
+
+def node_c(myself=False):
+    return '%s 127.0.0.1:7102@17102 %sslave %s 0 0 2 connected' % (
+        ID_C, 'myself,' if myself else '', ID_A)
+
+
+class ClusterCheckTest(base.TestCase):
+    def test_consistent(self):
+        a, b, c = parse_view(node_a(''), node_b(''), node_c())
+        r = _check_views([
+            (a, parse_view(
+                node_a('8192-16383', True), node_b('0-8191'), node_c())),
+            (b, parse_view(
+                node_a('8192-16383'), node_b('0-8191', True), node_c())),
+            (c, parse_view(
+                node_a('8192-16383'), node_b('0-8191'), node_c(True))),
+        ])
+        self.assertEqual([], r['slots_disagree'])
+        self.assertEqual([], r['nodes_disagree'])
+        self.assertEqual([], r['open_slots'])
+        self.assertEqual([], r['uncovered_slots'])
+
+    def test_disagree(self):
+        a, b, c = parse_view(node_a(''), node_b(''), node_c())
+        r = _check_views([
+            (a,
+             parse_view(
+                 node_a('8190-16383 [8190->-%s]' % ID_B, True, epoch=3),
+                 node_b('0-8189'), node_c())),
+            (b,
+             parse_view(
+                 node_a('8192-16383'),
+                 node_b('0-8191 [8190-<-%s]' % ID_A, True))),
+            (c,
+             parse_view(
+                 node_a('8192-16383'), node_b('0-8191', flags='master,fail?'),
+                 node_c(True))),
+        ])
+        self.assertEqual([
+            (8190, 8191, {
+                ID_A: ['127.0.0.1:7100'],
+                ID_B: ['127.0.0.1:7101', '127.0.0.1:7102'],
+            }),
+        ], sorted(r['slots_disagree']))
+        self.assertEqual([
+            (ID_B, 'flags', {
+                'master': ['127.0.0.1:7100', '127.0.0.1:7101'],
+                'fail?,master': ['127.0.0.1:7102'],
+            }),
+            (ID_A, 'config_epoch', {
+                3: ['127.0.0.1:7100'],
+                2: ['127.0.0.1:7101', '127.0.0.1:7102'],
+            }),
+            (ID_C, 'unknown', ['127.0.0.1:7101']),
+        ], r['nodes_disagree'])
+        self.assertEqual([
+            (a, 8190, 'migrating', ID_B),
+            (b, 8190, 'importing', ID_A),
+        ], r['open_slots'])
+        self.assertEqual([], r['uncovered_slots'])
+
+    def test_uncovered(self):
+        a, = parse_view(node_a(''))
+        r = _check_views([(a, parse_view(node_a('1-100 200-16000', True)))])
+        self.assertEqual([], r['slots_disagree'])
+        self.assertEqual([[0, 0], [101, 199], [16001, 16383]],
+                         r['uncovered_slots'])
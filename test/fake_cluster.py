@@ -0,0 +1,690 @@
+import functools
+import io
+import json
+import threading
+import unittest
+
+import hiredis
+import redistrib.command as comm
+import six
+from redistrib.client import ClusterClient
+from redistrib.connection import Connection
+from redistrib.exceptions import RedisMigrateError
+from redistrib.exporter import ClusterCollector
+from redistrib.dump import DumpWriter, export_dump, import_dump, read_dump
+from redistrib.keyslot import count_slots, key_slot, key_slots
+from redistrib.loader import load, read_commands, read_records
+from redistrib.scan import ClusterScan, delete_pattern
+
+import base
+
+if six.PY3:
+    from benchmark.fakecluster import Error, FakeServer
+
+
+@unittest.skipIf(six.PY2, 'the fake cluster requires asyncio')
+class FakeClusterTest(base.TestCase):
+    def test_decode_replies(self):
+        with FakeServer() as server:
+            host, port = server.add_nodes(1)[0]
+            comm.start_cluster(host, port)
+            key = b'\xff\x00binary'
+            value = b'\xfe' * 300000
+            with Connection(host, port, decode_replies=False) as c:
+                self.assertEqual(b'OK', c.execute('set', key, value))
+                self.assertEqual(value, c.execute('get', key))
+                slot = c.execute('cluster', 'keyslot', key)
+                self.assertEqual([key], c.execute('cluster', 'getkeysinslot',
+                                                  slot, 10))
+                self.assertEqual([b'OK', b'OK'], c.execute_bulk(
+                    [('set', 'a', 'x' * 70000), ('set', 'b', 'y')]))
+            with Connection(host, port) as c:
+                self.assertEqual('x' * 70000, c.execute('get', 'a'))
+                self.assertEqual(['OK', 'y'], c.execute_bulk(
+                    [('set', 'c', 'z'), ('get', 'b')]))
+
+    def test_execute_stream(self):
+        with FakeServer() as server:
+            host, port = server.add_nodes(1)[0]
+            comm.start_cluster(host, port)
+            with Connection(host, port) as c:
+                replies = c.execute_stream(
+                    (('set', 'k:%d' % i, i) for i in range(10000)), 100)
+                self.assertEqual(['OK'] * 10000, list(replies))
+                self.assertEqual(10000, c.execute('dbsize'))
+
+                replies = c.execute_stream(
+                    (('get', 'k:%d' % i) for i in range(1000)), 10)
+                self.assertEqual(['0', '1'], [next(replies) for _ in '01'])
+                replies.close()
+                self.assertEqual('PONG', c.execute('ping'))
+
+                commands = [('get', 'k:%d' % i) for i in range(100)]
+                commands[50] = ('nosuchcommand', )
+                with self.assertRaises(hiredis.ReplyError):
+                    list(c.execute_stream(commands, 8))
+                self.assertEqual('PONG', c.execute('ping'))
+                replies = list(c.execute_stream(commands, 8,
+                                                raise_error=False))
+                self.assertIsInstance(replies[50], hiredis.ReplyError)
+                self.assertEqual('99', replies[99])
+
+    def test_create_without_addslotsrange(self):
+        # Redis before 7.0 rejects ADDSLOTSRANGE, with different messages
+        #   before 5.0 and since
+        for version in [(3, 0), (4, 0), (6, 2)]:
+            with FakeServer(version=version) as server:
+                addrs = server.add_nodes(3)
+                comm.create(addrs, max_slots=100)
+                for addr in addrs:
+                    with Connection(*addr) as c:
+                        with self.assertRaises(hiredis.ReplyError):
+                            c.execute('cluster', 'addslotsrange', 0, 0)
+                        self.assertEqual(('ok', 16384),
+                                         comm._cluster_status(c))
+
+    def test_exporter_deadline(self):
+        def metrics(collector):
+            return dict(
+                line.rsplit(' ', 1) for line in collector.collect().split('\n')
+                if line and line[0] != '#')
+
+        with FakeServer() as server:
+            addrs = server.add_nodes(3)
+            comm.create(addrs)
+            collector = ClusterCollector(addrs[0][0], addrs[0][1], budget=0.5,
+                                         topology_ttl=0)
+            try:
+                m = metrics(collector)
+                self.assertEqual(['1'] * 3, [
+                    v for k, v in m.items()
+                    if k.startswith('redistrib_node_up')])
+
+                # a node replying INFO too late is down in the scrape
+                slow = server.node(*addrs[2])
+                slow.latency = {'info stats': 2}
+                m = metrics(collector)
+                self.assertEqual('0', m['redistrib_node_up{addr="%s",'
+                                        'role="master"}' % slow.addr()])
+                self.assertLess(float(m['redistrib_scrape_duration_seconds']),
+                                1)
+                slow.latency = {}
+
+                # a slow topology fetch does not hold the scrape
+                for a in addrs:
+                    server.node(*a).latency = {'cluster nodes': 2}
+                m = metrics(collector)
+                self.assertLess(float(m['redistrib_scrape_duration_seconds']),
+                                1)
+                self.assertEqual('3', m['redistrib_cluster_nodes'
+                                        '{role="master"}'])
+            finally:
+                collector.close()
+
+    def test_count_keys_by_master(self):
+        with FakeServer() as server:
+            addrs = server.add_nodes(2)
+            comm.create(addrs)
+            server.populate(1000)
+            counts = count_slots(key_slots(['key:%d' % i
+                                            for i in range(1000)]))
+            masters, unassigned = comm.count_keys_by_master(
+                addrs[0][0], addrs[0][1], counts)
+            self.assertEqual(0, unassigned)
+            self.assertEqual(sorted(addrs),
+                             [(m.host, m.port) for m, _ in masters])
+            for m, n in masters:
+                self.assertEqual(server.node(m.host, m.port).cmd_dbsize(), n)
+
+    def test_slot_stats_without_memory_usage(self):
+        # the fake nodes do not support MEMORY USAGE, like Redis before 4.0
+        from click.testing import CliRunner
+        from redistrib.console import cli
+
+        with FakeServer() as server:
+            addrs = server.add_nodes(2)
+            host, port = addrs[0]
+            comm.create(addrs)
+            server.populate(1000)
+            # MEMORY USAGE is only probed once on each node
+            probes = []
+
+            def memory(node, *args):
+                probes.append(node.addr())
+                return Error('ERR unknown command \'memory\'')
+
+            for a in addrs:
+                n = server.node(*a)
+                n.cmd_memory = functools.partial(memory, n)
+            stats = comm.slot_stats(host, port, memory_samples=2)
+            self.assertEqual([None, None], [s['memory'] for s in stats])
+            self.assertEqual(sorted('%s:%d' % a for a in addrs),
+                             sorted(probes))
+            self.assertEqual(1000, sum(sum(s['keys'].values())
+                                       for s in stats))
+
+            r = CliRunner().invoke(cli, [
+                'slot-stats', '--addr', '%s:%d' % (host, port),
+                '--memory-samples', '2', '--json'])
+            self.assertEqual(0, r.exit_code, r.output)
+            lines = r.output.strip().split('\n')
+            self.assertIn('MEMORY USAGE requires Redis 4.0', lines[0])
+            result = json.loads(lines[-1])
+            self.assertEqual(1000, sum(m['keys'] for m in result['masters']))
+            self.assertEqual([None, None],
+                             [m['memory'] for m in result['masters']])
+
+    def test_cluster_client(self):
+        with FakeServer() as server:
+            addrs = server.add_nodes(3)
+            host, port = addrs[0]
+            comm.create(addrs)
+            node_a = server.node(*addrs[0])
+            keys = ['key:%d' % i for i in range(1000)]
+            with ClusterClient(host, port) as client:
+                self.assertEqual(['OK'] * 1000, client.execute_bulk(
+                    [('set', k, k) for k in keys]))
+                self.assertEqual('key:1', client.execute('get', 'key:1'))
+                self.assertEqual('PONG', client.execute('ping'))
+                self.assertEqual(keys[:100] + [None],
+                                 client.mget(keys[:100] + ['nokey']))
+                self.assertEqual(1000, client.exists(keys))
+
+                # MOVED patches the slot map of the slot only
+                slot = key_slot('key:1')
+                owner = node_a.cluster.nodes[node_a.cluster.slots[slot]]
+                other = [server.node(*a) for a in addrs
+                         if server.node(*a) is not owner][0]
+                comm.migrate_slots(owner.host, owner.port, other.host,
+                                   other.port, [slot])
+                slots = list(client.slots)
+                self.assertEqual('key:1', client.execute('get', 'key:1'))
+                self.assertEqual(1, client.moved)
+                self.assertEqual((other.host, other.port),
+                                 client.slots[slot])
+                slots[slot] = client.slots[slot]
+                self.assertEqual(slots, client.slots)
+
+                # ASK is followed for keys no longer in a migrating slot
+                with Connection(owner.host, owner.port) as c:
+                    c.execute('cluster', 'setslot', slot, 'importing',
+                              other.node_id)
+                with Connection(other.host, other.port) as c:
+                    c.execute('cluster', 'setslot', slot, 'migrating',
+                              owner.node_id)
+                    c.execute('migrate', owner.host, owner.port, 'key:1', 0,
+                              1000)
+                self.assertEqual('key:1', client.execute('get', 'key:1'))
+                self.assertEqual(1, client.ask)
+                self.assertEqual((other.host, other.port),
+                                 client.slots[slot])
+
+                self.assertEqual(1000, client.delete(keys))
+                self.assertEqual(0, sum(server.node(*a).cmd_dbsize()
+                                        for a in addrs))
+                self.assertRaises(hiredis.ReplyError, client.execute,
+                                  'nosuchcommand', 'key:1')
+
+    def test_cluster_client_moved_and_ask_to_one_node(self):
+        with FakeServer() as server:
+            addrs = server.add_nodes(2)
+            host, port = addrs[0]
+            comm.create(addrs)
+            node_a, node_b = [server.node(*a) for a in addrs]
+            tags = [t for t in ('{%d}' % i for i in range(100))
+                    if node_a.cluster.slots[key_slot(t)] == node_a.node_id]
+            moved_slot, ask_slot = key_slot(tags[0]), key_slot(tags[1])
+            keys = ['%s:%d' % (t, i) for t in tags[:2] for i in range(3000)]
+            with ClusterClient(host, port) as client:
+                comm.migrate_slots(host, port, node_b.host, node_b.port,
+                                   [moved_slot])
+                with Connection(*addrs[1]) as c:
+                    c.execute('cluster', 'setslot', ask_slot, 'importing',
+                              node_a.node_id)
+                with Connection(host, port) as c:
+                    c.execute('cluster', 'setslot', ask_slot, 'migrating',
+                              node_b.node_id)
+                # both slots redirected to B in one pass, by MOVED and ASK
+                self.assertEqual(['OK'] * 6000, client.execute_bulk(
+                    [('set', k, k) for k in keys]))
+                self.assertEqual(3000, client.moved)
+                self.assertEqual(3000, client.ask)
+                self.assertEqual(6000, node_b.cmd_dbsize())
+                self.assertEqual(keys, client.execute_bulk(
+                    [('get', k) for k in keys]))
+
+    def test_scan(self):
+        with FakeServer() as server:
+            addrs = server.add_nodes(6)
+            host, port = addrs[0]
+            comm.create(addrs[:3])
+            for m, a in zip(addrs[:3], addrs[3:]):
+                comm.replicate(m[0], m[1], *a)
+            server.populate(5000)
+            keys = set(b'key:%d' % i for i in range(5000))
+
+            s = ClusterScan(host, port, count=100, decode_keys=False)
+            self.assertEqual(keys, set(s))
+            self.assertEqual(5000, s.keys)
+            self.assertTrue(s.done())
+            self.assertEqual(set('%s:%d' % a for a in addrs[:3]),
+                             set(s.cursors))
+
+            self.assertEqual(
+                set('key:1%d' % i for i in range(10)),
+                set(ClusterScan(host, port, match='key:1?', concurrency=1)))
+            # fake replicas hold no data
+            s = ClusterScan(host, port, replicas=True)
+            self.assertEqual([], list(s))
+            self.assertEqual(set('%s:%d' % a for a in addrs[3:]),
+                             set(s.cursors))
+            self.assertEqual([], list(ClusterScan(host, port, type_='list')))
+
+            # resume from the cursors after stopping in the middle
+            cursors = {}
+            s = ClusterScan(host, port, count=10, cursors=cursors,
+                            decode_keys=False)
+            scanned = set()
+            for k in s:
+                scanned.add(k)
+                if len(scanned) == 1000:
+                    break
+            self.assertFalse(s.done())
+            cursors = json.loads(json.dumps(cursors))
+            s = ClusterScan(host, port, count=10, cursors=cursors,
+                            decode_keys=False)
+            scanned.update(s)
+            self.assertEqual(keys, scanned)
+            self.assertTrue(s.done())
+            self.assertTrue(s.keys < 4500)
+
+    def test_delete_pattern(self):
+        with FakeServer() as server:
+            addrs = server.add_nodes(3)
+            host, port = addrs[0]
+            comm.create(addrs)
+            server.populate(3000)
+            progress = []
+
+            r = delete_pattern(host, port, 'key:1*', batch=100, dry_run=True)
+            self.assertEqual(1111, r['matched'])
+            self.assertEqual(0, r['deleted'])
+            self.assertTrue(r['done'])
+
+            r = delete_pattern(host, port, 'key:1*', batch=100,
+                               progress=lambda r: progress.append(
+                                   r['deleted']))
+            self.assertEqual(1111, r['matched'])
+            self.assertEqual(1111, r['deleted'])
+            # batches of at most 100 keys on each of the 3 masters
+            self.assertTrue(12 <= len(progress) <= 14)
+            self.assertEqual(sorted(progress), progress)
+            self.assertEqual(1889, sum(
+                n['result'] for n in comm.execute(host, port, True, False,
+                                                  ['dbsize'])))
+            self.assertEqual(0, delete_pattern(host, port, 'key:1*',
+                                               rate=1000)['matched'])
+
+            r = delete_pattern(host, port, 'key:2*', batch=100, rate=5000)
+            self.assertEqual(1111, r['deleted'])
+            self.assertTrue(r['seconds'] > 0.2)
+
+            # a key moved to the importing node of a migrating slot is
+            #   scanned there, redirected back by MOVED, and then unlinked
+            #   by ASK
+            slot = key_slot('key:3')
+            node_a = server.node(*addrs[0])
+            src = node_a.cluster.nodes[node_a.cluster.slots[slot]]
+            dst = [server.node(*a) for a in addrs
+                   if server.node(*a) is not src][0]
+            with Connection(dst.host, dst.port) as c:
+                c.execute('cluster', 'setslot', slot, 'importing',
+                          src.node_id)
+            with Connection(src.host, src.port) as c:
+                c.execute('cluster', 'setslot', slot, 'migrating',
+                          dst.node_id)
+                c.execute('migrate', dst.host, dst.port, 'key:3', 0, 1000)
+            r = delete_pattern(host, port, 'key:3')
+            self.assertEqual((1, 1), (r['matched'], r['deleted']))
+            self.assertEqual(0, server.call(
+                lambda: dst.cmd_exists(b'key:3') + src.cmd_exists(b'key:3')))
+
+    def test_export_import(self):
+        f = io.BytesIO()
+        w = DumpWriter(f, chunk_size=100)
+        for i in range(30):
+            w.write(b'k%d' % i, i, b'v' * i)
+        w.close()
+        records = [(b'k%d' % i, i, b'v' * i) for i in range(30)]
+        self.assertEqual(records, list(read_dump(io.BytesIO(f.getvalue()))))
+        self.assertRaises(ValueError, list,
+                          read_dump(io.BytesIO(f.getvalue()[:-1])))
+        self.assertRaises(ValueError, list, read_dump(io.BytesIO(b'x' * 30)))
+
+        with FakeServer() as server:
+            addrs = server.add_nodes(5)
+            comm.create(addrs[:3])
+            server.populate(3000)
+            # into a cluster of another number of masters
+            comm.create(addrs[3:])
+
+            f = io.BytesIO()
+            r = export_dump(addrs[0][0], addrs[0][1], f, batch=100)
+            self.assertEqual(3000, r['keys'])
+            self.assertEqual(len(f.getvalue()), r['bytes'])
+            self.assertTrue(r['done'])
+            f.seek(0)
+            r = import_dump(addrs[3][0], addrs[3][1], f, batch=100)
+            self.assertEqual(3000, r['commands'])
+            self.assertEqual(0, r['errors'])
+            with ClusterClient(*addrs[4]) as client:
+                self.assertEqual(3000, client.exists(
+                    'key:%d' % i for i in range(3000)))
+
+            f.seek(0)
+            r = import_dump(addrs[3][0], addrs[3][1], f)
+            self.assertEqual(3000, r['errors'])
+            self.assertEqual(b'key:', r['error_samples'][0][0][:4])
+            f.seek(0)
+            r = import_dump(addrs[3][0], addrs[3][1], f, replace=True)
+            self.assertEqual(0, r['errors'])
+
+    def test_load(self):
+        self.assertEqual([['set', 'a b', '1']],
+                         list(read_commands([b'set "a b" 1\n', b'\n'])))
+        self.assertEqual([('set', b'a', b'1\t2')],
+                         list(read_records([b'a\t1\t2\r\n', b'\n'])))
+        self.assertRaises(ValueError, list, read_records([b'a\n']))
+
+        with FakeServer() as server:
+            addrs = server.add_nodes(3)
+            host, port = addrs[0]
+            comm.create(addrs)
+            node_a, node_b, node_c = [server.node(*a) for a in addrs]
+            moving = [s for s, o in enumerate(node_a.cluster.slots)
+                      if o == node_a.node_id][:100]
+
+            def commands():
+                for i in range(3000):
+                    if i == 1000:
+                        # the loader still sends keys of these slots to a
+                        comm.migrate_slots(host, port, addrs[1][0],
+                                           addrs[1][1], moving)
+                    yield ('set', 'key:%d' % i, i)
+
+            progress = []
+            result = load(host, port, commands(), chunk_size=500,
+                          progress=lambda r: progress.append(r['commands']))
+            self.assertEqual(3000, result['commands'])
+            self.assertEqual(0, result['errors'])
+            self.assertNotEqual(0, result['moved'])
+            self.assertEqual(list(range(500, 3001, 500)), progress)
+            self.assertEqual(3000, sum(n.cmd_dbsize()
+                                       for n in (node_a, node_b, node_c)))
+            # routed by the values at `key_index`, then by the slots MOVED to
+            result = load(host, port, [('set', 'key:%d' % i, 'v:%d' % i)
+                                       for i in range(100)], key_index=2)
+            self.assertEqual(0, result['errors'])
+            self.assertNotEqual(0, result['moved'])
+
+            # keys of a migrating slot not in the source are set in the target
+            slot = key_slot('key:0')
+            owner = node_a.cluster.nodes[node_a.cluster.slots[slot]]
+            other = node_c if owner is not node_c else node_b
+            with Connection(other.host, other.port) as c:
+                c.execute('cluster', 'setslot', slot, 'importing',
+                          owner.node_id)
+            with Connection(owner.host, owner.port) as c:
+                c.execute('cluster', 'setslot', slot, 'migrating',
+                          other.node_id)
+            result = load(host, port, [('set', '{key:0}x', 'x'),
+                                       ('set', 'key:0', 'y'),
+                                       ('nosuchcommand', 'key:0')])
+            self.assertEqual(1, result['ask'])
+            self.assertEqual(1, result['errors'])
+            self.assertEqual(b'x', other.data[slot][b'{key:0}x'])
+            self.assertEqual(b'y', owner.data[slot][b'key:0'])
+
+    def test_cluster_ops(self):
+        with FakeServer() as server:
+            addrs = server.add_nodes(6)
+            host, port = addrs[0]
+            comm.create(addrs[:4])
+            nodes, _ = comm.list_nodes(host, port)
+            self.assertEqual(4, len(nodes))
+            self.assertEqual(
+                comm.SLOT_COUNT, sum(len(n.assigned_slots) for n in nodes))
+
+            server.populate(1000)
+            comm.join_cluster(host, port, *addrs[4])
+            self.assertEqual(1000, sum(
+                server.node(*a).cmd_dbsize() for a in addrs[:5]))
+            self.assertNotEqual(0, server.node(*addrs[4]).cmd_dbsize())
+
+            comm.del_node(*addrs[4])
+            self.assertEqual(0, server.node(*addrs[4]).cmd_dbsize())
+            self.assertEqual(4, len(comm.list_nodes(host, port)[0]))
+
+            server.fail_node(*addrs[1])
+            comm.rescue_cluster(host, port, *addrs[5])
+            nodes = base.list_nodes(host, port)
+            self.assertEqual(5, len(nodes))
+            self.assertTrue(nodes[addrs[1]].fail)
+            self.assertEqual(comm.SLOT_COUNT, sum(
+                len(n.assigned_slots) for n in nodes.values() if not n.fail))
+
+    def test_join_many(self):
+        with FakeServer() as server:
+            addrs = server.add_nodes(5)
+            host, port = addrs[0]
+            comm.create(addrs[:2])
+            server.populate(1000)
+            migrated = comm.migration_progress['slots_migrated']
+            comm.join_many(host, port, addrs[2:])
+
+            nodes = base.list_nodes(host, port)
+            self.assertEqual(5, len(nodes))
+            slots = [len(nodes[a].assigned_slots) for a in addrs]
+            self.assertEqual(comm.SLOT_COUNT, sum(slots))
+            self.assertTrue(max(slots) - min(slots) < len(slots))
+            # each slot moved once, from one of the old nodes to a new one
+            self.assertEqual(
+                sum(slots[2:]),
+                comm.migration_progress['slots_migrated'] - migrated)
+            self.assertEqual(1000, sum(
+                server.node(*a).cmd_dbsize() for a in addrs))
+
+    def test_join_many_through_replica(self):
+        # nodes are listed from the replica given, which learns of the new
+        #   nodes later than the masters
+        with FakeServer() as server:
+            addrs = server.add_nodes(5)
+            comm.create(addrs[:2])
+            comm.replicate(addrs[0][0], addrs[0][1], *addrs[2])
+            replica = server.node(*addrs[2])
+            hidden = set(server.node(*a).node_id for a in addrs[3:])
+            nodes_of = replica.cluster_nodes
+            failure_reports_of = replica.cluster_count_failure_reports
+            replica.cluster_nodes = lambda: ''.join(
+                line for line in nodes_of().splitlines(True)
+                if line.split(' ')[0] not in hidden)
+            replica.cluster_count_failure_reports = lambda node_id: (
+                Error('ERR Unknown node %s' % node_id.decode())
+                if node_id.decode() in hidden else
+                failure_reports_of(node_id))
+            timer = threading.Timer(0.3, hidden.clear)
+            timer.start()
+            try:
+                comm.join_many(addrs[2][0], addrs[2][1], addrs[3:])
+            finally:
+                timer.cancel()
+
+            nodes = base.list_nodes(*addrs[0])
+            slots = [len(nodes[a].assigned_slots)
+                     for a in addrs[:2] + addrs[3:]]
+            self.assertEqual(comm.SLOT_COUNT, sum(slots))
+            self.assertTrue(max(slots) - min(slots) < len(slots))
+
+    def test_del_many(self):
+        with FakeServer() as server:
+            addrs = server.add_nodes(5)
+            host, port = addrs[0]
+            comm.create(addrs)
+            server.populate(1000)
+            leaving_slots = sum(
+                len(n.assigned_slots)
+                for a, n in base.list_nodes(host, port).items()
+                if a in addrs[3:])
+            migrated = comm.migration_progress['slots_migrated']
+            comm.del_many(addrs[3:])
+
+            nodes = base.list_nodes(host, port)
+            self.assertEqual(set(addrs[:3]), set(nodes))
+            slots = [len(nodes[a].assigned_slots) for a in addrs[:3]]
+            self.assertEqual(comm.SLOT_COUNT, sum(slots))
+            self.assertTrue(max(slots) - min(slots) <= 1)
+            self.assertEqual(
+                leaving_slots,
+                comm.migration_progress['slots_migrated'] - migrated)
+            self.assertEqual(1000, sum(
+                server.node(*a).cmd_dbsize() for a in addrs[:3]))
+            for a in addrs[3:]:
+                self.assertEqual(1, len(comm.list_nodes(*a)[0]))
+
+            self.assertRaises(ValueError, comm.del_many, addrs[:3])
+
+    def test_replicate_many(self):
+        with FakeServer() as server:
+            addrs = server.add_nodes(7)
+            host, port = addrs[0]
+            comm.create(addrs[:3])
+            placement = comm.replicate_many(host, port, addrs[3:], replicas=1)
+            self.assertEqual(3, len(placement))
+
+            nodes = base.list_nodes(host, port)
+            self.assertEqual(6, len(nodes))
+            self.assertEqual(
+                sorted(nodes[a].node_id for a in addrs[:3]),
+                sorted(nodes[a].master_id for a in addrs[3:6]))
+            self.assertEqual(1, len(comm.list_nodes(*addrs[6])[0]))
+
+    def test_fix_cluster_migrating(self):
+        with FakeServer() as server:
+            addrs = server.add_nodes(3)
+            host, port = addrs[0]
+            comm.create(addrs)
+            server.populate(5000)
+            nodes = base.list_nodes(host, port)
+            a, b, c = [nodes[addr] for addr in addrs]
+
+            conn_a, conn_b = a.get_conn(), b.get_conn()
+            for slot in a.assigned_slots[:100]:
+                conn_b.execute('cluster', 'setslot', slot, 'importing',
+                               a.node_id)
+                conn_a.execute('cluster', 'setslot', slot, 'migrating',
+                               b.node_id)
+            for k in conn_a.execute('cluster', 'getkeysinslot',
+                                    a.assigned_slots[0], 2):
+                conn_a.execute('migrate', b.host, b.port, k, 0, 1000)
+            for slot in a.assigned_slots[100:150]:
+                conn_a.execute('cluster', 'setslot', slot, 'migrating',
+                               c.node_id)
+            a.close()
+            b.close()
+
+            fixed = comm.fix_cluster_migrating(host, port, per_node=2)
+            self.assertEqual(150, len(fixed))
+
+            nodes = base.list_nodes(host, port)
+            for n in nodes.values():
+                self.assertFalse(n.slots_migrating)
+            self.assertEqual(set(a.assigned_slots[:100]),
+                             set(nodes[addrs[1]].assigned_slots) -
+                             set(b.assigned_slots))
+            self.assertEqual(set(a.assigned_slots[100:150]),
+                             set(nodes[addrs[2]].assigned_slots) -
+                             set(c.assigned_slots))
+            self.assertEqual(5000, sum(
+                server.node(*addr).cmd_dbsize() for addr in addrs))
+            node_a = server.node(*addrs[0])
+            for slot in a.assigned_slots[:150]:
+                self.assertEqual(0, len(node_a.data.get(slot, {})))
+            self.assertEqual([], comm.fix_cluster_migrating(host, port))
+
+    def test_migrate_busykeys_of_many_pairs(self):
+        # keys failed in each pair of a plan are all reported at the end
+
+        def put_busy_keys(server, sources, targets):
+            # a busy key in the first and the last slots having keys of each
+            #   source, in all targets
+            busy = {}
+            for n in sources:
+                slots = sorted(s for s in n.data if n.data[s])
+                for slot in (slots[0], slots[-1]):
+                    busy[slot] = sorted(n.data[slot])[0]
+
+            def put():
+                for t in targets:
+                    for slot, key in busy.items():
+                        t.data.setdefault(slot, {})[key] = b'busy'
+
+            server.call(put)
+            return busy
+
+        with FakeServer() as server:
+            addrs = server.add_nodes(3)
+            comm.create(addrs)
+            server.populate(1000)
+            nodes = [server.node(*a) for a in addrs]
+            busy = put_busy_keys(server, nodes[:1], nodes[1:])
+            with self.assertRaises(RedisMigrateError) as ctx:
+                comm.del_node(*addrs[0])
+            self.assertEqual(sorted(busy), sorted(ctx.exception.failed_keys))
+
+        with FakeServer() as server:
+            addrs = server.add_nodes(4)
+            comm.create(addrs)
+            server.populate(1000)
+            nodes = [server.node(*a) for a in addrs]
+            busy = put_busy_keys(server, nodes[:2], nodes[2:])
+            with self.assertRaises(RedisMigrateError) as ctx:
+                comm.del_many(addrs[:2])
+            failed = ctx.exception.failed_keys
+            self.assertEqual(sorted(busy), sorted(failed))
+            for slot, key in busy.items():
+                self.assertEqual([key.decode()], list(failed[slot]))
+
+    def test_migrate_busykey(self):
+        with FakeServer() as server:
+            addrs = server.add_nodes(2)
+            comm.create(addrs)
+            server.populate(1000)
+            node_a, node_b = [server.node(*a) for a in addrs]
+            slots = sorted(s for s in node_a.data if node_a.data[s])[:5]
+            busy_slot = slots[2]
+            busy_key = sorted(node_a.data[busy_slot])[0]
+
+            def put_busy_key():
+                node_b.data.setdefault(busy_slot, {})[busy_key] = b'busy'
+
+            server.call(put_busy_key)
+            with self.assertRaises(RedisMigrateError) as ctx:
+                comm.migrate_slots(addrs[0][0], addrs[0][1], addrs[1][0],
+                                   addrs[1][1], slots)
+            failed = ctx.exception.failed_keys
+            self.assertEqual([busy_slot], list(failed))
+            self.assertEqual([busy_key.decode()], list(failed[busy_slot]))
+            self.assertTrue(failed[busy_slot][busy_key.decode()].startswith(
+                'BUSYKEY'))
+            # other slots are migrated while the failed one is left open
+            self.assertEqual({busy_slot: node_b.node_id}, node_a.migrating)
+            self.assertEqual([busy_key], list(node_a.data[busy_slot]))
+            for slot in slots:
+                if slot != busy_slot:
+                    self.assertEqual(node_b.node_id,
+                                     node_a.cluster.slots[slot])
+
+            comm.fix_cluster_migrating(addrs[0][0], addrs[0][1], replace=True)
+            self.assertEqual({}, node_a.migrating)
+            self.assertEqual(node_b.node_id, node_a.cluster.slots[busy_slot])
+            self.assertEqual(b'v', node_b.data[busy_slot][busy_key])
@@ -0,0 +1,44 @@
+from redistrib.command import _info_delta, _parse_info
+
+import base
+
+INFO = '''# Stats\r
+total_connections_received:10\r
+total_commands_processed:%d\r
+instantaneous_ops_per_sec:3\r
+total_net_input_bytes:%d\r
+total_net_output_bytes:%d\r
+instantaneous_input_kbps:0.05\r
+\r
+# Memory\r
+used_memory:%d\r
+used_memory_human:1.00M\r
+'''
+
+
+class InfoTest(base.TestCase):
+    def test_parse(self):
+        info = _parse_info(INFO % (100, 2000, 30000, 1048576))
+        self.assertEqual(100, info['total_commands_processed'])
+        self.assertEqual(0.05, info['instantaneous_input_kbps'])
+        self.assertEqual('1.00M', info['used_memory_human'])
+        self.assertEqual(1048576, info['used_memory'])
+        self.assertNotIn('# Stats', info)
+
+    def test_delta(self):
+        last = _parse_info(INFO % (100, 2000, 30000, 1048576))
+        last['time'] = 10.0
+        info = _parse_info(INFO % (300, 3000, 30500, 1000000))
+        info['time'] = 12.0
+
+        r = _info_delta(last, None)
+        self.assertIsNone(r['ops_per_sec'])
+        self.assertIsNone(r['used_memory_delta'])
+        self.assertEqual(1048576, r['used_memory'])
+
+        r = _info_delta(info, last)
+        self.assertEqual(100, r['ops_per_sec'])
+        self.assertEqual(500, r['input_per_sec'])
+        self.assertEqual(250, r['output_per_sec'])
+        self.assertEqual(1000000, r['used_memory'])
+        self.assertEqual(-48576, r['used_memory_delta'])
@@ -0,0 +1,36 @@
+import unittest
+
+from redistrib.keyslot import (SLOT_COUNT, _import_numpy, count_slots,
+                               hash_tag, key_slot, key_slots)
+
+import base
+
+
+class KeySlotTest(base.TestCase):
+    def test_key_slot(self):
+        self.assertEqual(12739, key_slot(b'123456789'))
+        self.assertEqual(12739, key_slot(u'123456789'))
+        self.assertEqual(key_slot(b'user'), key_slot(b'{user}.name'))
+        self.assertNotEqual(key_slot(b'x'), key_slot(b'{}x'))
+        self.assertEqual(b'a', hash_tag(b'x{a}{b}'))
+        self.assertEqual(b'{a', hash_tag(b'{{a}'))
+        self.assertEqual(b'x{}{a}', hash_tag(b'x{}{a}'))
+        self.assertEqual(0, key_slot(b''))
+
+    def test_key_slots(self):
+        keys = [b'key:%d' % i for i in range(1000)]
+        keys += [b'', b'{key:1}x', u'\u4e2d{\u6587}', b'k' * 1000]
+        slots = key_slots(keys, use_numpy=False)
+        self.assertEqual([key_slot(k) for k in keys], slots)
+        counts = count_slots(slots)
+        self.assertEqual(SLOT_COUNT, len(counts))
+        self.assertEqual(len(keys), sum(counts))
+        self.assertEqual(2, counts[key_slot(b'key:1')])
+
+    @unittest.skipIf(_import_numpy() is None, 'numpy is not installed')
+    def test_key_slots_numpy(self):
+        keys = [b'key:%d' % i for i in range(1000)]
+        keys += [b'', b'{key:1}x', u'\u4e2d{\u6587}', b'k' * 1000, b'{}']
+        self.assertEqual(
+            key_slots(keys, use_numpy=False), key_slots(keys, use_numpy=True))
+        self.assertEqual([0, 0], key_slots([b'', b''], use_numpy=True))
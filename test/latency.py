@@ -0,0 +1,63 @@
+from redistrib import latency
+from redistrib.connection import pack_command, squash_commands
+
+import base
+
+
+class LatencyTest(base.TestCase):
+    def test_histogram(self):
+        h = latency.Histogram()
+        self.assertEqual(0, h.percentile(50))
+        for i in range(1, 101):
+            h.record(i)
+        self.assertEqual(100, h.count)
+        self.assertEqual(1, h.min)
+        self.assertEqual(100, h.max)
+        self.assertEqual(50.5, h.mean())
+        self.assertEqual(1, h.percentile(1))
+        self.assertEqual(15, h.percentile(15))
+        # 48..51 share a bucket
+        self.assertEqual(51, h.percentile(50))
+        # 96..99 share a bucket
+        self.assertEqual(99, h.percentile(99))
+        # 100..103 share a bucket, but capped by the max
+        self.assertEqual(100, h.percentile(100))
+
+        for value in [0, 15, 16, 31, 32, 1000, 123456789]:
+            index = latency._bucket_index(value)
+            self.assertLessEqual(value, latency._bucket_upper_bound(index))
+            self.assertLessEqual(
+                latency._bucket_upper_bound(index) - value, value // 16)
+
+        other = latency.Histogram()
+        other.record(100000)
+        h.merge(other)
+        self.assertEqual(101, h.count)
+        self.assertEqual(100000, h.max)
+        self.assertEqual(1, h.min)
+
+    def test_command_name(self):
+        self.assertEqual('get', latency.command_name(pack_command('GET',
+                                                                  'k')))
+        self.assertEqual('cluster nodes',
+                         latency.command_name(pack_command('cluster',
+                                                           'nodes')))
+        self.assertEqual(
+            'pipeline:migrate',
+            latency.command_name(
+                squash_commands([('migrate', 'h', 1, 'k', 0, 1000)] * 2),
+                True))
+
+    def test_stats(self):
+        stats = latency.LatencyStats()
+        stats.record('get', '127.0.0.1:7100', 0.001)
+        stats.record('get', '127.0.0.1:7101', 0.002)
+        stats.record('set', '127.0.0.1:7100', 0.003)
+        by_command = stats.by_command()
+        self.assertEqual(['get', 'set'], sorted(by_command))
+        self.assertEqual(2, by_command['get'].count)
+        self.assertEqual(3000, by_command['set'].max)
+        lines = stats.summary()
+        self.assertEqual(3, len(lines))
+        self.assertTrue(lines[1].startswith('get 2 1500 '))
+        self.assertTrue(lines[1].endswith(' 127.0.0.1:7101(2000)'))
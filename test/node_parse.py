@@ -76,3 +76,13 @@ class ApiTest(base.TestCase):
         self.assertFalse(nodes[i].slave)
         self.assertIsNone(None, nodes[i].master_id)
         self.assertFalse(nodes[i].fail)
+
+    def test_cached_property(self):
+        node = ClusterNode('0' * 40, '127.0.0.1:7000@17000', 'myself,master',
+                           '-', '0', '0', '1', 'connected', '0-9')
+        self.assertTrue(node.master)
+        self.assertIn('master', vars(node))
+        node.flags.remove('master')
+        self.assertTrue(node.master)
+        node.fail = True
+        self.assertTrue(node.fail)
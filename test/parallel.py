@@ -0,0 +1,66 @@
+import threading
+import time
+
+import six
+from redistrib.parallel import pmap, wait_until
+
+import base
+
+
+class ParallelTest(base.TestCase):
+    def test_pmap(self):
+        self.assertEqual([], pmap(lambda x: x, []))
+        self.assertEqual([1, 4, 9], pmap(lambda x: x * x, [1, 2, 3]))
+        self.assertEqual([1, 4, 9], pmap(lambda x: x * x, [1, 2, 3], 1))
+        self.assertEqual(
+            list(range(0, 200, 2)), pmap(lambda x: x * 2, range(100), 7))
+
+    def test_pmap_concurrency(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def f(x):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return x
+
+        self.assertEqual(list(range(20)), pmap(f, range(20), 4))
+        self.assertEqual(4, running[1])
+
+    def test_pmap_error(self):
+        def f(x):
+            if x == 3:
+                raise ValueError('bad %d' % x)
+            return x
+
+        six.assertRaisesRegex(self, ValueError, '^bad 3$', pmap, f,
+                              range(10), 4)
+        six.assertRaisesRegex(self, ValueError, '^bad 3$', pmap, f,
+                              range(10), 1)
+
+    def test_wait_until(self):
+        polls = {'a': 0, 'b': 0}
+
+        def check(x):
+            polls[x] += 1
+            if polls[x] < 4:
+                raise ValueError('%s not ready' % x)
+            return x
+
+        start = time.time()
+        self.assertEqual(['a', 'b'], wait_until(check, ['a', 'b'], 1))
+        self.assertEqual({'a': 4, 'b': 4}, polls)
+        # waits 5 + 10 + 20 ms before the 4th poll
+        self.assertLess(time.time() - start, 0.5)
+
+        def never(x):
+            raise ValueError('%s never ready' % x)
+
+        start = time.time()
+        six.assertRaisesRegex(self, ValueError, '^a never ready$', wait_until,
+                              never, ['a'], 0.1)
+        self.assertLess(time.time() - start, 0.5)
@@ -0,0 +1,52 @@
+from redistrib.clusternode import ClusterNode
+from redistrib.command import _place_replicas
+
+import base
+
+
+def node(index, host, master_id=None, slots='0'):
+    return ClusterNode(
+        '%040d' % index, '%s:6379@16379' % host,
+        'slave' if master_id else 'master', master_id or '-', '0', '0', '1',
+        'connected', *([] if master_id else [slots]))
+
+
+def placed(placement):
+    return sorted((addr, m.host) for addr, m in placement)
+
+
+class ReplicaPlacementTest(base.TestCase):
+    def test_spread_hosts(self):
+        masters = [node(0, 'a'), node(1, 'b'), node(2, 'c')]
+        free = [('a', 1), ('a', 2), ('b', 1), ('b', 2), ('c', 1), ('c', 2)]
+        p = _place_replicas(masters, [], free, 2)
+        self.assertEqual(6, len(p))
+        for addr, m in p:
+            self.assertNotEqual(addr[0], m.host)
+        # replicas of the same master on different hosts
+        for m in masters:
+            hosts = [addr[0] for addr, n in p if n is m]
+            self.assertEqual(2, len(set(hosts)))
+
+    def test_existing_slaves(self):
+        masters = [node(0, 'a'), node(1, 'b')]
+        slaves = [node(2, 'c', masters[0].node_id)]
+        free = [('c', 1), ('d', 1), ('d', 2)]
+        p = _place_replicas(masters, slaves, free, 1)
+        # host c already carries a slave, so d is taken
+        self.assertEqual([(('d', 1), 'b')], placed(p))
+
+        p = _place_replicas(masters, slaves, free, 2)
+        self.assertEqual([(('c', 1), 'b'), (('d', 1), 'b'), (('d', 2), 'a')],
+                         placed(p))
+
+    def test_same_host(self):
+        masters = [node(0, 'a'), node(1, 'b')]
+        p = _place_replicas(masters, [], [('a', 1), ('a', 2), ('a', 3)], 1)
+        self.assertEqual([(('a', 1), 'a'), (('a', 2), 'b')], placed(p))
+
+    def test_not_enough(self):
+        masters = [node(0, 'a'), node(1, 'b'), node(2, 'c')]
+        p = _place_replicas(masters, [], [('d', 1)], 1)
+        self.assertEqual([(('d', 1), 'a')], placed(p))
+        self.assertEqual([], _place_replicas(masters, [], [], 1))
@@ -50,6 +50,30 @@ class ReplicationTest(base.TestCase):
         comm.quit_cluster('127.0.0.1', 7102)
         comm.shutdown_cluster('127.0.0.1', 7100)
 
+    def test_replicate_many(self):
+        comm.create([('127.0.0.1', 7100)])
+        placement = comm.replicate_many(
+            '127.0.0.1', 7100, [('127.0.0.1', 7101), ('127.0.0.1', 7102)],
+            replicas=2)
+        self.assertEqual(
+            [('127.0.0.1', 7101), ('127.0.0.1', 7102)],
+            sorted(addr for addr, _ in placement))
+
+        nodes = base.list_nodes('127.0.0.1', 7100)
+        self.assertEqual(3, len(nodes))
+        master_id = nodes[('127.0.0.1', 7100)].node_id
+        for port in (7101, 7102):
+            self.assertTrue(nodes[('127.0.0.1', port)].slave)
+            self.assertEqual(master_id, nodes[('127.0.0.1', port)].master_id)
+
+        self.assertEqual([],
+                         comm.replicate_many('127.0.0.1', 7100, [],
+                                             replicas=2))
+
+        comm.quit_cluster('127.0.0.1', 7101)
+        comm.quit_cluster('127.0.0.1', 7102)
+        comm.shutdown_cluster('127.0.0.1', 7100)
+
     def test_quit_problems(self):
         comm.start_cluster('127.0.0.1', 7100)
         comm.join_cluster('127.0.0.1', 7100, '127.0.0.1', 7101)
@@ -0,0 +1,16 @@
+import subprocess
+import sys
+
+import base
+
+LAZY_MODULES = ('json', 'retrying', 'werkzeug')
+
+
+class StartupTest(base.TestCase):
+    def test_lazy_imports(self):
+        out = subprocess.check_output([
+            sys.executable, '-c', 'import sys, redistrib.console; '
+            'print(" ".join(m for m in %r if m in sys.modules))' %
+            (LAZY_MODULES, )
+        ])
+        self.assertEqual(b'', out.strip())
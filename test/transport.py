@@ -0,0 +1,89 @@
+import os
+import socket
+import tempfile
+import threading
+
+from redistrib.connection import Connection, Transport, is_local_host
+
+import base
+
+
+def serve_pong(server):
+    conn = server.accept()[0]
+    try:
+        while conn.recv(1024):
+            conn.sendall(b'+PONG\r\n')
+    finally:
+        conn.close()
+
+
+class TransportTest(base.TestCase):
+    def start_server(self, server):
+        server.listen(1)
+        t = threading.Thread(target=serve_pong, args=(server, ))
+        t.daemon = True
+        t.start()
+        return t
+
+    def test_unix_socket(self):
+        path = os.path.join(tempfile.mkdtemp(), 'redis-7999.sock')
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        t = self.start_server(server)
+        try:
+            transport = Transport(
+                unix_socket=os.path.join(os.path.dirname(path),
+                                         'redis-{port}.sock'))
+            self.assertEqual(path, transport.unix_socket_path('127.0.0.1',
+                                                              7999))
+            self.assertIsNone(transport.unix_socket_path('192.0.2.1', 7999))
+            self.assertEqual({'192.0.2.1'}, transport.tcp_hosts)
+            with Connection('127.0.0.1', 7999, transport=transport) as c:
+                self.assertEqual(socket.AF_UNIX, c.sock.family)
+                self.assertEqual('PONG', c.execute('ping'))
+            t.join()
+        finally:
+            server.close()
+            os.remove(path)
+
+    def test_local_hosts(self):
+        # nodes announce addresses of the interfaces of their machines
+        self.assertTrue(is_local_host('127.0.0.1'))
+        self.assertFalse(is_local_host('192.0.2.1'))
+        self.assertFalse(is_local_host('no.such.host.invalid'))
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            server.connect(('192.0.2.1', 7))
+            host = server.getsockname()[0]
+        except IOError:
+            host = None
+        finally:
+            server.close()
+        if host is not None and host != '0.0.0.0':
+            self.assertTrue(is_local_host(host))
+            self.assertEqual(
+                '/var/run/redis/%s-7000.sock' % host,
+                Transport('/var/run/redis/{host}-{port}.sock')
+                .unix_socket_path(host, 7000))
+
+    def test_tcp_options(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        port = server.getsockname()[1]
+        t = self.start_server(server)
+        try:
+            transport = Transport(
+                nodelay=True, keepalive=True, sndbuf=1 << 16, rcvbuf=1 << 16)
+            with Connection('127.0.0.1', port, transport=transport) as c:
+                self.assertEqual(socket.AF_INET, c.sock.family)
+                self.assertTrue(
+                    c.sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+                self.assertTrue(
+                    c.sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+                self.assertTrue(
+                    c.sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) >=
+                    1 << 16)
+                self.assertEqual('PONG', c.execute('ping'))
+            t.join()
+        finally:
+            server.close()